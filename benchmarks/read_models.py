@@ -0,0 +1,81 @@
+"""Compare ORM entity loading with the projection read models.
+
+Use:  python -m benchmarks.read_models [--rows 20000] [--repeat 5]
+Builds a throwaway SQLite database, then times the farmers list both ways
+and records the peak memory held while the rows are alive.
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from lib.db.models import init_db, Activity, Farmer
+
+
+def build(path: Path, rows: int):
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Activity), [{"id": i, "name": f"Activity {i}"} for i in range(1, 21)])
+        conn.execute(
+            insert(Farmer),
+            [
+                {"name": f"Farmer {i}", "national_id": f"ID{i:08d}", "activity_id": i % 20 + 1}
+                for i in range(1, rows + 1)
+            ],
+        )
+    return sessionmaker(bind=engine, future=True)
+
+
+def orm_path(session):
+    return [(f.id, f.name, f.national_id, f.activity.name if f.activity else "") for f in Farmer.get_all(session)]
+
+
+def projection_path(session):
+    return Farmer.list_view(session)
+
+
+def measure(Session, fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        session = Session()
+        start = time.perf_counter()
+        fn(session)
+        best = min(best, time.perf_counter() - start)
+        session.close()
+
+    session = Session()
+    tracemalloc.start()
+    result = fn(session)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    session.close()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Session = build(Path(tmp) / "bench.db", args.rows)
+        orm_time, orm_peak = measure(Session, orm_path, args.repeat)
+        proj_time, proj_peak = measure(Session, projection_path, args.repeat)
+
+    print(f"rows: {args.rows}")
+    print(f"{'path':<12}{'best (ms)':>12}{'peak KiB':>12}{'bytes/row':>12}")
+    for name, t, peak in (("orm", orm_time, orm_peak), ("projection", proj_time, proj_peak)):
+        print(f"{name:<12}{t * 1000:>12.1f}{peak / 1024:>12.0f}{peak / args.rows:>12.0f}")
+    print(f"speedup: {orm_time / proj_time:.1f}x  memory: {orm_peak / proj_peak:.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
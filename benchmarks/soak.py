@@ -0,0 +1,293 @@
+"""Soak test: several clerks writing to the same SQLite file at once.
+
+Use:  python -m benchmarks.soak [--workers 8] [--mode thread|process] [--duration 30]
+                                [--db PATH] [--busy-timeout 5] [--journal-mode delete|wal]
+                                [--begin deferred|immediate] [--seed 1]
+
+Each worker opens its own engine and session (like a separate clerk's CLI)
+and runs a weighted mix of Sale.create, safe_add_membership,
+FarmerActivity.update_progress, list screens and sale deletes for the given
+duration.  "database is locked" errors are rolled back and retried with
+backoff; an operation that still fails after --retries is counted as failed.
+
+The report shows throughput, latency percentiles per operation, lock retries
+and failures, then checks the file for integrity violations: duplicate
+memberships, orphan sales and farmer activities, sales a worker committed
+that are missing (lost writes) and sales summaries that drifted from the
+sales table.  Without --db a seeded throwaway database is used; with --db
+the file is copied first, never modified.
+"""
+
+import argparse
+import multiprocessing
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from lib.db.database import sqlite_transactions
+from lib.db.models import (
+    init_db, Activity, Buyer, Cooperative, Farmer, FarmerActivity, Membership, ProductType, Sale, SalesSummary,
+)
+from lib.helpers import safe_add_membership
+
+MIX = (("sale", 50), ("membership", 15), ("progress", 15), ("list", 15), ("delete", 5))
+PERCENTILES = (50, 95, 99)
+
+
+def build(path: Path, farmers: int = 200):
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Activity), [{"id": i, "name": f"Activity {i}"} for i in range(1, 11)])
+        conn.execute(insert(Buyer), [{"id": i, "name": f"Buyer {i}"} for i in range(1, 51)])
+        conn.execute(insert(ProductType), [{"id": i, "name": f"Product {i}"} for i in range(1, 11)])
+        conn.execute(insert(Cooperative), [{"id": i, "name": f"Cooperative {i}"} for i in range(1, 21)])
+        conn.execute(insert(Farmer), [
+            {"id": i, "name": f"Farmer {i}", "national_id": f"ID{i:08d}", "activity_id": i % 10 + 1}
+            for i in range(1, farmers + 1)
+        ])
+        conn.execute(insert(FarmerActivity), [
+            {"farmer_id": i, "activity_id": i % 10 + 1} for i in range(1, farmers + 1)
+        ])
+    engine.dispose()
+
+
+def make_engine(path: Path, busy_timeout: float, journal_mode: str, begin: str):
+    engine = create_engine(f"sqlite:///{path}", future=True, connect_args={"timeout": busy_timeout})
+
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"PRAGMA journal_mode={journal_mode}")
+        if begin == "immediate":
+            # Let SQLAlchemy emit BEGIN itself instead of pysqlite.
+            dbapi_connection.isolation_level = None
+
+    if begin == "immediate":
+        @event.listens_for(engine, "begin")
+        def _begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        return engine
+    return sqlite_transactions(engine)
+
+
+def _is_locked(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and "locked" in str(exc.orig)
+
+
+class Clerk:
+    def __init__(self, worker: int, args):
+        self.rng = random.Random(args.seed * 1000 + worker)
+        self.engine = make_engine(args.path, args.busy_timeout, args.journal_mode, args.begin)
+        self.session = sessionmaker(bind=self.engine, future=True)()
+        self.retries = args.retries
+        self.ids = {}
+        with self.engine.connect() as conn:
+            for model in (Farmer, Buyer, ProductType, Cooperative, FarmerActivity):
+                self.ids[model] = conn.execute(select(model.id)).scalars().all()
+        self.created = []
+        self.deleted = set()
+        self.latencies = defaultdict(list)
+        self.lock_retries = 0
+        self.failed = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def _pick(self, model):
+        return self.session.get(model, self.rng.choice(self.ids[model]))
+
+    def sale(self):
+        sale = Sale.create(self.session, self._pick(Farmer), self._pick(Buyer), self._pick(ProductType),
+                           quantity=self.rng.randint(1, 50), price=round(self.rng.uniform(1, 100), 2))
+        self.created.append(sale.id)
+
+    def membership(self):
+        safe_add_membership(self.session, self._pick(Farmer), self._pick(Cooperative))
+
+    def progress(self):
+        self._pick(FarmerActivity).update_progress(self.session, self.rng.uniform(0, 100))
+
+    def list(self):
+        Farmer.list_rows(self.session)
+        Sale.page(self.session, limit=20)
+        self.session.commit()
+
+    def delete(self):
+        live = [s for s in self.created[-200:] if s not in self.deleted]
+        if not live:
+            return self.sale()
+        sale_id = self.rng.choice(live)
+        sale = self.session.get(Sale, sale_id)
+        if sale is not None:
+            sale.delete(self.session)
+        self.deleted.add(sale_id)
+
+    def run(self, duration: float):
+        names, weights = zip(*MIX)
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            op = self.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            for attempt in range(self.retries + 1):
+                try:
+                    getattr(self, op)()
+                    self.latencies[op].append(time.perf_counter() - started)
+                    break
+                except Exception as exc:
+                    self.session.rollback()
+                    if _is_locked(exc) and attempt < self.retries:
+                        self.lock_retries += 1
+                        time.sleep(self.rng.uniform(0.001, 0.01) * 2 ** attempt)
+                        continue
+                    self.failed[op] += 1
+                    self.errors[f"{type(exc).__name__}: {str(getattr(exc, 'orig', exc))[:60]}"] += 1
+                    break
+        self.session.close()
+        self.engine.dispose()
+        return {
+            "latencies": dict(self.latencies),
+            "lock_retries": self.lock_retries,
+            "failed": dict(self.failed),
+            "errors": dict(self.errors),
+            "created": self.created,
+            "deleted": sorted(self.deleted),
+        }
+
+
+def _work(worker: int, args):
+    return Clerk(worker, args).run(args.duration)
+
+
+def run_workers(args):
+    if args.mode == "process":
+        with multiprocessing.Pool(args.workers) as pool:
+            return pool.starmap(_work, [(w, args) for w in range(args.workers)])
+    results = [None] * args.workers
+
+    def target(w):
+        results[w] = _work(w, args)
+
+    threads = [threading.Thread(target=target, args=(w,)) for w in range(args.workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+def check_integrity(path: Path, created, deleted) -> dict:
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    with engine.connect() as conn:
+        duplicate_memberships = conn.execute(
+            select(func.count()).select_from(
+                select(Membership.farmer_id).group_by(Membership.farmer_id, Membership.cooperative_id)
+                .having(func.count() > 1).subquery()
+            )
+        ).scalar()
+        orphan_sales = conn.execute(
+            select(func.count()).select_from(Sale)
+            .where(~Sale.farmer_id.in_(select(Farmer.id)) | ~Sale.buyer_id.in_(select(Buyer.id)))
+        ).scalar()
+        orphan_activities = conn.execute(
+            select(func.count()).select_from(FarmerActivity)
+            .where(~FarmerActivity.farmer_id.in_(select(Farmer.id)))
+        ).scalar()
+        present = set(conn.execute(select(Sale.id)).scalars())
+        lost = len(set(created) - set(deleted) - present)
+        actual = dict(conn.execute(
+            select(Sale.farmer_id, func.sum(Sale.quantity * Sale.price)).group_by(Sale.farmer_id)
+        ).all())
+        summarised = dict(conn.execute(
+            select(SalesSummary.key, SalesSummary.revenue)
+            .where(SalesSummary.dimension == "farmer", SalesSummary.counterpart == 0)
+        ).all())
+        drift = sum(1 for k, v in summarised.items() if abs(actual.get(k, 0.0) - v) > 1e-6)
+    engine.dispose()
+    return {
+        "duplicate memberships": duplicate_memberships,
+        "orphan sales": orphan_sales,
+        "orphan farmer activities": orphan_activities,
+        "lost sales": lost,
+        "drifted farmer summaries": drift,
+    }
+
+
+def report(args, results, elapsed: float) -> int:
+    latencies = defaultdict(list)
+    failed = defaultdict(int)
+    errors = defaultdict(int)
+    created, deleted = [], []
+    for r in results:
+        for op, values in r["latencies"].items():
+            latencies[op].extend(values)
+        for op, n in r["failed"].items():
+            failed[op] += n
+        for e, n in r["errors"].items():
+            errors[e] += n
+        created.extend(r["created"])
+        deleted.extend(r["deleted"])
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.workers} {args.mode} workers, {elapsed:.1f}s, journal_mode={args.journal_mode}, "
+          f"begin={args.begin}, busy_timeout={args.busy_timeout}s")
+    print(f"throughput: {total / elapsed:.1f} ops/s ({total} ok, {sum(failed.values())} failed)")
+    print(f"lock retries: {sum(r['lock_retries'] for r in results)}")
+    header = "".join(f"{f'p{p} (ms)':>11}" for p in PERCENTILES)
+    print(f"{'operation':<12}{'ok':>8}{'failed':>8}{header}{'max (ms)':>11}")
+    for op, _ in MIX:
+        values = sorted(latencies.get(op, []))
+        cells = "".join(f"{percentile(values, p) * 1000:>11.1f}" for p in PERCENTILES)
+        print(f"{op:<12}{len(values):>8}{failed.get(op, 0):>8}{cells}{(values[-1] if values else 0) * 1000:>11.1f}")
+    for e, n in sorted(errors.items(), key=lambda kv: -kv[1]):
+        print(f"  {n} x {e}")
+
+    violations = check_integrity(args.path, created, deleted)
+    print("integrity:")
+    for name, n in violations.items():
+        print(f"  {name:<26}{n:>6}{'' if n == 0 else '  <-- VIOLATION'}")
+    return sum(violations.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--db", help="copy this database instead of seeding a fresh one")
+    parser.add_argument("--busy-timeout", type=float, default=5.0, help="sqlite3 connect timeout in seconds")
+    parser.add_argument("--journal-mode", choices=("delete", "wal"), default="delete")
+    parser.add_argument("--begin", choices=("deferred", "immediate"), default="deferred")
+    parser.add_argument("--retries", type=int, default=5, help="lock retries before an operation counts as failed")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args.path = Path(tmp) / "soak.db"
+        if args.db:
+            shutil.copyfile(args.db, args.path)
+            engine = create_engine(f"sqlite:///{args.path}", future=True)
+            init_db(engine)
+            engine.dispose()
+        else:
+            build(args.path)
+        started = time.perf_counter()
+        results = run_workers(args)
+        violations = report(args, results, time.perf_counter() - started)
+    raise SystemExit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Per-call cost of statements built inline versus the prebuilt ones.
+
+Use:  python -m benchmarks.statement_cache [--calls 5000] [--repeat 5]
+Builds a throwaway SQLite database, then times each hot lookup the way it
+used to be written (a select or Query built per call) against the current
+model method, and prints the engine's compiled-cache statistics.  Lookups
+by id use a fresh session per pass, and the database gets one farmer per
+call (at least FARMERS), so every call misses the identity map.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from lib.db import statement_cache
+from lib.db.database import COMPILED_CACHE_SIZE
+from lib.db.models import init_db, Activity, Cooperative, Farmer, FarmerActivity, Membership
+
+FARMERS = 2000
+
+
+def build(path: Path, farmers: int = FARMERS):
+    engine = create_engine(f"sqlite:///{path}", future=True, query_cache_size=COMPILED_CACHE_SIZE)
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Activity), [{"id": i, "name": f"Activity {i}"} for i in range(1, 21)])
+        conn.execute(insert(Cooperative), [{"id": i, "name": f"Coop {i}"} for i in range(1, 11)])
+        conn.execute(insert(Farmer), [
+            {"id": i, "name": f"Farmer {i}", "national_id": f"ID{i:08d}", "activity_id": i % 20 + 1}
+            for i in range(1, farmers + 1)
+        ])
+        conn.execute(insert(FarmerActivity), [
+            {"farmer_id": i, "activity_id": (i + k) % 20 + 1} for i in range(1, farmers + 1) for k in range(3)
+        ])
+        conn.execute(insert(Membership), [{"farmer_id": i, "cooperative_id": i % 10 + 1} for i in range(1, farmers + 1)])
+    return engine, sessionmaker(bind=engine, future=True)
+
+
+CASES = [
+    ("find_by_id",
+     lambda s, i: s.get(Farmer, i),
+     lambda s, i: Farmer.find_by_id(s, i)),
+    ("list_for_farmer",
+     lambda s, i: s.query(FarmerActivity).filter(FarmerActivity.farmer_id == i).all(),
+     lambda s, i: FarmerActivity.list_for_farmer(s, i)),
+    ("membership check",
+     lambda s, i: s.query(Membership).filter_by(farmer_id=i, cooperative_id=i % 10 + 1).first(),
+     lambda s, i: Membership.find(s, i, i % 10 + 1)),
+]
+
+
+def measure(Session, fn, calls: int, repeat: int) -> float:
+    """Best per-call time in microseconds; call ``n`` looks up farmer ``n + 1``."""
+    best = float("inf")
+    for _ in range(repeat):
+        session = Session()
+        start = time.perf_counter()
+        for n in range(calls):
+            fn(session, n + 1)
+        best = min(best, time.perf_counter() - start)
+        session.close()
+    return best / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=FARMERS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    calls = args.calls
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, Session = build(Path(tmp) / "bench.db", max(calls, FARMERS))
+        print(f"calls: {calls}")
+        print(f"{'lookup':<18}{'inline (us)':>12}{'cached (us)':>12}{'saved':>8}")
+        for name, inline, cached in CASES:
+            measure(Session, cached, 50, 1)   # compile once outside the timing
+            before = measure(Session, inline, calls, args.repeat)
+            after = measure(Session, cached, calls, args.repeat)
+            print(f"{name:<18}{before:>12.1f}{after:>12.1f}{1 - after / before:>8.0%}")
+        print("compiled cache:", ", ".join(f"{k}={v}" for k, v in statement_cache.stats(engine).items()))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
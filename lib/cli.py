@@ -1,13 +1,23 @@
 """Simple menu-driven CLI. Entry: python -m lib.cli"""
 
-from datetime import date
+import argparse
+import os
+import socket
+import time
+from datetime import date, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
 from lib.helpers import (
     with_session,
     print_table,
     input_nonempty,
     input_int,
     input_float,
+    input_optional_float,
     input_date,
+    input_choice,
+    input_pick,
+    set_action_hook,
     safe_add_membership,
 )
 from lib.db.models import (
@@ -21,6 +31,33 @@ from lib.db.models import (
     Cooperative,
     Membership,
 )
+from lib.db import analytics, backfill, bulk_update, in_memory, ingest, journal, sales_search, sharding, summaries, sync
+from lib.db.database import DB_PATH, engine
+from lib.db.membership_graph import graph_for
+
+SALES_PAGE_SIZE = 20
+
+def show_sales_history(session, dimension, key, counterpart_label, to_row, headers, **filters):
+    summary = summaries.summary(session, dimension, key)
+    session.commit()  # keep a summary computed on first view
+    print(f"Sales: {summary.sale_count}  Revenue: {summary.revenue:,.2f}  "
+          f"First: {summary.first_date or '-'}  Last: {summary.last_date or '-'}")
+    if summary.top:
+        print(f"Top {counterpart_label}s:")
+        print_table([(name or "-", n, f"{rev:,.2f}") for _, name, n, rev in summary.top],
+                    [counterpart_label, "sales", "revenue"])
+    before = None
+    while True:
+        page = Sale.page(session, before_id=before, limit=SALES_PAGE_SIZE, **filters)
+        if not page:
+            if before is None:
+                print_table([], headers)
+            break
+        print_table([to_row(s) for s in page], headers)
+        before = page[-1].id
+        if len(page) < SALES_PAGE_SIZE or input("n = next page, Enter = done: ").strip().lower() != "n":
+            break
+
 def main_menu():
     print("\n=== Smart Farm CLI ===")
     print("1) Activities")
@@ -30,6 +67,7 @@ def main_menu():
     print("5) Sales")
     print("6) Dashboard (Farmer ↔ Activity)")
     print("7) Cooperatives & Memberships")
+    print("8) Analytics")
     print("0) Exit")
 
 @with_session()
@@ -41,7 +79,7 @@ def activities_menu(session):
         print("3) View Activity (by id)")
         print("4) Delete Activity")
         print("0) Back")
-        choice = input("> ").strip()
+        choice = input_choice("activities")
 
         if choice == "1":
             name = input_nonempty("Name: ")
@@ -60,8 +98,7 @@ def activities_menu(session):
                 print("Error creating activity:", e)
 
         elif choice == "2":
-            rows = [(a.id, a.name, a.start_date, a.end_date) for a in Activity.get_all(session)]
-            print_table(rows, ["id", "name", "start", "end"])
+            print_table(Activity.list_rows(session), ["id", "name", "start", "end"])
 
         elif choice == "3":
             id_ = input_int("Activity id: ")
@@ -97,7 +134,7 @@ def farmers_menu(session):
         print("4) Find Farmer by name")
         print("5) Delete Farmer")
         print("0) Back")
-        c = input("> ").strip()
+        c = input_choice("farmers")
 
         if c == "1":
             name = input_nonempty("Name: ")
@@ -105,9 +142,7 @@ def farmers_menu(session):
             national_id = input_nonempty("National ID: ")
             phone = input("Phone: ").strip() or None
             email = input("Email: ").strip() or None
-            rows = [(a.id, a.name) for a in Activity.get_all(session)]
-            print_table(rows, ["ID", "Activity"])
-            activity_id = input("Activity id (optional): ").strip() or None
+            activity_id = input_pick(session, "activities", "Activity (optional)")
 
             kwargs = dict(
                 name=name,
@@ -116,8 +151,8 @@ def farmers_menu(session):
                 phone=phone,
                 email=email,
             )
-            if activity_id.isdigit():
-                kwargs["activity_id"] = int(activity_id)
+            if activity_id is not None:
+                kwargs["activity_id"] = activity_id
             try:
                 f = Farmer.create(session, **kwargs)
                 print("Created farmer", f.id)
@@ -125,21 +160,28 @@ def farmers_menu(session):
                 print("Error:", e)
 
         elif c == "2":
-            rows = [(f.id, f.name, f.national_id, f.activity.name if f.activity else "") for f in Farmer.get_all(session)]
+            rows = [(fid, name, nat_id, activity or "") for fid, name, nat_id, activity in Farmer.list_rows(session)]
             print_table(rows, ["id", "name", "nat_id", "activity"])
 
         elif c == "3":
             id_ = input_int("Farmer id: ")
-            f = Farmer.find_by_id(session, id_)
+            f = Farmer.find_with_links(session, id_)
             if not f:
                 print("Not found")
             else:
-                print(f"{f.id} - {f.name} ({f.farm_name})\nContact: {f.phone} / {f.email}\nSales:")
-                rows = [
-                    (s.id, s.buyer.name if s.buyer else "-", s.product_type.name if s.product_type else "-", s.quantity, s.price, s.created_at)
-                    for s in f.sales
-                ]
-                print_table(rows, ["id", "buyer", "product", "qty", "price", "date"])
+                print(f"{f.id} - {f.name} ({f.farm_name})\nContact: {f.phone} / {f.email}")
+                coops = [(m.cooperative.name if m.cooperative else "-", m.role, m.joined_on) for m in f.memberships]
+                if coops:
+                    print_table(coops, ["cooperative", "role", "joined"])
+                acts = [(fa.activity.name if fa.activity else "-", fa.role, fa.progress_percent) for fa in f.farmer_activities]
+                if acts:
+                    print_table(acts, ["activity", "role", "progress %"])
+                show_sales_history(
+                    session, "farmer", f.id, "buyer",
+                    lambda s: (s.id, s.buyer or "-", s.product or "-", s.quantity, s.price, s.created_at),
+                    ["id", "buyer", "product", "qty", "price", "date"],
+                    farmer_id=f.id,
+                )
 
         elif c == "4":
             q = input_nonempty("Search name: ")
@@ -169,7 +211,7 @@ def buyers_menu(session):
         print("3) View Buyer")
         print("4) Delete Buyer")
         print("0) Back")
-        c = input("> ").strip()
+        c = input_choice("buyers")
         if c == "1":
             name = input_nonempty("Name: ")
             org = input("Organization: ").strip() or None
@@ -179,20 +221,20 @@ def buyers_menu(session):
             b = Buyer.create(session, name=name, organization=org, contact_phone=phone, contact_email=email, address=addr)
             print("Created buyer", b.id)
         elif c == "2":
-            rows = [(b.id, b.name, b.organization) for b in Buyer.get_all(session)]
-            print_table(rows, ["id", "name", "org"])
+            print_table(Buyer.list_view(session), ["id", "name", "org"])
         elif c == "3":
             id_ = input_int("Buyer id: ")
-            b = Buyer.find_by_id(session, id_)
+            b = Buyer.detail_view(session, id_)
             if not b:
                 print("Not found")
             else:
-                print(f"{b.id} - {b.name}\nSales:")
-                rows = [
-                    (s.id, s.farmer.name if s.farmer else "-", s.product_type.name if s.product_type else "-", s.quantity, s.price, s.created_at)
-                    for s in b.sales
-                ]
-                print_table(rows, ["id", "farmer", "product", "qty", "price", "date"])
+                print(f"{b.id} - {b.name}")
+                show_sales_history(
+                    session, "buyer", b.id, "farmer",
+                    lambda s: (s.id, s.farmer or "-", s.product or "-", s.quantity, s.price, s.created_at),
+                    ["id", "farmer", "product", "qty", "price", "date"],
+                    buyer_id=b.id,
+                )
         elif c == "4":
             id_ = input_int("Buyer id to delete: ")
             b = Buyer.find_by_id(session, id_)
@@ -216,7 +258,7 @@ def products_menu(session):
         print("3) View Product Type")
         print("4) Delete Product Type")
         print("0) Back")
-        c = input("> ").strip()
+        c = input_choice("products")
         if c == "1":
             name = input_nonempty("Name: ")
             cat = input("Category: ").strip() or None
@@ -225,20 +267,20 @@ def products_menu(session):
             p = ProductType.create(session, name=name, category=cat, typical_unit=unit, description=desc)
             print("Created", p.id)
         elif c == "2":
-            rows = [(p.id, p.name, p.category, p.typical_unit) for p in ProductType.get_all(session)]
-            print_table(rows, ["id", "name", "category", "unit"])
+            print_table(ProductType.list_rows(session), ["id", "name", "category", "unit"])
         elif c == "3":
             id_ = input_int("Product id: ")
-            p = ProductType.find_by_id(session, id_)
+            p = ProductType.detail_view(session, id_)
             if not p:
                 print("Not found")
             else:
-                print(f"{p.id} - {p.name}\n{p.description}\nSales:")
-                rows = [
-                    (s.id, s.farmer.name if s.farmer else "-", s.buyer.name if s.buyer else "-", s.quantity, s.price, s.created_at)
-                    for s in p.sales
-                ]
-                print_table(rows, ["id", "farmer", "buyer", "qty", "price", "date"])
+                print(f"{p.id} - {p.name}\n{p.description}")
+                show_sales_history(
+                    session, "product_type", p.id, "farmer",
+                    lambda s: (s.id, s.farmer or "-", s.buyer or "-", s.quantity, s.price, s.created_at),
+                    ["id", "farmer", "buyer", "qty", "price", "date"],
+                    product_type_id=p.id,
+                )
         elif c == "4":
             id_ = input_int("Product id to delete: ")
             p = ProductType.find_by_id(session, id_)
@@ -253,6 +295,34 @@ def products_menu(session):
         else:
             print("Invalid option")
 
+def search_sales(session):
+    print("Leave any criterion blank to skip it.")
+    f = sales_search.SalesFilter(
+        farmer_id=input_pick(session, "farmers", "Farmer"),
+        buyer_id=input_pick(session, "buyers", "Buyer"),
+        product_type_id=input_pick(session, "product_types", "Product"),
+        cooperative_id=input_pick(session, "cooperatives", "Cooperative"),
+        date_from=input_date("From date (YYYY-MM-DD): "),
+        date_to=input_date("To date (YYYY-MM-DD): "),
+        min_quantity=input_optional_float("Min quantity: "),
+        max_quantity=input_optional_float("Max quantity: "),
+        min_price=input_optional_float("Min price: "),
+        max_price=input_optional_float("Max price: "),
+    )
+    after = None
+    while True:
+        page = sales_search.search(session, f, after=after)
+        print("Query plan:")
+        for line in page.plan:
+            print("  " + line)
+        print_table(
+            [(r.id, r.farmer or "-", r.buyer or "-", r.product or "-", r.quantity, r.price, r.created_at) for r in page.rows],
+            ["id", "farmer", "buyer", "product", "qty", "price", "date"],
+        )
+        after = page.after
+        if after is None or input("n = next page, Enter = done: ").strip().lower() != "n":
+            break
+
 @with_session()
 def sales_menu(session):
     while True:
@@ -261,8 +331,9 @@ def sales_menu(session):
         print("2) List Sales")
         print("3) View Sale")
         print("4) Delete Sale")
+        print("5) Search Sales")
         print("0) Back")
-        c = input("> ").strip()
+        c = input_choice("sales")
         if c == "1":
             farmer_id = input_int("Farmer id: ")
             buyer_id = input_int("Buyer id: ")
@@ -279,17 +350,17 @@ def sales_menu(session):
                 print("Created sale", s.id)
         elif c == "2":
             rows = [
-                (s.id, s.farmer.name if s.farmer else "-", s.buyer.name if s.buyer else "-", s.product_type.name if s.product_type else "-", s.quantity, s.price, s.created_at)
-                for s in Sale.get_all(session)
+                (r.id, r.farmer or "-", r.buyer or "-", r.product or "-", r.quantity, r.price, r.created_at)
+                for r in Sale.list_view(session)
             ]
             print_table(rows, ["id", "farmer", "buyer", "product", "qty", "price", "date"])
         elif c == "3":
             id_ = input_int("Sale id: ")
-            s = Sale.find_by_id(session, id_)
+            s = Sale.detail_view(session, id_)
             if not s:
                 print("Not found")
             else:
-                print(f"Sale {s.id}: Farmer={s.farmer.name if s.farmer else 'N/A'} Buyer={s.buyer.name if s.buyer else 'N/A'} Product={s.product_type.name if s.product_type else 'N/A'} Qty={s.quantity} Price={s.price} Date={s.created_at}")
+                print(f"Sale {s.id}: Farmer={s.farmer or 'N/A'} Buyer={s.buyer or 'N/A'} Product={s.product or 'N/A'} Qty={s.quantity} Price={s.price} Date={s.created_at}")
         elif c == "4":
             id_ = input_int("Sale id to delete: ")
             s = Sale.find_by_id(session, id_)
@@ -299,6 +370,8 @@ def sales_menu(session):
                 if input("Confirm delete (y/N): ").lower() == "y":
                     s.delete(session)
                     print("Deleted")
+        elif c == "5":
+            search_sales(session)
         elif c == "0":
             break
         else:
@@ -311,21 +384,18 @@ def dashboard_menu(session):
         print("1) List FarmerActivities")
         print("2) Link Farmer to Activity")
         print("3) Unlink Farmer from Activity")
+        print("4) Activities Running This Week")
+        print("5) Activities Active on a Date")
         print("0) Back")
-        choice = input("> ").strip()
+        choice = input_choice("dashboard")
 
         if choice == "1":
-            rows = [(fa.id, fa.farmer.name, fa.activity.name) for fa in session.query(FarmerActivity).all()]
-            print_table(rows, ["ID", "Farmer", "Activity"])
+            print_table(FarmerActivity.list_view(session), ["ID", "Farmer", "Activity"])
         elif choice == "2":
-            print("Farmers:")
-            print_table([(f.id, f.name) for f in Farmer.get_all(session)], ["ID", "Name"])
-            print("Activities:")
-            print_table([(a.id, a.name) for a in Activity.get_all(session)], ["ID", "Name"])
-            fid = input_int("Farmer ID: ")
-            aid = input_int("Activity ID: ")
-            farmer = Farmer.find_by_id(session, fid)
-            activity = Activity.find_by_id(session, aid)
+            fid = input_pick(session, "farmers", "Farmer")
+            aid = input_pick(session, "activities", "Activity") if fid is not None else None
+            farmer = Farmer.find_by_id(session, fid) if fid is not None else None
+            activity = Activity.find_by_id(session, aid) if aid is not None else None
             if not farmer or not activity:
                 print("Invalid farmer or activity ID")
             else:
@@ -342,6 +412,19 @@ def dashboard_menu(session):
                 session.delete(fa)
                 session.commit()
                 print("Link removed")
+        elif choice == "4":
+            today = date.today()
+            start = today - timedelta(days=today.weekday())
+            end = start + timedelta(days=6)
+            print(f"Week {start} – {end}:")
+            print_table(Activity.overlapping(session, start, end), ["ID", "Activity", "Start", "End"])
+            print_table(FarmerActivity.running_between(session, start, end),
+                        ["Farmer ID", "Farmer", "Activity", "Start", "End", "Role", "Progress %"])
+        elif choice == "5":
+            day = input_date("Date (YYYY-MM-DD, blank = today): ") or date.today()
+            print_table(Activity.active_on(session, day), ["ID", "Activity", "Start", "End"])
+            print_table(FarmerActivity.running_between(session, day, day),
+                        ["Farmer ID", "Farmer", "Activity", "Start", "End", "Role", "Progress %"])
         elif choice == "0":
             break
         else:
@@ -356,12 +439,14 @@ def cooperative_menu(session):
         print("3) Link Farmer to Cooperative")
         print("4) List Memberships")
         print("5) Remove Membership")
+        print("6) Farmers Sharing Cooperatives")
+        print("7) Overlapping Cooperatives")
+        print("8) Membership Network Summary")
         print("0) Back")
-        choice = input("> ").strip()
+        choice = input_choice("cooperatives")
 
         if choice == "1":
-            rows = [(c.id, c.name) for c in session.query(Cooperative).order_by(Cooperative.id).all()]
-            print_table(rows, ["ID", "Cooperative"])
+            print_table(Cooperative.list_view(session), ["ID", "Cooperative"])
 
         elif choice == "2":
             name = input_nonempty("Cooperative name: ")
@@ -376,17 +461,11 @@ def cooperative_menu(session):
                 print(f"Created cooperative {name}")
 
         elif choice == "3":
-            print("Farmers:")
-            print_table([(f.id, f.name) for f in Farmer.get_all(session)], ["ID", "Name"])
-            print("Cooperatives:")
-            rows = [(c.id, c.name) for c in session.query(Cooperative).order_by(Cooperative.id).all()]
-            print_table(rows, ["ID", "Name"])
-
-            fid = input_int("Farmer ID: ")
-            cid = input_int("Cooperative ID: ")
+            fid = input_pick(session, "farmers", "Farmer")
+            cid = input_pick(session, "cooperatives", "Cooperative") if fid is not None else None
 
-            farmer = Farmer.find_by_id(session, fid)
-            coop = session.get(Cooperative, cid)
+            farmer = Farmer.find_by_id(session, fid) if fid is not None else None
+            coop = session.get(Cooperative, cid) if cid is not None else None
 
             if not farmer or not coop:
                 print("Invalid IDs")
@@ -396,7 +475,7 @@ def cooperative_menu(session):
                 m, created = safe_add_membership(session, farmer, coop, role=role)
             except Exception as exc:
                 session.rollback()
-                existing = session.query(Membership).filter_by(farmer_id=farmer.id, cooperative_id=coop.id).first()
+                existing = Membership.find(session, farmer.id, coop.id)
                 if existing:
                     print(f"{farmer.name} is already a member of {coop.name} (role: {existing.role}).")
                 else:
@@ -417,12 +496,10 @@ def cooperative_menu(session):
                 print(f"{farmer.name} is already a member of {coop.name} (role: {m.role}, joined: {m.joined_on}).")
 
         elif choice == "4":
-            memberships = session.query(Membership).order_by(Membership.cooperative_id, Membership.farmer_id).all()
-            rows = []
-            for idx, m in enumerate(memberships, start=1):
-                coop_name = m.cooperative.name if m.cooperative else "-"
-                farmer_name = m.farmer.name if m.farmer else "-"
-                rows.append((idx, m.cooperative_id, m.farmer_id, farmer_name, coop_name, m.role, m.joined_on))
+            rows = [
+                (idx, cid, fid, farmer_name or "-", coop_name or "-", role, joined_on)
+                for idx, (cid, fid, farmer_name, coop_name, role, joined_on) in enumerate(Membership.list_rows(session), start=1)
+            ]
             print_table(rows, ["#", "Coop ID", "Farmer ID", "Farmer", "Cooperative", "Role", "Joined On"])
 
         elif choice == "5":
@@ -433,23 +510,27 @@ def cooperative_menu(session):
             if sub == "1":
                 fid = input_int("Farmer ID: ")
                 cid = input_int("Cooperative ID: ")
-                m = session.query(Membership).filter_by(farmer_id=fid, cooperative_id=cid).first()
+                m = Membership.find(session, fid, cid)
                 if not m:
                     print("Membership not found for those keys.")
                     continue
             else:
-                memberships = session.query(Membership).order_by(Membership.cooperative_id, Membership.farmer_id).all()
+                memberships = Membership.list_rows(session)
                 if not memberships:
                     print("(no memberships found)")
                     continue
-                rows = [(idx+1, m.cooperative_id, m.farmer_id, m.farmer.name if m.farmer else "-", m.cooperative.name if m.cooperative else "-", m.role)
-                        for idx, m in enumerate(memberships)]
+                rows = [(idx+1, cid, fid, farmer_name or "-", coop_name or "-", role)
+                        for idx, (cid, fid, farmer_name, coop_name, role, _) in enumerate(memberships)]
                 print_table(rows, ["#", "Coop ID", "Farmer ID", "Farmer", "Cooperative", "Role"])
                 choice_idx = input_int("Choose # to delete: ")
                 if choice_idx < 1 or choice_idx > len(memberships):
                     print("Invalid selection")
                     continue
-                m = memberships[choice_idx - 1]
+                cid, fid = memberships[choice_idx - 1][:2]
+                m = session.get(Membership, (cid, fid))
+                if not m:
+                    print("Membership not found for those keys.")
+                    continue
             confirm = input(f"Confirm remove membership Farmer {m.farmer_id} <-> Coop {m.cooperative_id}? (y/N): ").strip().lower()
             if confirm == "y":
                 try:
@@ -462,37 +543,359 @@ def cooperative_menu(session):
             else:
                 print("Cancelled")
 
+        elif choice == "6":
+            fid = input_int("Farmer ID: ")
+            min_shared = input_int("Minimum shared cooperatives: ")
+            shared = graph_for(session).co_members(fid, min_shared=min_shared)
+            top = sorted(shared.items(), key=lambda kv: (-kv[1], kv[0]))[:50]
+            names = dict(session.execute(select(Farmer.id, Farmer.name).where(Farmer.id.in_([f for f, _ in top]))).all())
+            print_table([(f, names.get(f, "-"), n) for f, n in top], ["Farmer ID", "Farmer", "Shared"])
+            if len(shared) > len(top):
+                print(f"({len(shared) - len(top)} more not shown)")
+
+        elif choice == "7":
+            cid = input_int("Cooperative ID: ")
+            min_shared = input_int("Minimum shared members: ")
+            overlap = graph_for(session).overlapping_cooperatives(cid, min_shared=min_shared)
+            names = dict(session.execute(select(Cooperative.id, Cooperative.name).where(Cooperative.id.in_(list(overlap)))).all())
+            rows = sorted(((c, names.get(c, "-"), n) for c, n in overlap.items()), key=lambda r: (-r[2], r[0]))
+            print_table(rows, ["Coop ID", "Cooperative", "Shared members"])
+
+        elif choice == "8":
+            graph = graph_for(session)
+            components = graph.connected_components()
+            stats = graph.stats()
+            print(f"Memberships: {stats['edges']}")
+            print(f"Connected farmer groups: {len(components)}")
+            rows = [(i, len(c)) for i, c in enumerate(components[:10], start=1)]
+            print_table(rows, ["Group", "Farmers"])
+
         elif choice == "0":
             break
         else:
             print("Invalid option")
 
-def main():
-    init_db()  
-
+@with_session()
+def analytics_menu(session, exact=False):
+    mode = "exact (SQL)" if exact else "approximate (sketches)"
     while True:
-        main_menu()
-        choice = input("> ").strip()
+        print(f"\n-- Analytics [{mode}] --")
+        print("1) Distinct buyers for a farmer")
+        print("2) Median price for a product this quarter")
+        print("3) p95 quantity per sale")
+        print("4) Rebuild sketches from sales")
+        print("5) Rebuild sales summaries")
+        print("0) Back")
+        choice = input_choice("analytics")
+
         if choice == "1":
-            activities_menu()
+            fid = input_int("Farmer id: ")
+            started = time.perf_counter()
+            result = analytics.distinct_buyers(session, fid, exact=exact)
+            print(f"Distinct buyers: {result}  [{(time.perf_counter() - started) * 1000:.1f} ms]")
         elif choice == "2":
-            farmers_menu()
+            pid = input_int("Product id: ")
+            started = time.perf_counter()
+            result = analytics.price_quantile(session, pid, 0.5, analytics.quarter_periods(date.today()), exact=exact)
+            print(f"Median price this quarter: {result}  [{(time.perf_counter() - started) * 1000:.1f} ms]")
         elif choice == "3":
-            buyers_menu()
+            started = time.perf_counter()
+            result = analytics.quantity_quantile(session, 0.95, exact=exact)
+            print(f"p95 quantity: {result}  [{(time.perf_counter() - started) * 1000:.1f} ms]")
         elif choice == "4":
-            products_menu()
+            count = analytics.rebuild(session)
+            print(f"Rebuilt sketches from {count} sales")
         elif choice == "5":
-            sales_menu()
-        elif choice == "6":
-            dashboard_menu()
-        elif choice == "7":
-            cooperative_menu()
+            count = summaries.rebuild(session)
+            print(f"Rebuilt {count} sales summaries")
         elif choice == "0":
-            print("Goodbye")
             break
         else:
             print("Invalid option")
 
+@with_session()
+def run_journal_compact(session, upto=None):
+    removed = journal.compact(session, upto=upto)
+    print(f"Removed {removed} journal entries; last sequence number is {journal.last_seq(session)}")
+
+@with_session()
+def run_sync(session, args):
+    started = time.perf_counter()
+    if args.sync_command == "export":
+        counts = sync.export_delta(session, args.out, peer=args.peer, office=args.office)
+        print_table(sorted(counts.items()), ["table", "rows"])
+        print(f"Wrote {sum(counts.values())} changes to {args.out} in {time.perf_counter() - started:.2f}s")
+    else:
+        report = sync.apply_delta(session, args.path, office=args.office)
+        tables = sorted(set(report.applied) | set(report.skipped))
+        print_table([(t, report.applied.get(t, 0), report.skipped.get(t, 0)) for t in tables],
+                    ["table", "applied", "kept local"])
+        for key, error in report.errors:
+            print(f"  failed {key}: {error}")
+        print(f"Applied {sum(report.applied.values())} changes in {time.perf_counter() - started:.2f}s")
+
+def format_ingest_stats(snap):
+    lag = f"{snap['lag_bytes']} B" if snap["lag_bytes"] is not None else "-"
+    event_lag = f"{snap['lag_seconds']} s" if snap["lag_seconds"] is not None else "-"
+    return (f"read {snap['read']}  committed {snap['committed']}  dup {snap['duplicates']}  "
+            f"rejected {snap['rejected']}  {snap['rows_per_sec']} rows/s  queue {snap['queue_depth']}  "
+            f"lag {lag} / {event_lag}")
+
+@with_session()
+def run_ingest(session, args):
+    stats = ingest.IngestStats()
+    try:
+        ingest.ingest(
+            session, args.path, follow=args.follow, max_rows=args.max_rows, max_latency_ms=args.max_latency_ms,
+            queue_size=args.queue_size, stats=stats, stats_interval=args.stats_interval,
+            on_stats=lambda snap: print(format_ingest_stats(snap)),
+            on_error=lambda line, exc: print(f"  rejected: {exc} :: {line[:120]}"),
+        )
+    except KeyboardInterrupt:
+        print("Stopped; uncommitted events will be read again on the next run")
+    print(format_ingest_stats(stats.snapshot()))
+
+@with_session()
+def run_bulk_update(session, args):
+    started = time.perf_counter()
+    report = bulk_update.bulk_update(
+        session, args.kind, bulk_update.read_rows(args.path), chunk_size=args.chunk,
+        on_chunk=lambda r: print(f"  read {r.read}  matched {r.matched}  changed {r.changed}"),
+    )
+    print_table([(report.read, report.matched, report.unmatched, report.changed, len(report.rejected))],
+                ["read", "matched", "unmatched", "changed", "rejected"])
+    if report.superseded:
+        print(f"{report.superseded} rows were superseded by a later row for the same key")
+    for line, error in report.rejected[:20]:
+        print(f"  line {line}: {error}")
+    if report.unmatched_lines:
+        shown = ", ".join(str(n) for n in report.unmatched_lines[:20])
+        print(f"  no matching row for line{'s' if report.unmatched > 1 else ''} {shown}"
+              f"{' ...' if report.unmatched > 20 else ''}")
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+
+def run_shard(args):
+    if args.shard_command == "split":
+        shard_map = sharding.load_shard_map(args.map) if args.map else None
+        started = time.perf_counter()
+        counts = sharding.split(DB_PATH, args.out, shard_map, default_shard=args.default_shard)
+        print_table([(name, c["farmers"], c["sales"]) for name, c in sorted(counts.items())],
+                    ["shard", "farmers", "sales"])
+        print(f"Split {DB_PATH.name} into {len(counts)} shards under {args.out} in {time.perf_counter() - started:.2f}s")
+        return
+    router = sharding.ShardRouter(args.dir)
+    try:
+        if args.shard_command == "report":
+            print_table(sharding.sales_by_shard(router), ["shard", "farmers", "sales", "revenue"])
+            print_table(sharding.revenue_by_product(router), ["product", "sales", "revenue"])
+        elif args.shard_command == "locate":
+            print(f"Farmer {args.farmer} is on shard {router.shard_for_farmer(args.farmer)}")
+    finally:
+        router.dispose()
+
+def run_backfill(args):
+    if args.backfill_command == "status":
+        print_table([(r["name"], r["table_name"], f"{r['last_key']}/{r['max_key']}", r["rows_updated"], r["repaired"],
+                      r["finished_at"] or "-", r["verified_at"] or "-") for r in backfill.status(engine)],
+                    ["backfill", "table", "key", "updated", "repaired", "finished", "verified"])
+        return
+    try:
+        report = backfill.run(
+            engine, backfill.BACKFILLS[args.name], batch_size=args.batch_size, duty_cycle=args.duty_cycle,
+            restart=args.restart,
+            on_batch=lambda key, high, rows: print(f"  key {key}/{high}  updated {rows}"),
+        )
+    except KeyboardInterrupt:
+        print("Stopped; run again to resume from the last committed batch")
+        return
+    if report.resumed_from is not None:
+        print(f"Resumed after key {report.resumed_from}")
+    print(f"{report.name}: {report.rows_updated} rows updated in {report.batches} batches, "
+          f"{report.repaired} repaired on verify, {report.seconds:.2f}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lib.cli", description="Smart Farm CLI")
+    parser.add_argument("--exact", action="store_true", help="answer analytics from SQL instead of sketches")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="DIR",
+                        help="profile each menu action with cProfile/tracemalloc into DIR (default: profiles)")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="load the database into RAM for this session (read-only unless --write-back)")
+    parser.add_argument("--write-back", action="store_true",
+                        help="with --in-memory: allow writes and save them to the database file on exit")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="record latency histograms and counters, rewriting PATH in Prometheus text format")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="record metrics and serve them on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-interval", type=float, default=15, metavar="SECONDS",
+                        help="how often --metrics-file is rewritten (default: 15)")
+    sub = parser.add_subparsers(dest="command")
+    report = sub.add_parser("profile-report", help="summarise a --profile session")
+    report.add_argument("path", nargs="?", help="session directory (default: latest under profiles/)")
+    compact = sub.add_parser("journal-compact", help="trim change-journal entries all consumers have processed")
+    compact.add_argument("--upto", type=int, help="trim entries up to this sequence number instead")
+    sync_p = sub.add_parser("sync", help="exchange delta files with other office databases")
+    sync_p.add_argument("--office", default=os.environ.get("SMART_FARM_OFFICE") or socket.gethostname(),
+                        help="name of this office (default: $SMART_FARM_OFFICE or host name)")
+    sync_sub = sync_p.add_subparsers(dest="sync_command", required=True)
+    sync_export = sync_sub.add_parser("export", help="write changes not yet sent to PEER")
+    sync_export.add_argument("--peer", required=True)
+    sync_export.add_argument("--out", required=True, help="delta file to write (.jsonl.gz)")
+    sync_apply = sync_sub.add_parser("apply", help="apply a delta file from another office")
+    sync_apply.add_argument("path")
+    ingest_p = sub.add_parser("ingest", help="turn payment events (JSON lines) from a spool file or pipe into sales")
+    ingest_p.add_argument("path")
+    ingest_p.add_argument("--follow", action="store_true", help="keep tailing the file for new events")
+    ingest_p.add_argument("--max-rows", type=int, default=500, help="commit after this many sales")
+    ingest_p.add_argument("--max-latency-ms", type=float, default=200, help="or once the oldest is this old")
+    ingest_p.add_argument("--queue-size", type=int, default=10000, help="lines buffered before the reader waits")
+    ingest_p.add_argument("--stats-interval", type=float, default=10, help="seconds between progress lines")
+    bulk_p = sub.add_parser("bulk-update", help="apply progress readings or membership roles from CSV or JSON lines")
+    bulk_p.add_argument("kind", choices=sorted(bulk_update.KINDS),
+                        help="progress: farmer_id, activity_id, progress[, notes]; "
+                             "roles: cooperative_id, farmer_id, role")
+    bulk_p.add_argument("path", help=".csv with a header row, otherwise JSON lines")
+    bulk_p.add_argument("--chunk", type=int, default=bulk_update.CHUNK, help="rows per transaction")
+    shard_p = sub.add_parser("shard", help="split the database into per-cooperative shards and query them")
+    shard_sub = shard_p.add_subparsers(dest="shard_command", required=True)
+    shard_split = shard_sub.add_parser("split", help="copy this database into a catalog plus one file per shard")
+    shard_split.add_argument("--out", required=True, help="directory for catalog.db and shard-*.db")
+    shard_split.add_argument("--map", help="JSON file mapping cooperative ids or names to shard (region) names")
+    shard_split.add_argument("--default-shard", default="unassigned", help="shard for farmers with no cooperative")
+    shard_report = shard_sub.add_parser("report", help="farmers, sales and revenue across all shards")
+    shard_report.add_argument("dir")
+    shard_locate = shard_sub.add_parser("locate", help="show which shard holds a farmer")
+    shard_locate.add_argument("dir")
+    shard_locate.add_argument("--farmer", type=int, required=True)
+    backfill_p = sub.add_parser("backfill", help="show or resume the online backfills run by migrations")
+    backfill_sub = backfill_p.add_subparsers(dest="backfill_command", required=True)
+    backfill_sub.add_parser("status", help="checkpoint and verification state of every backfill")
+    backfill_run = backfill_sub.add_parser("run", help="resume a backfill from its checkpoint, then verify it")
+    backfill_run.add_argument("name", choices=sorted(backfill.BACKFILLS))
+    backfill_run.add_argument("--batch-size", type=int, default=backfill.BATCH_SIZE, help="rows per transaction")
+    backfill_run.add_argument("--duty-cycle", type=float, default=backfill.DUTY_CYCLE,
+                              help="share of wall time spent writing, 0-1 (default: %(default)s)")
+    backfill_run.add_argument("--restart", action="store_true", help="discard the checkpoint and start over")
+    args = parser.parse_args(argv)
+    if args.write_back and not args.in_memory:
+        parser.error("--write-back requires --in-memory")
+    return args
+
+MENUS = {
+    "1": activities_menu,
+    "2": farmers_menu,
+    "3": buyers_menu,
+    "4": products_menu,
+    "5": sales_menu,
+    "6": dashboard_menu,
+    "7": cooperative_menu,
+}
+
+def run_menus(args):
+    while True:
+        main_menu()
+        choice = input_choice("main")
+        if choice == "0":
+            print("Goodbye")
+            break
+        try:
+            if choice in MENUS:
+                MENUS[choice]()
+            elif choice == "8":
+                analytics_menu(exact=args.exact)
+            else:
+                print("Invalid option")
+        except OperationalError as exc:
+            if not in_memory.is_read_only_error(exc):
+                raise
+            print("This in-memory session is read-only; restart with --write-back to make changes")
+
+def start_metrics(args):
+    """Install lib.db.metrics and its exporters if asked to; returns their close callbacks."""
+    if not (args.metrics_file or args.metrics_port):
+        return []
+    from lib.db import metrics
+    metrics.install()
+    closers = []
+    if args.metrics_file:
+        exporter = metrics.FileExporter(args.metrics_file, interval=args.metrics_interval)
+        exporter.start()
+        closers.append(exporter.close)
+    if args.metrics_port:
+        server = metrics.serve(args.metrics_port)
+        print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        closers.append(server.shutdown)
+    return closers
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "profile-report":
+        from lib.profiling import report
+        report(args.path)
+        return
+
+    closers = start_metrics(args)
+    try:
+        run_command(args)
+    finally:
+        for close in closers:
+            close()
+
+def run_command(args):
+    init_db()
+
+    if args.command == "journal-compact":
+        run_journal_compact(upto=args.upto)
+        return
+    if args.command == "sync":
+        run_sync(args)
+        return
+    if args.command == "ingest":
+        run_ingest(args)
+        return
+    if args.command == "bulk-update":
+        run_bulk_update(args)
+        return
+    if args.command == "shard":
+        run_shard(args)
+        return
+    if args.command == "backfill":
+        run_backfill(args)
+        return
+
+    db = in_memory.InMemoryDatabase(write_back=args.write_back).load() if args.in_memory else None
+    try:
+        run_interactive(args)
+    finally:
+        if db is not None:
+            db.close()
+
+def run_interactive(args):
+    watchers = []
+    if args.profile:
+        from lib.profiling import ActionProfiler
+        watchers.append(ActionProfiler(args.profile))
+    if args.metrics_file or args.metrics_port:
+        from lib.db.metrics import ActionTimer
+        watchers.append(ActionTimer())
+    if not watchers:
+        run_menus(args)
+        return
+
+    def on_choice(menu, choice):
+        for w in watchers:
+            w.on_choice(menu, choice)
+
+    for w in watchers:
+        w.start()
+    set_action_hook(on_choice)
+    try:
+        run_menus(args)
+    finally:
+        set_action_hook(None)
+        # Both watchers wrap builtins.input; unwrap in reverse order.
+        for w in reversed(watchers):
+            w.close()
+
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,6 @@
 from .database import engine, SessionLocal
+from .batch import batch
+from .query_cache import query_cache
+from . import analytics, journal, lookups, statement_cache, summaries
 
-__all__ = ["engine", "SessionLocal"]
+__all__ = ["engine", "SessionLocal", "batch", "query_cache", "analytics", "journal", "lookups", "statement_cache", "summaries"]
@@ -0,0 +1,221 @@
+"""Approximate dashboard numbers from per-period sales sketches.
+
+Every flushed ``Sale`` updates these sketches (month bucket and the ``*``
+all-time bucket) in the same transaction:
+
+    farmer       / buyers_hll    distinct buyers per farmer      (HyperLogLog)
+    product_type / price_kll     price distribution per product  (KLL)
+    all          / quantity_kll  quantity distribution per sale  (KLL)
+
+A query reads at most a handful of small sketch rows, whatever the size of
+``sales``.  Pass ``exact=True`` to answer from SQL instead.  Deleted sales
+are not subtracted from sketches; run ``rebuild`` after bulk deletes.
+"""
+
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import bindparam, delete, event, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from .models import Sale, SalesSketch
+from .sketches import HyperLogLog, KLL
+
+ALL_TIME = "*"
+
+_SPECS = (
+    ("farmer", "buyers_hll", "farmer_id", "buyer_id", HyperLogLog),
+    ("product_type", "price_kll", "product_type_id", "price", KLL),
+    ("all", "quantity_kll", None, "quantity", KLL),
+)
+_FACTORY = {metric: factory for _, metric, _, _, factory in _SPECS}
+
+
+class Estimate(NamedTuple):
+    value: Optional[float]
+    error: Optional[str]
+
+    def __str__(self):
+        if self.value is None:
+            return "n/a"
+        text = f"{self.value:,}" if isinstance(self.value, int) else f"{self.value:,.2f}"
+        return text + (f" ({self.error})" if self.error else " (exact)")
+
+
+def month_of(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def quarter_periods(day: date) -> List[str]:
+    first = 3 * ((day.month - 1) // 3) + 1
+    return [f"{day.year:04d}-{m:02d}" for m in range(first, first + 3)]
+
+
+def _period_bounds(periods: Sequence[str]):
+    start = min(periods)
+    end = max(periods)
+    year, month = int(end[:4]), int(end[5:7])
+    end_exclusive = date(year + month // 12, month % 12 + 1, 1)
+    return date(int(start[:4]), int(start[5:7]), 1), end_exclusive
+
+
+# Built once: record_sales runs on every flush that adds sales.
+_t = SalesSketch.__table__
+_LOAD = select(_t.c.dimension, _t.c.key, _t.c.period, _t.c.metric, _t.c.data).where(
+    tuple_(_t.c.dimension, _t.c.key, _t.c.period, _t.c.metric).in_(bindparam("idents", expanding=True))
+)
+_INSERT = insert(_t)
+_UPDATE = (
+    update(_t)
+    .where(_t.c.dimension == bindparam("b_dimension"))
+    .where(_t.c.key == bindparam("b_key"))
+    .where(_t.c.period == bindparam("b_period"))
+    .where(_t.c.metric == bindparam("b_metric"))
+    .values(data=bindparam("data"), count=_t.c.count + bindparam("added"))
+)
+
+
+def record_sales(connection, sales: Iterable[dict]):
+    """Fold sale rows (dicts with the Sale column names) into the sketch table."""
+    grouped = defaultdict(list)
+    for s in sales:
+        month = month_of(s.get("created_at") or date.today())
+        for dimension, metric, key_col, value_col, _ in _SPECS:
+            key = s.get(key_col) if key_col else 0
+            value = s.get(value_col)
+            if key is None or value is None:
+                continue
+            grouped[(dimension, key, month, metric)].append(value)
+            grouped[(dimension, key, ALL_TIME, metric)].append(value)
+    if not grouped:
+        return
+
+    existing = {}
+    idents = list(grouped)
+    for i in range(0, len(idents), 500):
+        rows = connection.execute(_LOAD, {"idents": idents[i:i + 500]})
+        for d, k, p, m, data in rows:
+            existing[(d, k, p, m)] = data
+
+    inserts, updates = [], []
+    for (dimension, key, period, metric), values in grouped.items():
+        factory = _FACTORY[metric]
+        data = existing.get((dimension, key, period, metric))
+        sketch = factory.from_bytes(data) if data is not None else factory()
+        sketch.update(values)
+        row = {"dimension": dimension, "key": key, "period": period, "metric": metric, "data": sketch.to_bytes()}
+        if data is None:
+            row["count"] = len(values)
+            inserts.append(row)
+        else:
+            row["added"] = len(values)
+            updates.append(row)
+
+    if inserts:
+        connection.execute(_INSERT, inserts)
+    if updates:
+        connection.execute(
+            _UPDATE,
+            [
+                {"b_dimension": r["dimension"], "b_key": r["key"], "b_period": r["period"],
+                 "b_metric": r["metric"], "data": r["data"], "added": r["added"]}
+                for r in updates
+            ],
+        )
+
+
+@event.listens_for(Session, "after_flush")
+def _record_new_sales(session, flush_context):
+    sales = [
+        {
+            "farmer_id": o.farmer_id,
+            "buyer_id": o.buyer_id,
+            "product_type_id": o.product_type_id,
+            "quantity": o.quantity,
+            "price": o.price,
+            "created_at": o.created_at,
+        }
+        for o in session.new
+        if isinstance(o, Sale)
+    ]
+    if sales:
+        record_sales(session.connection(), sales)
+
+
+def rebuild(session: Session, chunk: int = 10000) -> int:
+    """Recompute every sketch from ``sales``.  Returns the number of sales read."""
+    conn = session.connection()
+    conn.execute(delete(SalesSketch.__table__))
+    cols = (Sale.id, Sale.farmer_id, Sale.buyer_id, Sale.product_type_id, Sale.quantity, Sale.price, Sale.created_at)
+    last_id, total = 0, 0
+    while True:
+        rows = conn.execute(select(*cols).where(Sale.id > last_id).order_by(Sale.id).limit(chunk)).mappings().all()
+        if not rows:
+            break
+        record_sales(conn, rows)
+        last_id = rows[-1]["id"]
+        total += len(rows)
+    session.commit()
+    return total
+
+
+def _load(session: Session, dimension: str, key: int, periods: Sequence[str], metric: str):
+    t = SalesSketch.__table__
+    rows = session.execute(
+        select(t.c.data)
+        .where(t.c.dimension == dimension, t.c.key == key, t.c.metric == metric)
+        .where(t.c.period.in_(list(periods)))
+    ).scalars()
+    factory = _FACTORY[metric]
+    merged = None
+    for data in rows:
+        sketch = factory.from_bytes(data)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged
+
+
+def _sales_filter(stmt, periods: Sequence[str]):
+    if list(periods) == [ALL_TIME]:
+        return stmt
+    start, end = _period_bounds(periods)
+    return stmt.where(Sale.created_at >= start, Sale.created_at < end)
+
+
+def _exact_quantile(session: Session, column, q: float, where, periods) -> Optional[float]:
+    n = session.execute(_sales_filter(select(func.count()).select_from(Sale).where(*where), periods)).scalar()
+    if not n:
+        return None
+    stmt = select(column).where(*where).order_by(column).limit(1).offset(int(q * (n - 1)))
+    return session.execute(_sales_filter(stmt, periods)).scalar()
+
+
+def distinct_buyers(session: Session, farmer_id: int, periods: Sequence[str] = (ALL_TIME,),
+                    exact: bool = False) -> Estimate:
+    sketch = None if exact else _load(session, "farmer", farmer_id, periods, "buyers_hll")
+    if sketch is None:
+        # No sketch yet (e.g. sales older than the sketch tables): count them.
+        stmt = select(func.count(func.distinct(Sale.buyer_id))).where(Sale.farmer_id == farmer_id)
+        return Estimate(session.execute(_sales_filter(stmt, periods)).scalar(), None)
+    return Estimate(round(sketch.estimate()), f"±{sketch.relative_error:.1%} std. error")
+
+
+def price_quantile(session: Session, product_type_id: int, q: float = 0.5,
+                   periods: Sequence[str] = (ALL_TIME,), exact: bool = False) -> Estimate:
+    if exact:
+        value = _exact_quantile(session, Sale.price, q, [Sale.product_type_id == product_type_id], periods)
+        return Estimate(value, None)
+    sketch = _load(session, "product_type", product_type_id, periods, "price_kll")
+    if sketch is None:
+        return Estimate(None, None)
+    return Estimate(sketch.quantile(q), f"±{sketch.rank_error:.2%} rank error")
+
+
+def quantity_quantile(session: Session, q: float = 0.95, periods: Sequence[str] = (ALL_TIME,),
+                      exact: bool = False) -> Estimate:
+    if exact:
+        return Estimate(_exact_quantile(session, Sale.quantity, q, [], periods), None)
+    sketch = _load(session, "all", 0, periods, "quantity_kll")
+    if sketch is None:
+        return Estimate(None, None)
+    return Estimate(sketch.quantile(q), f"±{sketch.rank_error:.2%} rank error")
@@ -0,0 +1,236 @@
+"""Online, resumable backfills of derived columns.
+
+A single ``UPDATE`` over millions of rows holds SQLite's write lock until it
+finishes, so every clerk waits.  A ``Backfill`` instead walks the table in
+key ranges of ``batch_size``; each range is one short transaction that also
+records the range in ``backfill_progress``, so an interrupted run resumes
+after the last committed range.  Between batches it sleeps long enough to
+keep its share of wall time at ``duty_cycle``, and a batch that finds the
+database locked is retried with backoff.
+
+Only rows whose stored value differs are written (``NOT (col IS expr)``),
+so re-running a finished backfill is a read-only scan.  After the last
+range a verification pass counts mismatches range by range over the whole
+table, including rows added since the run started, repairs the ranges that
+have any and raises ``BackfillError`` if a range still disagrees.
+
+From an Alembic revision (see versions/0004_sale_total_amount.py):
+
+    op.add_column("sales", sa.Column("total_amount", sa.Float))
+    with op.get_context().autocommit_block():
+        backfill.run(op.get_bind().engine, backfill.SALE_TOTAL_AMOUNT)
+
+``python -m lib.cli backfill status`` shows progress, and ``backfill run
+NAME`` resumes (or re-verifies) a registered backfill by hand.
+"""
+
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .models import BackfillProgress
+
+BATCH_SIZE = 5000
+DUTY_CYCLE = 0.5
+LOCK_RETRIES = 8
+
+
+class BackfillError(RuntimeError):
+    pass
+
+
+class Backfill(NamedTuple):
+    name: str
+    table: str
+    values: Dict[str, str]      # column -> SQL expression over the same row
+    key: str = "id"             # integer key the ranges are cut on
+    where: Optional[str] = None     # only rows matching this are filled
+
+    def mismatch(self) -> str:
+        differs = " OR ".join(f"NOT ({col} IS {expr})" for col, expr in self.values.items())
+        return f"({self.where}) AND ({differs})" if self.where else differs
+
+
+class BackfillReport(NamedTuple):
+    name: str
+    resumed_from: Optional[int]
+    batches: int
+    rows_updated: int
+    repaired: int
+    seconds: float
+
+
+SALE_TOTAL_AMOUNT = Backfill("sales_total_amount", "sales", {"total_amount": "quantity * price"})
+# Sales that predate sync_key get one built from the natural key sync used to
+# send them by, so offices that already share a sale derive the same key.
+SALE_SYNC_KEY = Backfill("sales_sync_key", "sales", {"sync_key": (
+    "'legacy:' || json_array("
+    "(SELECT national_id FROM farmers WHERE farmers.id = sales.farmer_id), "
+    "(SELECT name FROM buyers WHERE buyers.id = sales.buyer_id), "
+    "(SELECT organization FROM buyers WHERE buyers.id = sales.buyer_id), "
+    "(SELECT name FROM product_types WHERE product_types.id = sales.product_type_id), "
+    "created_at, quantity, price)"
+)}, where="sync_key IS NULL")
+
+BACKFILLS: Dict[str, Backfill] = {b.name: b for b in (SALE_TOTAL_AMOUNT, SALE_SYNC_KEY)}
+_progress = BackfillProgress.__table__
+
+
+def _is_locked(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and "locked" in str(exc.orig)
+
+
+def _retrying(engine, fn):
+    """Run ``fn(connection)`` in its own transaction, retrying while the database is locked."""
+    delay = 0.05
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            with engine.begin() as conn:
+                return fn(conn)
+        except OperationalError as exc:
+            if not _is_locked(exc) or attempt == LOCK_RETRIES:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+class _Throttle:
+    def __init__(self, duty_cycle: float):
+        if not 0 < duty_cycle <= 1:
+            raise ValueError("duty_cycle must be in (0, 1]")
+        self.factor = (1 - duty_cycle) / duty_cycle
+
+    def __call__(self, fn):
+        started = time.perf_counter()
+        result = fn()
+        if self.factor:
+            time.sleep((time.perf_counter() - started) * self.factor)
+        return result
+
+
+def _key_bounds(conn, spec: Backfill):
+    return conn.execute(text(f"SELECT MIN({spec.key}), MAX({spec.key}) FROM {spec.table}")).one()
+
+
+def _start(engine, spec: Backfill, restart: bool) -> dict:
+    def start(conn):
+        t = _progress
+        t.create(conn, checkfirst=True)
+        row = conn.execute(t.select().where(t.c.name == spec.name)).mappings().first()
+        if row is not None and not restart:
+            return dict(row)
+        if row is not None:
+            conn.execute(t.delete().where(t.c.name == spec.name))
+        low, high = _key_bounds(conn, spec)
+        state = {"name": spec.name, "table_name": spec.table, "last_key": None if low is None else low - 1,
+                 "max_key": high, "rows_updated": 0, "repaired": 0, "started_at": datetime.utcnow()}
+        conn.execute(t.insert().values(**state))
+        return state
+
+    return _retrying(engine, start)
+
+
+def _update_range(spec: Backfill, lo: int, hi: int):
+    assignments = ", ".join(f"{col} = {expr}" for col, expr in spec.values.items())
+    return text(
+        f"UPDATE {spec.table} SET {assignments} "
+        f"WHERE {spec.key} >= {int(lo)} AND {spec.key} < {int(hi)} AND ({spec.mismatch()})"
+    )
+
+
+def _checkpoint(conn, spec: Backfill, **values):
+    t = _progress
+    conn.execute(t.update().where(t.c.name == spec.name).values(updated_at=datetime.utcnow(), **values))
+
+
+def verify(engine, spec: Backfill, batch_size: int = BATCH_SIZE, duty_cycle: float = DUTY_CYCLE,
+           repair: bool = True) -> int:
+    """Count rows whose columns disagree with their expressions, range by range.
+
+    With ``repair`` the mismatched ranges are rewritten and the number of
+    rows fixed is returned; a range that still disagrees raises
+    ``BackfillError``.  Without it, the mismatch count is returned.
+    """
+    throttle = _Throttle(duty_cycle)
+    with engine.connect() as conn:
+        low, high = _key_bounds(conn, spec)
+    if low is None:
+        return 0
+    count = text(f"SELECT COUNT(*) FROM {spec.table} WHERE {spec.key} >= :lo AND {spec.key} < :hi AND ({spec.mismatch()})")
+    found = 0
+
+    for lo in range(low, high + 1, batch_size):
+        hi = lo + batch_size
+        bad = throttle(lambda: _retrying(engine, lambda conn: conn.execute(count, {"lo": lo, "hi": hi}).scalar()))
+        if not bad:
+            continue
+        if not repair:
+            found += bad
+            continue
+
+        def fix(conn):
+            fixed = conn.execute(_update_range(spec, lo, hi)).rowcount
+            if conn.execute(count, {"lo": lo, "hi": hi}).scalar():
+                raise BackfillError(f"{spec.name}: rows {lo}..{hi - 1} still disagree after repair")
+            return fixed
+
+        found += throttle(lambda: _retrying(engine, fix))
+    return found
+
+
+def run(engine, spec: Backfill, batch_size: int = BATCH_SIZE, duty_cycle: float = DUTY_CYCLE,
+        restart: bool = False, check: bool = True,
+        on_batch: Optional[Callable[[int, int, int], None]] = None) -> BackfillReport:
+    """Backfill ``spec`` from its checkpoint, then verify.
+
+    ``engine`` must not be inside an open write transaction (in Alembic, use
+    ``autocommit_block``): every batch commits on a connection of its own.
+    ``on_batch(last_key, max_key, rows_updated)`` is called after each commit.
+    """
+    started = time.perf_counter()
+    state = _start(engine, spec, restart)
+    resumed_from = None
+    if state.get("finished_at") is None and state["last_key"] is not None:
+        # A fresh checkpoint sits just below the lowest key; only batches move it past.
+        low, _ = _retrying(engine, lambda conn: _key_bounds(conn, spec))
+        if low is not None and state["last_key"] >= low:
+            resumed_from = state["last_key"]
+    throttle = _Throttle(duty_cycle)
+    batches = 0
+    rows = state["rows_updated"]
+
+    if state.get("finished_at") is None:
+        high = state["max_key"] if state["max_key"] is not None else -1      # None: the table was empty
+        lo = state["last_key"] + 1 if state["last_key"] is not None else 0
+        while lo <= high:
+            hi = min(lo + batch_size, high + 1)
+
+            def batch(conn):
+                n = conn.execute(_update_range(spec, lo, hi)).rowcount
+                _checkpoint(conn, spec, last_key=hi - 1, rows_updated=rows + n)
+                return n
+
+            rows += throttle(lambda: _retrying(engine, batch))
+            batches += 1
+            if on_batch is not None:
+                on_batch(hi - 1, high, rows)
+            lo = hi
+        _retrying(engine, lambda conn: _checkpoint(conn, spec, finished_at=datetime.utcnow()))
+
+    repaired = 0
+    if check:
+        repaired = verify(engine, spec, batch_size, duty_cycle)
+        _retrying(engine, lambda conn: _checkpoint(
+            conn, spec, repaired=(state.get("repaired") or 0) + repaired, verified_at=datetime.utcnow()))
+    return BackfillReport(spec.name, resumed_from, batches, rows, repaired, time.perf_counter() - started)
+
+
+def status(engine) -> List[dict]:
+    with engine.connect() as conn:
+        t = _progress
+        if not conn.dialect.has_table(conn, t.name):
+            return []
+        return [dict(r) for r in conn.execute(t.select().order_by(t.c.started_at)).mappings()]
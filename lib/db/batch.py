@@ -0,0 +1,109 @@
+"""Opt-in unit-of-work mode for the model write methods.
+
+Outside a batch every model ``create``/``delete``/``update_progress`` commits
+on its own.  Inside ``with batch(session):`` those methods only flush, and the
+batch commits once ``max_rows`` writes are pending or the oldest pending write
+is older than ``max_latency_ms``.
+
+    with batch(session, max_rows=1000, max_latency_ms=200) as b:
+        for i, row in enumerate(rows):
+            with b.row(i):
+                Farmer.create(session, **row)
+    for key, exc in b.errors:
+        print(key, exc)
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+_BATCH_KEY = "unit_of_work_batch"
+
+
+class Batch:
+    def __init__(self, session: Session, max_rows: int = 1000, max_latency_ms: float = 200):
+        if max_rows < 1:
+            raise ValueError("max_rows must be at least 1")
+        self.session = session
+        self.max_rows = max_rows
+        self.max_latency = max_latency_ms / 1000.0
+        self.errors: List[Tuple[Any, Exception]] = []
+        self.pending = 0
+        self.committed = 0
+        self.commits = 0
+        self._oldest: Optional[float] = None
+        self._in_row = False
+
+    @contextmanager
+    def row(self, key: Any = None):
+        """Run one row's writes in a savepoint.
+
+        A failing row is rolled back on its own and recorded in ``errors``
+        as ``(key, exception)``; the rest of the batch carries on.
+        """
+        if key is None:
+            key = self.pending + self.committed + len(self.errors)
+        savepoint = self.session.begin_nested()
+        self._in_row = True
+        try:
+            yield
+            savepoint.commit()
+        except Exception as exc:
+            savepoint.rollback()
+            self.errors.append((key, exc))
+            return
+        finally:
+            self._in_row = False
+        self._written()
+
+    def write(self):
+        """Called by the models in place of ``session.commit()``."""
+        self.session.flush()
+        if not self._in_row:
+            self._written()
+
+    def _written(self):
+        self.pending += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self.pending >= self.max_rows or time.monotonic() - self._oldest >= self.max_latency:
+            self.commit()
+
+    def commit(self):
+        if self.pending:
+            self.session.commit()
+            self.committed += self.pending
+            self.commits += 1
+        self.pending = 0
+        self._oldest = None
+
+
+@contextmanager
+def batch(session: Session, max_rows: int = 1000, max_latency_ms: float = 200):
+    if _BATCH_KEY in session.info:
+        raise RuntimeError("A batch is already active on this session")
+    b = Batch(session, max_rows=max_rows, max_latency_ms=max_latency_ms)
+    session.info[_BATCH_KEY] = b
+    try:
+        yield b
+        b.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop(_BATCH_KEY, None)
+
+
+def active_batch(session: Session) -> Optional[Batch]:
+    return session.info.get(_BATCH_KEY)
+
+
+def commit(session: Session):
+    """Commit, or hand the write to the active batch."""
+    b = session.info.get(_BATCH_KEY)
+    if b is None:
+        session.commit()
+    else:
+        b.write()
@@ -0,0 +1,236 @@
+"""Set-based bulk updates of farmer-activity progress and membership roles.
+
+After field visits, officers return readings for thousands of rows at once.
+Updating them through the ORM costs one flush (and one pass of every session
+listener) per row.  Instead, each chunk of input is loaded into a TEMP table
+and applied with a single ``UPDATE ... FROM`` in its own transaction
+(``executemany`` on SQLite older than 3.33):
+
+    progress   farmer_id, activity_id, progress[, notes]
+    roles      cooperative_id, farmer_id, role
+
+Input is CSV with a header row or JSON lines, picked by the file suffix.
+Invalid rows are rejected with their line number, and a key repeated within
+a chunk keeps its last value.  The report counts input rows matched (the
+target row exists), unmatched and changed (the stored value differed).
+Changed rows go to the change journal, so sync and other consumers see them.
+Because the UPDATE runs through the session, the query cache is invalidated
+as for any other write.
+"""
+
+import csv
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import (
+    Column, Float, Integer, MetaData, Table, Text, UniqueConstraint, and_, bindparam, delete, exists, func, insert, or_, select, update,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from . import journal, lookups
+from .journal import ORIGIN_KEY
+from .models import FarmerActivity, Membership
+from .models.lookup import MEMBERSHIP_ROLE
+
+CHUNK = 5000
+UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+class BulkError(ValueError):
+    pass
+
+
+class BulkReport(NamedTuple):
+    read: int
+    matched: int
+    unmatched: int
+    changed: int
+    superseded: int                      # earlier rows for a key repeated in the same chunk
+    rejected: List[Tuple[int, str]]
+    unmatched_lines: List[int]
+
+
+def _int(row: dict, field: str) -> int:
+    value = row.get(field)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BulkError(f"{field} must be an integer, got {value!r}")
+
+
+def _progress(session: Session, row: dict) -> dict:
+    try:
+        progress = float(row.get("progress"))
+    except (TypeError, ValueError):
+        raise BulkError(f"progress must be a number, got {row.get('progress')!r}")
+    if not 0 <= progress <= 100:
+        raise BulkError(f"progress must be between 0 and 100, got {progress}")
+    notes = row.get("notes")
+    return {
+        "farmer_id": _int(row, "farmer_id"),
+        "activity_id": _int(row, "activity_id"),
+        "progress_percent": progress,
+        "notes": (str(notes).strip() or None) if notes is not None else None,
+    }
+
+
+def _role(session: Session, row: dict) -> dict:
+    role = str(row.get("role") or "").strip()
+    if not role:
+        raise BulkError("role is required")
+    return {
+        "cooperative_id": _int(row, "cooperative_id"),
+        "farmer_id": _int(row, "farmer_id"),
+        "role_id": lookups.resolve(session, MEMBERSHIP_ROLE, role),
+    }
+
+
+_temp = MetaData()
+progress_stage = Table(
+    "bulk_progress", _temp,
+    Column("line", Integer, primary_key=True),
+    Column("farmer_id", Integer, nullable=False),
+    Column("activity_id", Integer, nullable=False),
+    Column("progress_percent", Float, nullable=False),
+    Column("notes", Text),
+    UniqueConstraint("farmer_id", "activity_id"),
+    prefixes=["TEMPORARY"],
+)
+roles_stage = Table(
+    "bulk_roles", _temp,
+    Column("line", Integer, primary_key=True),
+    Column("cooperative_id", Integer, nullable=False),
+    Column("farmer_id", Integer, nullable=False),
+    Column("role_id", Integer, nullable=False),
+    UniqueConstraint("cooperative_id", "farmer_id"),
+    prefixes=["TEMPORARY"],
+)
+
+
+class Kind(NamedTuple):
+    target: Table
+    stage: Table
+    keys: Tuple[str, ...]
+    parse: Callable[[Session, dict], dict]
+    # New values of the updated columns, as expressions over (target, stage).
+    values: Callable[[Table, Table], dict]
+
+
+KINDS: Dict[str, Kind] = {
+    "progress": Kind(
+        FarmerActivity.__table__, progress_stage, ("farmer_id", "activity_id"), _progress,
+        lambda t, s: {"progress_percent": s.c.progress_percent, "notes": func.coalesce(s.c.notes, t.c.notes)},
+    ),
+    "roles": Kind(
+        Membership.__table__, roles_stage, ("cooperative_id", "farmer_id"), _role,
+        lambda t, s: {"role_id": s.c.role_id},
+    ),
+}
+
+
+def read_rows(path) -> Iterator[Tuple[int, dict]]:
+    """``(line number, raw row)`` from a CSV file with a header or from JSON lines."""
+    path = Path(path)
+    with path.open(newline="", encoding="utf-8") as fh:
+        if path.suffix.lower() == ".csv":
+            reader = csv.DictReader(fh)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for n, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as exc:
+                row = BulkError(f"invalid JSON: {exc.msg}")
+            yield n, row if isinstance(row, (dict, BulkError)) else BulkError("expected a JSON object")
+
+
+def _apply_chunk(session: Session, kind: Kind, chunk: List[dict], unmatched_lines: List[int]) -> Tuple[int, int]:
+    conn = session.connection()
+    target, stage = kind.target, kind.stage
+    conn.execute(CreateTable(stage, if_not_exists=True))
+    conn.execute(insert(stage), chunk)
+
+    joined = and_(*[target.c[k] == stage.c[k] for k in kind.keys])
+    unmatched = conn.execute(
+        select(stage.c.line).where(~exists().where(joined)).order_by(stage.c.line)
+    ).scalars().all()
+    unmatched_lines.extend(unmatched)
+
+    values = kind.values(target, stage)
+    differs = or_(*[target.c[c].is_distinct_from(v) for c, v in values.items()])
+    pk = list(target.primary_key.columns)
+    changed = conn.execute(
+        select(*pk, *values.values()).select_from(target.join(stage, joined)).where(differs)
+    ).all()
+    now = datetime.utcnow()
+    if changed and UPDATE_FROM:
+        session.execute(update(target).where(joined, differs).values({**values, "last_updated": now}))
+    elif changed:
+        session.execute(
+            update(target)
+            .where(*[c == bindparam(f"b_{c.key}") for c in pk])
+            .values({**{c: bindparam(c) for c in values}, "last_updated": now}),
+            [{**{f"b_{c.key}": v for c, v in zip(pk, r)}, **dict(zip(values, r[len(pk):]))} for r in changed],
+        )
+    if changed:
+        journal.record(
+            conn, target.name, "U",
+            [r[:len(pk)] for r in changed],
+            [{**dict(zip(values, r[len(pk):])), "last_updated": now} for r in changed],
+            origin=session.info.get(ORIGIN_KEY),
+        )
+    conn.execute(delete(stage))
+    return len(chunk) - len(unmatched), len(changed)
+
+
+def bulk_update(session: Session, name: str, rows, chunk_size: int = CHUNK,
+                on_chunk: Optional[Callable[[BulkReport], None]] = None) -> BulkReport:
+    """Apply ``(line, raw row)`` pairs of kind ``name`` ("progress" or "roles")."""
+    kind = KINDS[name]
+    read = matched = changed = superseded = 0
+    rejected: List[Tuple[int, str]] = []
+    unmatched_lines: List[int] = []
+    pending: Dict[tuple, dict] = {}
+
+    def report():
+        return BulkReport(read, matched, len(unmatched_lines), changed, superseded, rejected, unmatched_lines)
+
+    def flush():
+        nonlocal matched, changed
+        try:
+            m, c = _apply_chunk(session, kind, list(pending.values()), unmatched_lines)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        matched += m
+        changed += c
+        pending.clear()
+        if on_chunk is not None:
+            on_chunk(report())
+
+    for line, raw in rows:
+        read += 1
+        try:
+            if isinstance(raw, BulkError):
+                raise raw
+            row = kind.parse(session, raw)
+        except BulkError as exc:
+            rejected.append((line, str(exc)))
+            continue
+        key = tuple(row[k] for k in kind.keys)
+        if pending.pop(key, None) is not None:
+            superseded += 1
+        pending[key] = {"line": line, **row}
+        if len(pending) >= chunk_size:
+            flush()
+    if pending:
+        flush()
+    return report()
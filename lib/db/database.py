@@ -1,11 +1,48 @@
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 BASE_DIR = Path(__file__).resolve().parent  
 DB_PATH = BASE_DIR / "smart_farm.db"
 
 DATABASE_URL = f"sqlite:///{DB_PATH}"
+# Compiled statements kept per engine (SQLAlchemy defaults to 500); see statement_cache.py.
+COMPILED_CACHE_SIZE = 1200
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+
+# Statements pysqlite would open a transaction for, plus SAVEPOINT.
+_TRANSACTIONAL = ("INSERT", "UPDATE", "DELETE", "REPLACE", "SAVEPOINT")
+
+
+def sqlite_transactions(engine, begin: str = "BEGIN"):
+    """Let SQLAlchemy, not pysqlite, start SQLite transactions on ``engine``.
+
+    pysqlite only sends BEGIN before INSERT/UPDATE/DELETE, so a SAVEPOINT
+    issued first (``Session.begin_nested``) runs outside any transaction
+    and its RELEASE commits on its own.  Following SQLAlchemy's SQLite
+    savepoint recipe, pysqlite's implicit BEGIN is turned off and ``begin``
+    is emitted here instead; it is sent before the first write or savepoint
+    of the SQLAlchemy transaction rather than when it starts, so sessions
+    that only read (a menu waiting at a prompt) hold no lock, as before.
+    """
+    @event.listens_for(engine, "connect")
+    def _no_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _begin_before_write(conn, cursor, statement, parameters, context, executemany):
+        if (
+            statement.lstrip()[:9].upper().startswith(_TRANSACTIONAL)
+            and conn.in_transaction()
+            and not conn.connection.dbapi_connection.in_transaction
+            and conn.get_execution_options().get("isolation_level") != "AUTOCOMMIT"
+        ):
+            cursor.execute(begin)
+
+    return engine
+
+
+engine = sqlite_transactions(
+    create_engine(DATABASE_URL, echo=False, future=True, query_cache_size=COMPILED_CACHE_SIZE)
+)
 SessionLocal = sessionmaker(bind=engine, future=True)
@@ -0,0 +1,129 @@
+"""Run a CLI session against a RAM copy of ``smart_farm.db``.
+
+``python -m lib.cli --in-memory`` copies the database file into a private
+``:memory:`` SQLite database with the sqlite3 backup API (a chunk of pages at
+a time, printing progress) and rebinds ``SessionLocal`` to it, so every query
+afterwards is served from RAM.
+
+    read-only   (default) ``PRAGMA query_only`` refuses every write
+    write-back  writes go to the copy and are backed up over the file on exit
+
+The source file stays open for the whole session.  If another process
+changed it meanwhile, write-back does not overwrite those changes: the copy
+is saved next to it as ``<name>.in-memory-<timestamp>.db`` instead.
+"""
+
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+from .database import COMPILED_CACHE_SIZE, DB_PATH, SessionLocal, sqlite_transactions
+
+PAGES_PER_STEP = 1024
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _rss_kib() -> Optional[int]:
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def _progress(label: str):
+    def report(status, remaining, total):
+        done = total - remaining
+        print(f"\r{label} {done}/{total} pages ({done / total if total else 1:.0%})", end="", flush=True)
+    return report
+
+
+def _backup(source: sqlite3.Connection, target: sqlite3.Connection, label: str):
+    source.backup(target, pages=PAGES_PER_STEP, progress=_progress(label))
+    print()
+
+
+class InMemoryDatabase:
+    def __init__(self, path: Path = DB_PATH, write_back: bool = False):
+        self.path = Path(path)
+        self.write_back = write_back
+        self.source: Optional[sqlite3.Connection] = None
+        self.memory: Optional[sqlite3.Connection] = None
+        self.engine = None
+        self._disk_engine = None
+        self._data_version = None
+
+    def load(self):
+        rss_before = _rss_kib()
+        started = time.perf_counter()
+        self.source = sqlite3.connect(str(self.path))
+        self.memory = sqlite3.connect(":memory:", check_same_thread=False)
+        _backup(self.source, self.memory, f"Loading {self.path.name}:")
+        self._data_version = self._disk_data_version()
+        if not self.write_back:
+            self.memory.execute("PRAGMA query_only = ON")
+
+        page_count = self.memory.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.memory.execute("PRAGMA page_size").fetchone()[0]
+        rss_after = _rss_kib()
+        mode = "write-back on exit" if self.write_back else "read-only"
+        print(f"Loaded in {time.perf_counter() - started:.2f} s: "
+              f"{page_count * page_size / 2 ** 20:.1f} MiB database in RAM"
+              + (f", process peak RSS +{(rss_after - rss_before) / 1024:.1f} MiB" if rss_before is not None else "")
+              + f" [{mode}]")
+
+        memory = self.memory
+        self.engine = sqlite_transactions(create_engine("sqlite://", creator=lambda: memory, poolclass=StaticPool,
+                                                        future=True, query_cache_size=COMPILED_CACHE_SIZE))
+        self._disk_engine = SessionLocal.kw["bind"]
+        SessionLocal.configure(bind=self.engine)
+        return self
+
+    def _disk_data_version(self) -> int:
+        return self.source.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        if self.memory is None:
+            return
+        SessionLocal.configure(bind=self._disk_engine)
+        try:
+            if self.write_back:
+                self._save()
+        finally:
+            self.engine.dispose()
+            self.memory.close()
+            self.source.close()
+            self.memory = self.source = None
+
+    def _save(self):
+        target, conn = self.path, self.source
+        if self._disk_data_version() != self._data_version:
+            target = self.path.with_name(f"{self.path.stem}.in-memory-{time.strftime('%Y%m%d-%H%M%S')}.db")
+            print(f"{self.path.name} was changed by another process; saving this session to {target} instead")
+            conn = sqlite3.connect(str(target))
+        started = time.perf_counter()
+        try:
+            _backup(self.memory, conn, f"Writing {target.name}:")
+        finally:
+            if conn is not self.source:
+                conn.close()
+        print(f"Saved in {time.perf_counter() - started:.2f} s")
+
+    def __enter__(self):
+        return self.load()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_read_only_error(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and "readonly database" in str(exc.orig)
@@ -0,0 +1,387 @@
+"""Streaming ingest of mobile-money payment events into sales.
+
+The gateway appends one JSON object per line to a spool file (or writes them
+into a named pipe):
+
+    {"farmer_national_id": "ID00000042", "buyer_name": "Acme Dairy",
+     "product": "Milk", "quantity": 20, "amount": 900.0, "timestamp": "2024-05-02T08:15:00"}
+
+Farmers are matched by ``farmer_id`` or ``farmer_national_id``, buyers by
+``buyer_id`` or ``buyer_name``, products by ``product_type_id`` or
+``product``.  ``price`` is the unit price; ``amount`` (the payment total) is
+divided by ``quantity`` when no price is given.  ``timestamp`` or ``date``
+sets the sale date.
+
+A reader thread tails the file into a bounded queue (it blocks when the
+writer falls behind).  The writer collects parsed events into micro-batches
+of up to ``max_rows`` events or ``max_latency_ms`` and writes each with one
+flush and one commit, which also stores the spool offset reached and the
+SHA-256 of every event: a restart resumes exactly
+where the last commit ended, and an event seen again (replayed spool,
+rotated file, pipe) never creates a second sale.  Named pipes have no
+offsets and rely on the hashes alone.
+
+The savepoints that isolate a bad row sit inside that one transaction only
+on an engine wrapped by ``database.sqlite_transactions`` (all of lib.db's
+are); with pysqlite's own BEGIN a leading SAVEPOINT commits on release.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import stat
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from . import journal
+from .models import Buyer, Farmer, IngestCheckpoint, IngestedEvent, ProductType, Sale
+
+POLL_INTERVAL = 0.2
+
+
+class IngestError(ValueError):
+    pass
+
+
+def event_hash(event: dict) -> str:
+    canonical = json.dumps(event, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IngestStats:
+    """Counters for ``ingest``; ``snapshot`` is safe to call from any thread."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.read = 0
+        self.committed = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.commits = 0
+        self.queue_depth = 0
+        self.committed_offset: Optional[int] = None
+        self.source_size: Optional[int] = None
+        self.last_event_time: Optional[datetime] = None
+        self._window = (time.monotonic(), 0)
+        self.rows_per_sec = 0.0
+
+    def tick(self):
+        now = time.monotonic()
+        since, committed = self._window
+        if now - since >= 1.0:
+            self.rows_per_sec = (self.committed - committed) / (now - since)
+            self._window = (now, self.committed)
+
+    def snapshot(self) -> dict:
+        lag_bytes = None
+        if self.source_size is not None and self.committed_offset is not None:
+            lag_bytes = max(0, self.source_size - self.committed_offset)
+        lag_seconds = None
+        if self.last_event_time is not None:
+            lag_seconds = max(0.0, (datetime.now() - self.last_event_time).total_seconds())
+        elapsed = time.monotonic() - self.started
+        return {
+            "read": self.read,
+            "committed": self.committed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "commits": self.commits,
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "avg_rows_per_sec": round(self.committed / elapsed, 1) if elapsed else 0.0,
+            "queue_depth": self.queue_depth,
+            "lag_bytes": lag_bytes,
+            "lag_seconds": round(lag_seconds, 1) if lag_seconds is not None else None,
+        }
+
+
+class SpoolReader(threading.Thread):
+    """Puts ``(line, end_offset, inode)`` tuples on ``out``; ``None`` at the end."""
+
+    def __init__(self, path: Path, out: queue.Queue, offset: int, inode: Optional[int], follow: bool,
+                 stats: IngestStats):
+        super().__init__(daemon=True, name="spool-reader")
+        self.path = path
+        self.out = out
+        self.offset = offset
+        self.inode = inode
+        self.follow = follow
+        self.stats = stats
+        self.stop = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            if stat.S_ISFIFO(os.stat(self.path).st_mode):
+                self._read_pipe()
+            else:
+                self._tail_file()
+        except BaseException as exc:  # handed to the writer thread
+            self.error = exc
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.out.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _read_pipe(self):
+        while not self.stop.is_set():
+            with open(self.path, "rb") as fh:  # blocks until a writer opens the pipe
+                for line in fh:
+                    self._put((line, None, None))
+                    if self.stop.is_set():
+                        return
+            if not self.follow:
+                return
+
+    def _tail_file(self):
+        fh = open(self.path, "rb")
+        try:
+            inode = os.fstat(fh.fileno()).st_ino
+            if inode == self.inode and self.offset <= os.fstat(fh.fileno()).st_size:
+                fh.seek(self.offset)
+            else:
+                self.offset = 0  # a different or truncated file: start over, hashes skip repeats
+            while not self.stop.is_set():
+                line = fh.readline()
+                if line.endswith(b"\n"):
+                    self.offset = fh.tell()
+                    self._put((line, self.offset, inode))
+                    continue
+                fh.seek(self.offset)  # incomplete last line: wait for the rest
+                self.stats.source_size = os.fstat(fh.fileno()).st_size
+                if not self.follow:
+                    return
+                try:
+                    current = os.stat(self.path)
+                except FileNotFoundError:
+                    current = None
+                if current is not None and (current.st_ino != inode or current.st_size < self.offset):
+                    fh.close()
+                    fh = open(self.path, "rb")
+                    inode = os.fstat(fh.fileno()).st_ino
+                    self.offset = 0
+                    continue
+                time.sleep(POLL_INTERVAL)
+        finally:
+            fh.close()
+
+
+class _Resolver:
+    def __init__(self, session: Session):
+        self.session = session
+        self._cache = {}
+
+    def _one(self, model, column, value, label):
+        key = (model, column.key, value)
+        if key not in self._cache:
+            id_ = self.session.execute(select(model.id).where(column == value)).scalars().first()
+            if id_ is None:
+                raise IngestError(f"Unknown {label} {value!r}")
+            self._cache[key] = id_
+        return self._cache[key]
+
+    def pick(self, event, model, id_field, alt_field, alt_column, label):
+        if event.get(id_field) is not None:
+            return self._one(model, model.id, event[id_field], label)
+        if event.get(alt_field) is not None:
+            return self._one(model, alt_column, event[alt_field], label)
+        return None
+
+
+def _event_date(event: dict) -> Optional[date]:
+    value = event.get("timestamp") or event.get("date")
+    if value is None:
+        return None
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).date()
+
+
+def _event_time(event: dict) -> Optional[datetime]:
+    value = event.get("timestamp")
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def build_sale(resolver: _Resolver, event: dict) -> Sale:
+    """Validate ``event`` and return an unsaved ``Sale``; raises ``IngestError``."""
+    farmer_id = resolver.pick(event, Farmer, "farmer_id", "farmer_national_id", Farmer.national_id, "farmer")
+    buyer_id = resolver.pick(event, Buyer, "buyer_id", "buyer_name", Buyer.name, "buyer")
+    product_id = resolver.pick(event, ProductType, "product_type_id", "product", ProductType.name, "product")
+    if farmer_id is None or buyer_id is None:
+        raise IngestError("Event needs a farmer and a buyer")
+    try:
+        quantity = float(event.get("quantity") or 0.0)
+        if event.get("price") is not None:
+            price = float(event["price"])
+        elif event.get("amount") is not None and quantity:
+            price = float(event["amount"]) / quantity
+        else:
+            raise IngestError("Event needs a price, or an amount and a quantity")
+    except (TypeError, ValueError) as exc:
+        raise IngestError(f"Bad quantity or price: {exc}")
+    try:
+        created_at = _event_date(event)
+    except ValueError:
+        raise IngestError(f"Bad timestamp {event.get('timestamp') or event.get('date')!r}")
+    # Ids rather than relationships, so a rolled-back row leaves no trace in
+    # the farmer's or buyer's collections.
+    return Sale(farmer_id=farmer_id, buyer_id=buyer_id, product_type_id=product_id,
+                quantity=quantity, price=price, created_at=created_at or date.today())
+
+
+def _parse(line: bytes, stats: IngestStats, on_error):
+    text = line.decode("utf-8", errors="replace").strip()
+    if not text:
+        return None
+    try:
+        event = json.loads(text)
+        if not isinstance(event, dict):
+            raise IngestError("Event is not a JSON object")
+    except ValueError as exc:
+        _reject(stats, on_error, text, exc)
+        return None
+    return event_hash(event), text, event
+
+
+def _reject(stats: IngestStats, on_error, text: str, exc: Exception):
+    stats.rejected += 1
+    if on_error is not None:
+        on_error(text, exc)
+
+
+def _write(session: Session, resolver: _Resolver, source: str, pending: list, stats: IngestStats, on_error):
+    """Insert one micro-batch of parsed events: a single flush, duplicates skipped."""
+    hashes = [digest for digest, _, _ in pending]
+    seen = set()
+    for i in range(0, len(hashes), 500):
+        seen.update(session.execute(
+            select(IngestedEvent.hash).where(IngestedEvent.hash.in_(hashes[i:i + 500]))
+        ).scalars())
+
+    rows = []
+    for digest, text, event in pending:
+        if digest in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(digest)
+        try:
+            rows.append((digest, text, event, build_sale(resolver, event)))
+        except IngestError as exc:
+            _reject(stats, on_error, text, exc)
+    if not rows:
+        return
+
+    try:
+        with session.begin_nested():
+            session.add_all([sale for *_, sale in rows])
+    except Exception:
+        # Find the offending rows one savepoint at a time; keep the rest.
+        kept = []
+        for row in rows:
+            try:
+                with session.begin_nested():
+                    session.add(row[3])
+                kept.append(row)
+            except Exception as exc:
+                _reject(stats, on_error, row[1], exc)
+        rows = kept
+    if rows:
+        session.execute(insert(IngestedEvent), [
+            {"hash": digest, "sale_id": sale.id, "source": source, "created_at": datetime.utcnow()}
+            for digest, _, _, sale in rows
+        ])
+        stats.last_event_time = _event_time(rows[-1][2]) or stats.last_event_time
+    stats.committed += len(rows)
+
+
+def ingest(session: Session, path, follow: bool = False, max_rows: int = 500, max_latency_ms: float = 200,
+           queue_size: int = 10000, stats: Optional[IngestStats] = None, on_stats=None,
+           stats_interval: float = 10.0, on_error=None) -> IngestStats:
+    """Ingest ``path`` until EOF (or forever with ``follow``) and return the counters.
+
+    ``on_stats(snapshot)`` is called every ``stats_interval`` seconds and
+    ``on_error(line, exception)`` for every rejected event.
+    """
+    path = Path(path)
+    source = str(path.resolve())
+    stats = stats or IngestStats()
+    checkpoint = session.get(IngestCheckpoint, source)
+    if checkpoint is None:
+        checkpoint = IngestCheckpoint(source=source, offset=0)
+        session.add(checkpoint)
+    position = (checkpoint.offset, checkpoint.inode)
+    stats.committed_offset = checkpoint.offset
+
+    lines: queue.Queue = queue.Queue(maxsize=queue_size)
+    reader = SpoolReader(path, lines, checkpoint.offset, checkpoint.inode, follow, stats)
+    resolver = _Resolver(session)
+    max_latency = max_latency_ms / 1000.0
+    pending, oldest = [], None
+    last_report = time.monotonic()
+    session.info[journal.ORIGIN_KEY] = f"ingest:{path.name}"
+
+    def commit():
+        nonlocal pending, oldest
+        if pending:
+            _write(session, resolver, source, pending, stats, on_error)
+        if position != (checkpoint.offset, checkpoint.inode):
+            checkpoint.offset, checkpoint.inode = position
+        if session.new or session.dirty or pending:
+            session.commit()  # sales, event hashes and offset together
+            stats.commits += 1
+        stats.committed_offset = position[0]
+        pending, oldest = [], None
+
+    reader.start()
+    try:
+        while True:
+            wait = max_latency if oldest is None else max(0.0, oldest + max_latency - time.monotonic())
+            try:
+                item = lines.get(timeout=wait)
+            except queue.Empty:
+                item = ()
+            stats.queue_depth = lines.qsize()
+            if item is None:
+                break
+            if item:
+                line, offset, inode = item
+                stats.read += 1
+                parsed = _parse(line, stats, on_error)
+                if parsed is not None:
+                    pending.append(parsed)
+                    oldest = oldest or time.monotonic()
+                if offset is not None:
+                    position = (offset, inode)
+            if not item or len(pending) >= max_rows or (oldest and time.monotonic() - oldest >= max_latency):
+                commit()
+
+            stats.tick()
+            if on_stats is not None and time.monotonic() - last_report >= stats_interval:
+                on_stats(stats.snapshot())
+                last_report = time.monotonic()
+        commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        reader.stop.set()
+        reader.join(timeout=1.0)
+        session.info.pop(journal.ORIGIN_KEY, None)
+    if reader.error is not None:
+        raise reader.error
+    return stats
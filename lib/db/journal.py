@@ -0,0 +1,203 @@
+"""Append-only change journal (CDC) for model writes.
+
+Every ORM flush appends one ``change_journal`` row per inserted, updated or
+deleted model row, inside the same transaction as the change itself.  SQLite
+lets one writer in at a time, so sequence numbers appear in commit order and
+a consumer that remembers the last ``seq`` it processed never misses a row.
+
+    cursor = JournalCursor(session, consumer="county-export")
+    for entry in cursor:
+        handle(entry)
+    cursor.save()            # remember the position for next time
+
+Writes issued as Core/bulk statements bypass the flush and must call
+``record`` themselves.  ``created_at`` is the flush time, unless the session
+carries another one in ``session.info[TIMESTAMP_KEY]`` (sync stamps applied
+changes with the time they were made in their own office).  ``compact`` trims entries every registered consumer
+has already processed.
+"""
+
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from .models import ChangeJournal, JournalConsumer
+
+ORIGIN_KEY = "journal_origin"
+TIMESTAMP_KEY = "journal_timestamp"
+_UNJOURNALED = {"change_journal", "journal_consumers", "sales_sketches", "sales_summaries",
+                "ingest_checkpoints", "ingested_events", "lookups", "backfill_progress"}
+_INSERT = insert(ChangeJournal.__table__)
+
+
+class JournalEntry(NamedTuple):
+    seq: int
+    table_name: str
+    op: str
+    row_key: list
+    data: Optional[dict]
+    origin: Optional[str]
+    created_at: datetime
+
+
+def _encode(value):
+    return json.dumps(value, default=str, separators=(",", ":"))
+
+
+def record(connection, table_name: str, op: str, keys: Sequence[Sequence], data: Iterable[Optional[dict]] = None,
+           origin: Optional[str] = None, created_at: Optional[datetime] = None):
+    """Append entries for rows written outside the ORM flush (bulk/Core writes)."""
+    if not keys:
+        return
+    data = list(data) if data is not None else [None] * len(keys)
+    now = created_at or datetime.utcnow()
+    connection.execute(
+        _INSERT,
+        [
+            {
+                "table_name": table_name,
+                "op": op,
+                "row_key": _encode(list(k)),
+                "data": _encode(d) if d is not None else None,
+                "origin": origin,
+                "created_at": now,
+            }
+            for k, d in zip(keys, data)
+        ],
+    )
+
+
+def _row_entry(obj, op: str, now: datetime, origin: Optional[str]):
+    state = inspect(obj)
+    mapper = state.mapper
+    table = mapper.local_table
+    if table.name in _UNJOURNALED:
+        return None
+    key = [getattr(obj, mapper.get_property_by_column(c).key) for c in mapper.primary_key]
+    data = None
+    if op in ("I", "D"):
+        data = {prop.key: getattr(obj, prop.key) for prop in mapper.column_attrs}
+    elif op == "U":
+        data = {}
+        for prop in mapper.column_attrs:
+            history = state.attrs[prop.key].history
+            if history.has_changes():
+                data[prop.key] = history.added[0] if history.added else None
+        if not data:
+            return None
+    return {
+        "table_name": table.name,
+        "op": op,
+        "row_key": _encode(key),
+        "data": _encode(data) if data is not None else None,
+        "origin": origin,
+        "created_at": now,
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _journal_flush(session, flush_context):
+    now = session.info.get(TIMESTAMP_KEY) or datetime.utcnow()
+    origin = session.info.get(ORIGIN_KEY)
+    entries = []
+    for op, objs in (("I", session.new), ("U", session.dirty), ("D", session.deleted)):
+        for obj in objs:
+            entry = _row_entry(obj, op, now, origin)
+            if entry is not None:
+                entries.append(entry)
+    if entries:
+        session.connection().execute(_INSERT, entries)
+
+
+def _to_entry(row) -> JournalEntry:
+    return JournalEntry(
+        row.seq,
+        row.table_name,
+        row.op,
+        json.loads(row.row_key),
+        json.loads(row.data) if row.data is not None else None,
+        row.origin,
+        row.created_at,
+    )
+
+
+def read(session: Session, since: int = 0, limit: int = 500, tables: Optional[Sequence[str]] = None) -> List[JournalEntry]:
+    """Entries with ``seq > since``, oldest first."""
+    t = ChangeJournal.__table__
+    stmt = select(t).where(t.c.seq > since).order_by(t.c.seq).limit(limit)
+    if tables:
+        stmt = stmt.where(t.c.table_name.in_(list(tables)))
+    return [_to_entry(r) for r in session.execute(stmt)]
+
+
+def stream(session: Session, since: int = 0, batch_size: int = 500,
+           tables: Optional[Sequence[str]] = None) -> Iterator[JournalEntry]:
+    """Yield every entry after ``since``, fetching ``batch_size`` at a time."""
+    while True:
+        batch = read(session, since, batch_size, tables)
+        if not batch:
+            return
+        yield from batch
+        since = batch[-1].seq
+
+
+def last_seq(session: Session) -> int:
+    return session.execute(select(func.max(ChangeJournal.seq))).scalar() or 0
+
+
+class JournalCursor:
+    """Resumable reader; ``consumer`` persists its position in ``journal_consumers``."""
+
+    def __init__(self, session: Session, consumer: Optional[str] = None, since: Optional[int] = None,
+                 batch_size: int = 500, tables: Optional[Sequence[str]] = None):
+        self.session = session
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.tables = tables
+        if since is None:
+            since = 0
+            if consumer is not None:
+                row = session.get(JournalConsumer, consumer)
+                since = row.last_seq if row else 0
+        self.position = since
+
+    def fetch(self, limit: Optional[int] = None) -> List[JournalEntry]:
+        entries = read(self.session, self.position, limit or self.batch_size, self.tables)
+        if entries:
+            self.position = entries[-1].seq
+        return entries
+
+    def __iter__(self) -> Iterator[JournalEntry]:
+        while True:
+            entries = self.fetch()
+            if not entries:
+                return
+            yield from entries
+
+    def save(self):
+        if self.consumer is None:
+            raise ValueError("Only a named consumer can save its position")
+        row = self.session.get(JournalConsumer, self.consumer)
+        if row is None:
+            row = JournalConsumer(name=self.consumer)
+            self.session.add(row)
+        row.last_seq = self.position
+        self.session.commit()
+
+
+def compact(session: Session, upto: Optional[int] = None) -> int:
+    """Delete entries every consumer has processed (or ``seq <= upto``).
+
+    With no consumers registered and no ``upto`` nothing is deleted.
+    Returns the number of entries removed.
+    """
+    if upto is None:
+        upto = session.execute(select(func.min(JournalConsumer.last_seq))).scalar()
+        if upto is None:
+            return 0
+    result = session.execute(delete(ChangeJournal).where(ChangeJournal.seq <= upto))
+    session.commit()
+    return result.rowcount
@@ -0,0 +1,198 @@
+"""Cached map between dictionary-encoded strings and their ``lookups`` ids.
+
+Every database (keyed by URL, like the query cache) gets one ``LookupMap``
+holding ``(kind, normalized key) -> id`` and ``id -> display value``.  The
+whole table is small, so a miss simply reloads it; only a value that is
+still unknown after the reload is inserted.
+
+A ``before_flush`` listener swaps the placeholder ``Lookup`` objects left by
+the models' string properties for the persistent rows, and fills in the
+declared defaults, so the flush only ever writes integer ids.  The map only
+holds committed ids: a lookup a session inserts is not cached until it
+commits, and until then that session resolves values against its own
+connection, so no other session can pick up an id a rollback takes away.
+
+``encode_column`` converts an existing string column in place; it is what
+the Alembic migration runs.
+"""
+
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models.lookup import Lookup, encoded_properties, normalize
+
+_CREATED_KEY = "lookups_created"
+
+
+class LookupMap:
+    def __init__(self):
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._values: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, connection):
+        rows = connection.execute(select(Lookup.id, Lookup.kind, Lookup.key, Lookup.value)).all()
+        with self._lock:
+            self._ids = {(kind, key): id_ for id_, kind, key, _ in rows}
+            self._values = {id_: value for id_, _, _, value in rows}
+
+    def clear(self):
+        with self._lock:
+            self._ids, self._values = {}, {}
+
+    def id_for(self, connection, kind: str, value: str, create: bool = True) -> Optional[int]:
+        if value is None or not str(value).strip():
+            return None
+        key = (kind, normalize(value))
+        id_ = self._ids.get(key)
+        if id_ is None:
+            self.load(connection)
+            id_ = self._ids.get(key)
+        if id_ is None and create:
+            id_ = self.insert(connection, kind, value)
+        return id_
+
+    def insert(self, connection, kind: str, value: str) -> int:
+        """Id of ``value`` read on ``connection``, inserting it if missing.
+
+        Not cached: the row is only visible to ``connection`` until its
+        transaction commits.
+        """
+        key = normalize(value)
+        connection.execute(
+            sqlite_insert(Lookup)
+            .values(kind=kind, key=key, value=" ".join(str(value).split()))
+            .on_conflict_do_nothing()
+        )
+        return connection.execute(select(Lookup.id).where(Lookup.kind == kind, Lookup.key == key)).scalar_one()
+
+    def value_for(self, connection, id_: Optional[int]) -> Optional[str]:
+        if id_ is None:
+            return None
+        value = self._values.get(id_)
+        if value is None:
+            self.load(connection)
+            value = self._values.get(id_)
+        return value
+
+
+_maps: Dict[str, LookupMap] = {}
+_maps_lock = threading.Lock()
+
+
+def lookup_map(connection) -> LookupMap:
+    url = str(connection.engine.url)
+    with _maps_lock:
+        m = _maps.get(url)
+        if m is None:
+            m = _maps[url] = LookupMap()
+    return m
+
+
+def id_for(connection, kind: str, value: str, create: bool = True) -> Optional[int]:
+    """Lookup id of ``value``, inserting it when ``create`` and it is new."""
+    return lookup_map(connection).id_for(connection, kind, value, create)
+
+
+def value_for(connection, id_: Optional[int]) -> Optional[str]:
+    return lookup_map(connection).value_for(connection, id_)
+
+
+def resolve(session: Session, kind: str, value: str) -> Optional[int]:
+    """``id_for`` on the session's connection, keeping ids it creates out of the shared map.
+
+    Once the session's transaction has inserted a lookup, its connection
+    sees rows nobody else can, so it reads ids straight from that
+    connection and never reloads the map until the transaction ends.
+    """
+    if value is None or not str(value).strip():
+        return None
+    connection = session.connection()
+    m = lookup_map(connection)
+    if session.info.get(_CREATED_KEY):
+        return m.insert(connection, kind, value)
+    id_ = m.id_for(connection, kind, value, create=False)
+    if id_ is None:
+        session.info[_CREATED_KEY] = True
+        id_ = m.insert(connection, kind, value)
+    return id_
+
+
+@event.listens_for(Session, "before_flush")
+def _resolve(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty):
+            specs = encoded_properties(type(obj))
+            if not specs:
+                continue
+            for spec in specs.values():
+                state = obj.__dict__
+                target = state.get(spec.ref)
+                if target is not None and target.pending:
+                    value = target.value
+                elif spec.ref not in state and spec.default and obj in session.new \
+                        and getattr(obj, spec.id_column) is None:
+                    value = spec.default
+                else:
+                    continue
+                setattr(obj, spec.ref, session.get(Lookup, resolve(session, spec.kind, value)))
+        for obj in list(session.new):
+            if isinstance(obj, Lookup) and obj.pending:
+                session.expunge(obj)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _transaction_ended(session, transaction):
+    # Committed ids are picked up by the next reload; rolled-back ones never reached the map.
+    if transaction.parent is None:
+        session.info.pop(_CREATED_KEY, None)
+
+
+# -- converting existing columns -----------------------------------------------
+
+def encode_column(engine, table: str, old: str, new: str, kind: str, batch_size: int = 5000) -> int:
+    """Fill ``table.new`` with lookup ids for the strings in ``table.old``.
+
+    Spellings that normalize alike share one lookup whose display value is the
+    most common of them.  The lookups are committed first, then rows are
+    updated in rowid windows of ``batch_size``, each committed on its own so
+    no transaction holds the write lock for long; from Alembic, call it
+    inside ``autocommit_block`` so the migration's connection holds none
+    either.  Returns the number of rows encoded.
+    """
+    with engine.begin() as connection:
+        counts = connection.execute(text(
+            f"SELECT {old}, COUNT(*) FROM {table} WHERE {old} IS NOT NULL GROUP BY {old}"
+        )).all()
+        spellings: Dict[str, Counter] = defaultdict(Counter)
+        for raw, n in counts:
+            if str(raw).strip():
+                spellings[normalize(raw)][" ".join(str(raw).split())] += n
+        m = lookup_map(connection)
+        m.load(connection)
+        ids = {}
+        for key, seen in spellings.items():
+            # Most common spelling; on a tie prefer mixed case over "MEMBER"/"member".
+            display = max(seen, key=lambda v: (seen[v], v not in (v.upper(), v.lower())))
+            id_ = m.id_for(connection, kind, display)
+            for raw, _ in counts:
+                if raw is not None and normalize(raw) == key:
+                    ids[raw] = id_
+        low, high = connection.execute(text(f"SELECT MIN(rowid), MAX(rowid) FROM {table}")).one()
+    if low is None or not ids:
+        return 0
+
+    stmt = text(f"UPDATE {table} SET {new} = :id WHERE {old} = :raw AND rowid >= :lo AND rowid < :hi")
+    encoded = 0
+    for lo in range(low, high + 1, batch_size):
+        with engine.begin() as connection:
+            result = connection.execute(stmt, [
+                {"id": id_, "raw": raw, "lo": lo, "hi": lo + batch_size} for raw, id_ in ids.items()
+            ])
+        encoded += result.rowcount
+    return encoded
@@ -0,0 +1,266 @@
+"""In-memory farmer <-> cooperative adjacency index built from ``memberships``.
+
+The graph is stored twice in CSR form (farmer -> cooperatives and
+cooperative -> farmers) as flat ``array`` buffers, so a neighbour lookup is a
+dict hit plus a slice.  Committed membership inserts/deletes are applied to a
+small overlay instead of rebuilding; the CSR arrays are recompacted in memory
+once the overlay grows past ``compact_ratio`` of the edge count.
+
+Each database (keyed by URL, like the query cache and the prefix index) has
+its own graph, fed only by commits on that database; a commit made by
+another process is noticed through ``PRAGMA data_version`` and the graph is
+rebuilt on next use.
+
+    graph = graph_for(session)
+    graph.co_members(farmer_id, min_shared=2)   # {farmer_id: shared coops}
+"""
+
+import threading
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .models import Membership
+
+_PENDING_KEY = "membership_graph_pending"
+_STALE_KEY = "membership_graph_stale"
+_DATA_VERSION_KEY = "membership_graph_data_version"
+
+
+class _CSR:
+    """Compressed adjacency: ``indices[indptr[row[k]]:indptr[row[k] + 1]]``."""
+
+    def __init__(self, edges: Iterable[Tuple[int, int]]):
+        grouped: Dict[int, List[int]] = defaultdict(list)
+        for src, dst in edges:
+            grouped[src].append(dst)
+        self.row: Dict[int, int] = {}
+        self.indptr = array("q", [0])
+        self.indices = array("q")
+        for i, src in enumerate(sorted(grouped)):
+            self.row[src] = i
+            self.indices.extend(sorted(grouped[src]))
+            self.indptr.append(len(self.indices))
+
+    def neighbors(self, node: int):
+        i = self.row.get(node)
+        if i is None:
+            return ()
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def nodes(self):
+        return self.row.keys()
+
+
+class MembershipGraph:
+    def __init__(self, compact_ratio: float = 0.05):
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._built = False
+        self._reset(())
+
+    def _reset(self, edges):
+        edges = list(edges)
+        self._by_farmer = _CSR(edges)
+        self._by_coop = _CSR((c, f) for f, c in edges)
+        self._base_edges = len(edges)
+        self._added: Set[Tuple[int, int]] = set()
+        self._removed: Set[Tuple[int, int]] = set()
+        self._added_f: Dict[int, Set[int]] = defaultdict(set)
+        self._added_c: Dict[int, Set[int]] = defaultdict(set)
+
+    # -- building and maintenance -------------------------------------------
+
+    def rebuild(self, session: Session):
+        rows = session.execute(select(Membership.farmer_id, Membership.cooperative_id))
+        with self._lock:
+            self._reset((f, c) for f, c in rows)
+            self._built = True
+
+    def ensure(self, session: Session) -> "MembershipGraph":
+        if not self._built:
+            self.rebuild(session)
+        return self
+
+    def apply(self, added: Iterable[Tuple[int, int]] = (), removed: Iterable[Tuple[int, int]] = ()):
+        """Apply committed (farmer_id, cooperative_id) edge changes."""
+        with self._lock:
+            if not self._built:
+                return
+            for edge in removed:
+                if edge in self._added:
+                    self._added.discard(edge)
+                    self._added_f[edge[0]].discard(edge[1])
+                    self._added_c[edge[1]].discard(edge[0])
+                else:
+                    self._removed.add(edge)
+            for edge in added:
+                if edge in self._removed:
+                    self._removed.discard(edge)
+                elif edge not in self._added:
+                    self._added.add(edge)
+                    self._added_f[edge[0]].add(edge[1])
+                    self._added_c[edge[1]].add(edge[0])
+            if len(self._added) + len(self._removed) > self.compact_ratio * max(self._base_edges, 1000):
+                self._reset(self.edges())
+
+    def edges(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            out = [
+                (f, c)
+                for f in self._by_farmer.nodes()
+                for c in self._by_farmer.neighbors(f)
+                if (f, c) not in self._removed
+            ]
+            out.extend(self._added)
+            return out
+
+    # -- queries -------------------------------------------------------------
+
+    def cooperatives_of(self, farmer_id: int) -> Set[int]:
+        with self._lock:
+            coops = {c for c in self._by_farmer.neighbors(farmer_id) if (farmer_id, c) not in self._removed}
+            coops.update(self._added_f.get(farmer_id, ()))
+            return coops
+
+    def members_of(self, cooperative_id: int) -> Set[int]:
+        with self._lock:
+            farmers = {f for f in self._by_coop.neighbors(cooperative_id) if (f, cooperative_id) not in self._removed}
+            farmers.update(self._added_c.get(cooperative_id, ()))
+            return farmers
+
+    def co_members(self, farmer_id: int, min_shared: int = 1) -> Dict[int, int]:
+        """Other farmers sharing at least ``min_shared`` cooperatives with ``farmer_id``."""
+        counts: Dict[int, int] = defaultdict(int)
+        for c in self.cooperatives_of(farmer_id):
+            for f in self.members_of(c):
+                if f != farmer_id:
+                    counts[f] += 1
+        return {f: n for f, n in counts.items() if n >= min_shared}
+
+    def overlapping_cooperatives(self, cooperative_id: int, min_shared: int = 1) -> Dict[int, int]:
+        """Other cooperatives with at least ``min_shared`` members in common."""
+        counts: Dict[int, int] = defaultdict(int)
+        for f in self.members_of(cooperative_id):
+            for c in self.cooperatives_of(f):
+                if c != cooperative_id:
+                    counts[c] += 1
+        return {c: n for c, n in counts.items() if n >= min_shared}
+
+    def connected_components(self) -> List[Set[int]]:
+        """Groups of farmers linked through shared cooperatives (union-find)."""
+        parent: Dict[int, int] = {}
+
+        def find(x):
+            root = x
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        with self._lock:
+            coops = set(self._by_coop.nodes()) | set(self._added_c)
+        for c in coops:
+            members = self.members_of(c)
+            if not members:
+                continue
+            first = None
+            for f in members:
+                parent.setdefault(f, f)
+                if first is None:
+                    first = find(f)
+                    continue
+                root = find(f)
+                if root != first:
+                    parent[root] = first
+
+        groups: Dict[int, Set[int]] = defaultdict(set)
+        for f in parent:
+            groups[find(f)].add(f)
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def invalidate(self):
+        """Drop the index; the next ``ensure`` rebuilds it from the database."""
+        with self._lock:
+            self._built = False
+            self._reset(())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "farmers": len(self._by_farmer.row),
+                "cooperatives": len(self._by_coop.row),
+                "edges": self._base_edges - len(self._removed) + len(self._added),
+                "overlay": len(self._added) + len(self._removed),
+            }
+
+
+_graphs: Dict[str, MembershipGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def graph_for(session: Session) -> MembershipGraph:
+    """The (lazily built) graph of the session's database."""
+    conn = session.connection()
+    url = str(conn.engine.url)
+    version = conn.exec_driver_sql("PRAGMA data_version").scalar()
+    seen = conn.info.get(_DATA_VERSION_KEY)
+    conn.info[_DATA_VERSION_KEY] = version
+    with _graphs_lock:
+        graph = _graphs.get(url)
+        if graph is None:
+            graph = _graphs[url] = MembershipGraph()
+        elif seen != version:
+            # Changed by another connection since this one last looked, or a
+            # connection we have no earlier reading for: either way, rebuild.
+            graph.invalidate()
+    return graph.ensure(session)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    added, removed = session.info.setdefault(_PENDING_KEY, (set(), set()))
+    for obj in session.new:
+        if isinstance(obj, Membership):
+            added.add((obj.farmer_id, obj.cooperative_id))
+    for obj in session.deleted:
+        if isinstance(obj, Membership):
+            removed.add((obj.farmer_id, obj.cooperative_id))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if orm_execute_state.statement.table.name == Membership.__tablename__:
+            orm_execute_state.session.info[_STALE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    stale = session.info.pop(_STALE_KEY, False)
+    if not (pending or stale):
+        return
+    graph = _graphs.get(str(session.get_bind().url))
+    if graph is None:
+        return
+    if stale:
+        graph.invalidate()
+    else:
+        added, removed = pending
+        graph.apply(added=added - removed, removed=removed - added)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard(session, previous_transaction):
+    if previous_transaction.nested:
+        # We cannot tell which pending edges the savepoint covered.
+        if session.info.get(_PENDING_KEY):
+            session.info[_STALE_KEY] = True
+    else:
+        session.info.pop(_PENDING_KEY, None)
+        session.info.pop(_STALE_KEY, None)
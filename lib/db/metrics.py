@@ -0,0 +1,404 @@
+"""Latency histograms and counters, exported in Prometheus text format.
+
+``install()`` instruments the process: model methods (``create``,
+``get_all``, ``find_by_name``, ``find_by_id``, ``delete``,
+``update_progress``), session commits, rows read and SQLite write-lock
+waits.  Rows read counts ORM entity loads plus the rows the read-model
+methods (``list_rows``, ``list_view``, ``page``, ...) return, including
+``list_rows`` results served from the query cache.  Until it is called nothing is wrapped or listened to.  The CLI also
+times each menu action (``ActionTimer``), leaving out the time spent waiting
+at prompts.
+
+Histograms have fixed buckets and their label sets are created up front, so
+an observation is a ``bisect`` and two in-place additions with no
+allocation.  ``render()`` produces the exposition text; ``FileExporter``
+rewrites a file with it every few seconds (for node_exporter's textfile
+collector) and ``serve(port)`` answers ``GET /metrics`` on localhost.
+
+Lock waits: with SQLite's deferred transactions the write lock is taken by
+the first INSERT/UPDATE/DELETE of a transaction, so the duration of that
+statement is recorded as ``smartfarm_lock_wait_seconds``.  Under contention
+it is almost all time spent in SQLite's busy handler.  Writes that gave up
+with "database is locked" are counted in ``smartfarm_lock_errors_total``.
+"""
+
+import builtins
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MODEL_METHODS = ("create", "get_all", "find_by_name", "find_by_id", "delete", "update_progress")
+# Return plain row tuples, so the ORM "load" event never sees their rows.
+READ_METHODS = ("list_rows", "list_view", "detail_view", "page", "active_on", "overlapping", "running_between")
+
+_COMMIT_KEY = "metrics_commit_started"
+_WRITE_LOCK_KEY = "metrics_write_lock_held"
+_WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)     # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The child for ``values``; keep it rather than calling this per observation."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        names = self.labelnames + ("le",)
+        lines, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{self.name}_bucket{_label_text(names, values + (le,))} {running}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+
+action_seconds = Histogram("smartfarm_action_seconds", "CLI menu action latency, excluding prompt waits.",
+                           ("menu", "choice"))
+model_call_seconds = Histogram("smartfarm_model_call_seconds", "Model method latency.", ("model", "method"))
+model_errors = Counter("smartfarm_model_errors_total", "Model method calls that raised.", ("model", "method"))
+commit_seconds = Histogram("smartfarm_commit_seconds", "Session commit latency, including the final flush.")
+rows_read = Counter("smartfarm_rows_read_total", "Model rows loaded by the ORM or returned by read-model methods.",
+                    ("model",))
+lock_wait_seconds = Histogram("smartfarm_lock_wait_seconds",
+                              "Duration of the statement that takes SQLite's write lock.")
+lock_errors = Counter("smartfarm_lock_errors_total", "Statements that failed with 'database is locked'.")
+
+METRICS: List[_Metric] = [action_seconds, model_call_seconds, model_errors, commit_seconds, rows_read,
+                          lock_wait_seconds, lock_errors]
+
+
+def _cache_lines() -> List[str]:
+    from . import query_cache, statement_cache
+    from .database import SessionLocal
+
+    lines = []
+    for prefix, stats in (("smartfarm_query_cache", query_cache.stats()),
+                          ("smartfarm_compiled_cache", statement_cache.stats(SessionLocal.kw["bind"]))):
+        for key, value in stats.items():
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {_number(value)}")
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(_cache_lines())
+    return "\n".join(lines) + "\n"
+
+
+# -- instrumentation --------------------------------------------------------------
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def _timed(func: Callable, model: str, method: str) -> Callable:
+    hist = model_call_seconds.labels(model, method)
+    errors = model_errors.labels(model, method)
+    clock = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            hist.observe(clock() - start)
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+def _counted(func: Callable, counter) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if result is not None:
+            # A single-row view (detail_view) is itself a named tuple.
+            counter.inc(1 if hasattr(result, "_fields") else len(result))
+        return result
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+def _instrument_models():
+    from .models import Base
+
+    for mapper in Base.registry.mappers:
+        cls = mapper.class_
+        for method in MODEL_METHODS:
+            attr = cls.__dict__.get(method)
+            if isinstance(attr, classmethod) and not getattr(attr.__func__, "__metrics_wrapped__", False):
+                setattr(cls, method, classmethod(_timed(attr.__func__, cls.__name__, method)))
+            elif callable(attr) and not getattr(attr, "__metrics_wrapped__", False):
+                setattr(cls, method, _timed(attr, cls.__name__, method))
+        counter = rows_read.labels(cls.__name__)
+        for method in READ_METHODS:
+            attr = cls.__dict__.get(method)
+            if isinstance(attr, classmethod) and not getattr(attr.__func__, "__metrics_wrapped__", False):
+                setattr(cls, method, classmethod(_counted(attr.__func__, counter)))
+        event.listen(cls, "load", lambda target, context, counter=counter: counter.inc())
+
+
+def _before_commit(session):
+    session.info.setdefault(_COMMIT_KEY, time.perf_counter())
+
+
+def _after_commit(session):
+    started = session.info.pop(_COMMIT_KEY, None)
+    if started is not None:
+        commit_seconds.observe(time.perf_counter() - started)
+
+
+def _after_rollback(session):
+    session.info.pop(_COMMIT_KEY, None)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if not conn.info.get(_WRITE_LOCK_KEY) and statement.lstrip()[:7].upper().startswith(_WRITES):
+        conn.info[_WRITE_LOCK_KEY] = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get(_WRITE_LOCK_KEY)
+    if started is not None and started is not True:
+        lock_wait_seconds.observe(time.perf_counter() - started)
+        conn.info[_WRITE_LOCK_KEY] = True
+
+
+def _end_transaction(conn):
+    conn.info.pop(_WRITE_LOCK_KEY, None)
+
+
+def _handle_error(context):
+    exc = context.sqlalchemy_exception
+    if isinstance(exc, OperationalError) and "locked" in str(exc.orig):
+        lock_errors.inc()
+    if context.connection is not None:
+        context.connection.info.pop(_WRITE_LOCK_KEY, None)
+
+
+def install():
+    """Start recording.  Safe to call more than once."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _instrument_models()
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+        event.listen(Engine, "commit", _end_transaction)
+        event.listen(Engine, "rollback", _end_transaction)
+        event.listen(Engine, "handle_error", _handle_error)
+        _installed = True
+
+
+class ActionTimer:
+    """Times CLI menu actions; use ``on_choice`` as the helpers' action hook.
+
+    An action runs from one menu choice to the next.  Time spent inside
+    ``input()`` (the user typing) is subtracted, so what remains is the time
+    the user waited on the program.
+    """
+
+    def __init__(self):
+        self._current: Optional[tuple] = None
+        self._started = 0.0
+        self._prompt = 0.0
+        self._input = None
+
+    def start(self):
+        # Wrap whatever is installed now, e.g. another watcher's wrapper.
+        original = self._input = builtins.input
+
+        def timed_input(*args):
+            start = time.perf_counter()
+            try:
+                return original(*args)
+            finally:
+                self._prompt += time.perf_counter() - start
+
+        builtins.input = timed_input
+
+    def on_choice(self, menu: str, choice: str):
+        self._finish()
+        self._current = (menu, choice or "blank")
+        self._started = time.perf_counter()
+        self._prompt = 0.0
+
+    def close(self):
+        self._finish()
+        if self._input is not None:
+            builtins.input = self._input
+
+    def _finish(self):
+        if self._current is None:
+            return
+        action_seconds.labels(*self._current).observe(max(0.0, time.perf_counter() - self._started - self._prompt))
+        self._current = None
+
+
+# -- export -----------------------------------------------------------------------
+
+def write_file(path):
+    """Atomically replace ``path`` with the current exposition text."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(render())
+    os.replace(tmp, path)
+
+
+class FileExporter(threading.Thread):
+    def __init__(self, path, interval: float = 15.0):
+        super().__init__(name="metrics-file", daemon=True)
+        self.path = path
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            write_file(self.path)
+
+    def close(self):
+        self._stopping.set()
+        write_file(self.path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Answer ``GET /metrics`` on ``host:port`` from a daemon thread; ``shutdown()`` stops it."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,82 @@
+"""dictionary-encode roles, categories, units and payment methods
+
+Revision ID: 0001_lookups
+Revises:
+Create Date: 2026-10-19 09:00:00
+
+Replaces five free-text columns with small-integer references to the new
+``lookups`` table.  Databases created by ``init_db`` already have the new
+layout, so every step checks the current schema first and the revision is a
+no-op there.  Existing strings are encoded by ``lib.db.lookups.encode_column``
+in rowid windows, each committed on its own outside the migration's
+transaction so clerks are not locked out; spellings that differ only in
+case or spacing ("Member", "member ") end up as one lookup.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from lib.db.lookups import encode_column
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_lookups"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, old string column, new id column, lookup kind)
+ENCODED = (
+    ("memberships", "role", "role_id", "membership_role"),
+    ("farmer_activities", "role", "role_id", "activity_role"),
+    ("product_types", "category", "category_id", "product_category"),
+    ("product_types", "typical_unit", "unit_id", "unit"),
+    ("buyers", "preferred_payment_method", "payment_method_id", "payment_method"),
+)
+BATCH_SIZE = 5000
+
+
+def _columns(table: str):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {c["name"] for c in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("lookups"):
+        op.create_table(
+            "lookups",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("kind", sa.String(30), nullable=False),
+            sa.Column("key", sa.String(100), nullable=False),
+            sa.Column("value", sa.String(100), nullable=False),
+            sa.UniqueConstraint("kind", "key"),
+        )
+
+    for table, old, new, kind in ENCODED:
+        columns = _columns(table)
+        if columns is None or old not in columns:
+            continue
+        if new not in columns:
+            op.add_column(table, sa.Column(new, sa.SmallInteger, nullable=True))
+        # Commit the new column, then encode in short transactions of its own.
+        with op.get_context().autocommit_block():
+            encode_column(bind.engine, table, old, new, kind, batch_size=BATCH_SIZE)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_foreign_key(f"fk_{table}_{new}", "lookups", [new], ["id"])
+            batch_op.drop_column(old)
+
+
+def downgrade() -> None:
+    for table, old, new, kind in ENCODED:
+        columns = _columns(table)
+        if columns is None or new not in columns:
+            continue
+        if old not in columns:
+            op.add_column(table, sa.Column(old, sa.String(50), nullable=True))
+        op.execute(f"UPDATE {table} SET {old} = (SELECT value FROM lookups WHERE lookups.id = {table}.{new})")
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(new)
+    op.drop_table("lookups")
@@ -0,0 +1,27 @@
+"""index farmer_activities by (farmer_id, activity_id)
+
+Revision ID: 0002_fa_index
+Revises: 0001_lookups
+Create Date: 2026-10-19 14:00:00
+
+Bulk progress updates match rows on the pair; without the index every
+staged row scans the whole table.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_fa_index"
+down_revision: Union[str, None] = "0001_lookups"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_farmer_activities_farmer_activity", "farmer_activities",
+                    ["farmer_id", "activity_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_farmer_activities_farmer_activity", table_name="farmer_activities", if_exists=True)
@@ -0,0 +1,41 @@
+"""index sales by (farmer|buyer|product_type_id, created_at) and created_at
+
+Revision ID: 0003_sales_search
+Revises: 0002_fa_index
+Create Date: 2026-10-19 15:00:00
+
+Sales searches filter on a farmer, buyer or product plus a date range and
+page newest first.  The composite indexes serve both the filter and the
+order; the single-column farmer, buyer and product indexes are their
+prefixes and go.  (farmer_id, created_at) was added to the model with the
+sync work, but ``create_all`` never adds indexes to an existing table.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_sales_search"
+down_revision: Union[str, None] = "0002_fa_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_sales_farmer_created", "sales", ["farmer_id", "created_at"], if_not_exists=True)
+    op.create_index("ix_sales_buyer_created", "sales", ["buyer_id", "created_at"], if_not_exists=True)
+    op.create_index("ix_sales_product_created", "sales", ["product_type_id", "created_at"], if_not_exists=True)
+    op.create_index("ix_sales_created", "sales", ["created_at"], if_not_exists=True)
+    op.drop_index("ix_sales_farmer_id", table_name="sales", if_exists=True)
+    op.drop_index("ix_sales_buyer_id", table_name="sales", if_exists=True)
+    op.drop_index("ix_sales_product_type_id", table_name="sales", if_exists=True)
+
+
+def downgrade() -> None:
+    # ix_sales_farmer_created predates this revision in the model, so it stays.
+    op.create_index("ix_sales_farmer_id", "sales", ["farmer_id"], if_not_exists=True)
+    op.create_index("ix_sales_product_type_id", "sales", ["product_type_id"], if_not_exists=True)
+    op.create_index("ix_sales_buyer_id", "sales", ["buyer_id"], if_not_exists=True)
+    op.drop_index("ix_sales_created", table_name="sales", if_exists=True)
+    op.drop_index("ix_sales_product_created", table_name="sales", if_exists=True)
+    op.drop_index("ix_sales_buyer_created", table_name="sales", if_exists=True)
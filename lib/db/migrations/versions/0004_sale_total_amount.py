@@ -0,0 +1,58 @@
+"""add sales.total_amount (quantity * price), backfilled online
+
+Revision ID: 0004_sale_total
+Revises: 0003_sales_search
+Create Date: 2026-10-19 16:00:00
+
+The column is added and committed first; the backfill then runs outside the
+migration's transaction in short, throttled, checkpointed batches (see
+``lib.db.backfill``), so the CLI keeps working while it runs and an
+interrupted upgrade resumes where it stopped when re-run.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from lib.db import backfill
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_sale_total"
+down_revision: Union[str, None] = "0003_sales_search"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("backfill_progress"):
+        op.create_table(
+            "backfill_progress",
+            sa.Column("name", sa.String(100), primary_key=True),
+            sa.Column("table_name", sa.String(100), nullable=False),
+            sa.Column("last_key", sa.Integer, nullable=True),
+            sa.Column("max_key", sa.Integer, nullable=True),
+            sa.Column("rows_updated", sa.Integer, nullable=False),
+            sa.Column("repaired", sa.Integer, nullable=False),
+            sa.Column("started_at", sa.DateTime),
+            sa.Column("updated_at", sa.DateTime),
+            sa.Column("finished_at", sa.DateTime, nullable=True),
+            sa.Column("verified_at", sa.DateTime, nullable=True),
+        )
+    if "total_amount" not in {c["name"] for c in inspector.get_columns("sales")}:
+        op.add_column("sales", sa.Column("total_amount", sa.Float, nullable=True))
+
+    with op.get_context().autocommit_block():
+        report = backfill.run(
+            op.get_bind().engine, backfill.SALE_TOTAL_AMOUNT,
+            on_batch=lambda key, high, rows: print(f"  sales.total_amount: id {key}/{high}, {rows} rows", flush=True),
+        )
+    print(f"  sales.total_amount: {report.rows_updated} rows in {report.seconds:.1f}s"
+          + (f", {report.repaired} repaired on verify" if report.repaired else ""))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("sales") as batch_op:
+        batch_op.drop_column("total_amount")
+    op.execute(sa.text("DELETE FROM backfill_progress WHERE name = :name").bindparams(
+        name=backfill.SALE_TOTAL_AMOUNT.name))
@@ -0,0 +1,45 @@
+"""add sales.sync_key, the key sales are synced between offices by
+
+Revision ID: 0005_sale_sync_key
+Revises: 0004_sale_total
+Create Date: 2026-10-19 18:00:00
+
+Sync used to match sales on (farmer, buyer, product, date, quantity, price),
+so editing a sale replicated as a second one.  New sales get a UUID;
+existing ones get a key derived from that old natural key (see
+``backfill.SALE_SYNC_KEY``), which is the same in every office that already
+holds the sale.  The backfill runs online like 0004's.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from lib.db import backfill
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_sale_sync_key"
+down_revision: Union[str, None] = "0004_sale_total"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if "sync_key" not in {c["name"] for c in sa.inspect(op.get_bind()).get_columns("sales")}:
+        op.add_column("sales", sa.Column("sync_key", sa.String(255), nullable=True))
+    op.create_index("ix_sales_sync_key", "sales", ["sync_key"], if_not_exists=True)
+
+    with op.get_context().autocommit_block():
+        report = backfill.run(
+            op.get_bind().engine, backfill.SALE_SYNC_KEY,
+            on_batch=lambda key, high, rows: print(f"  sales.sync_key: id {key}/{high}, {rows} rows", flush=True),
+        )
+    print(f"  sales.sync_key: {report.rows_updated} rows in {report.seconds:.1f}s")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sales_sync_key", table_name="sales", if_exists=True)
+    with op.batch_alter_table("sales") as batch_op:
+        batch_op.drop_column("sync_key")
+    op.execute(sa.text("DELETE FROM backfill_progress WHERE name = :name").bindparams(
+        name=backfill.SALE_SYNC_KEY.name))
@@ -1,4 +1,5 @@
 from .base import Base
+from .lookup import Lookup
 from .activity import Activity
 from .farmer import Farmer
 from .buyer import Buyer
@@ -7,9 +8,15 @@ from .sale import Sale
 from .farmer_activity import FarmerActivity
 from .cooperative import Cooperative
 from .membership import Membership
+from .sales_sketch import SalesSketch
+from .sales_summary import SalesSummary
+from .change_journal import ChangeJournal, JournalConsumer
+from .ingest import IngestCheckpoint, IngestedEvent
+from .backfill import BackfillProgress
 
 __all__ = [
     "Base",
+    "Lookup",
     "Activity",
     "Farmer",
     "Buyer",
@@ -18,6 +25,13 @@ __all__ = [
     "FarmerActivity",
     "Cooperative",
     "Membership",
+    "SalesSketch",
+    "SalesSummary",
+    "ChangeJournal",
+    "JournalConsumer",
+    "IngestCheckpoint",
+    "IngestedEvent",
+    "BackfillProgress",
 ]
 
 
@@ -1,8 +1,13 @@
 from datetime import date
-from typing import List, Optional, TYPE_CHECKING
-from sqlalchemy import Column, Integer, String, Text, Date
+from typing import List, Optional, Tuple, TYPE_CHECKING
+from sqlalchemy import Column, Integer, String, Text, Date, func, select
 from sqlalchemy.orm import relationship, validates, Session
+from ..batch import commit
+from .. import statement_cache
+from ..query_cache import query_cache
+from .activity_period import overlapping_ids
 from .base import Base
+from .rows import ActivityRow, ActivityDetail
 
 if TYPE_CHECKING:
     from .farmer import Farmer
@@ -31,17 +36,58 @@ class Activity(Base):
     def create(cls, session: Session, **kwargs) -> 'Activity':
         a = cls(**kwargs)
         session.add(a)
-        session.commit()
+        commit(session)
         return a
 
     @classmethod
     def get_all(cls, session: Session) -> List['Activity']:
         return session.query(cls).order_by(cls.id).all()
 
+    @classmethod
+    def list_select(cls):
+        return select(cls.id, cls.name, cls.start_date, cls.end_date).order_by(cls.id)
+
+    @classmethod
+    def list_rows(cls, session: Session) -> Tuple[tuple, ...]:
+        """Cached (id, name, start_date, end_date) rows."""
+        return query_cache.fetch(session, cls.list_select())
+
+    @classmethod
+    def list_view(cls, session: Session) -> List[ActivityRow]:
+        return [ActivityRow._make(r) for r in session.execute(cls.list_select())]
+
+    @classmethod
+    def active_on(cls, session: Session, day: date) -> List[ActivityRow]:
+        """Activities whose period contains ``day`` (R*Tree stabbing query)."""
+        return cls.overlapping(session, day, day)
+
+    @classmethod
+    def overlapping(cls, session: Session, start: date, end: date) -> List[ActivityRow]:
+        """Activities whose period overlaps ``[start, end]``, earliest first."""
+        stmt = (
+            select(cls.id, cls.name, cls.start_date, cls.end_date)
+            .where(cls.id.in_(overlapping_ids(start, end)))
+            .order_by(cls.start_date, cls.id)
+        )
+        return [ActivityRow._make(r) for r in session.execute(stmt)]
+
+    @classmethod
+    def detail_view(cls, session: Session, id_: int) -> Optional[ActivityDetail]:
+        from .farmer import Farmer
+
+        farmer_count = (
+            select(func.count(Farmer.id)).where(Farmer.activity_id == cls.id).scalar_subquery()
+        )
+        stmt = select(
+            cls.id, cls.name, cls.description, cls.start_date, cls.end_date, farmer_count
+        ).where(cls.id == id_)
+        row = session.execute(stmt).first()
+        return ActivityDetail._make(row) if row else None
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int) -> Optional['Activity']:
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
@@ -0,0 +1,74 @@
+"""R*Tree interval index over ``activities.start_date``/``end_date``.
+
+``activity_periods`` is an SQLite R*Tree virtual table holding each
+activity's period as Julian day numbers.  Triggers on ``activities`` keep it
+in step with every insert, update and delete (ORM, Core or another process),
+so stabbing ("active on day X") and overlap ("running this week") queries
+are index lookups instead of scans.  A missing start or end date leaves that
+side of the period open.
+
+The table and triggers are created by ``Base.metadata.create_all`` (i.e.
+``init_db``) wherever the ``activities`` table lives, and activities that
+predate them are backfilled at the same time.
+"""
+
+from datetime import date
+
+from sqlalchemy import column, event, func, select, table, text
+
+from .base import Base
+
+OPEN_START = 0.0
+OPEN_END = 1.0e9
+
+activity_periods = table("activity_periods", column("id"), column("start_day"), column("end_day"))
+
+
+def _bounds(row: str):
+    start = f"coalesce(julianday({row}.start_date), {OPEN_START})"
+    end = f"coalesce(julianday({row}.end_date), {OPEN_END})"
+    # Reversed dates are stored swapped; R*Tree rejects start > end.
+    return f"min({start}, {end})", f"max({start}, {end})"
+
+
+def _ddl():
+    lo, hi = _bounds("new")
+    backfill_lo, backfill_hi = _bounds("a")
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS activity_periods USING rtree(id, start_day, end_day)",
+        f"""CREATE TRIGGER IF NOT EXISTS activity_periods_insert AFTER INSERT ON activities BEGIN
+            INSERT INTO activity_periods (id, start_day, end_day) VALUES (new.id, {lo}, {hi});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS activity_periods_update
+            AFTER UPDATE OF id, start_date, end_date ON activities BEGIN
+            DELETE FROM activity_periods WHERE id = old.id;
+            INSERT INTO activity_periods (id, start_day, end_day) VALUES (new.id, {lo}, {hi});
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS activity_periods_delete AFTER DELETE ON activities BEGIN
+            DELETE FROM activity_periods WHERE id = old.id;
+        END""",
+        f"""INSERT INTO activity_periods (id, start_day, end_day)
+            SELECT a.id, {backfill_lo}, {backfill_hi} FROM activities AS a
+            WHERE a.id NOT IN (SELECT id FROM activity_periods)""",
+    ]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_period_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    has_activities = connection.execute(
+        text("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'activities'")
+    ).first()
+    if not has_activities:  # e.g. a shard file whose activities live in the catalog
+        return
+    for statement in _ddl():
+        connection.exec_driver_sql(statement)
+
+
+def overlapping_ids(start: date, end: date):
+    """Select the ids of activities whose period overlaps ``[start, end]``."""
+    return select(activity_periods.c.id).where(
+        activity_periods.c.start_day <= func.julianday(end),
+        activity_periods.c.end_day >= func.julianday(start),
+    )
@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime
+from .base import Base
+
+class BackfillProgress(Base):
+    """Checkpoint of a ``lib.db.backfill`` run: the last key range committed.
+
+    ``max_key`` is the table's highest key when the run started; rows added
+    after that are left to the final verification pass.
+    """
+    __tablename__ = "backfill_progress"
+
+    name = Column(String(100), primary_key=True)
+    table_name = Column(String(100), nullable=False)
+    last_key = Column(Integer, nullable=True)
+    max_key = Column(Integer, nullable=True)
+    rows_updated = Column(Integer, nullable=False, default=0)
+    repaired = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    verified_at = Column(DateTime, nullable=True)
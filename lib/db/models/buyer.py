@@ -1,8 +1,12 @@
 from typing import List, Optional, TYPE_CHECKING
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, ForeignKey, Integer, SmallInteger, String, Text, select
 from sqlalchemy.orm import relationship, Session
 
+from ..batch import commit
+from .. import statement_cache
 from .base import Base
+from .lookup import Lookup, PAYMENT_METHOD, encoded
+from .rows import BuyerRow, BuyerDetail
 
 if TYPE_CHECKING:
     from .sale import Sale
@@ -15,25 +19,44 @@ class Buyer(Base):
     contact_phone = Column(String(30))
     contact_email = Column(String(50))
     address = Column(Text)
-    preferred_payment_method = Column(String(50))
+    payment_method_id = Column(SmallInteger, ForeignKey('lookups.id'))
 
     sales = relationship('Sale', back_populates='buyer', cascade='all, delete-orphan')
+    payment_method_ref = relationship(Lookup, foreign_keys=[payment_method_id])
+    preferred_payment_method = encoded('payment_method_ref', 'payment_method_id', PAYMENT_METHOD)
 
     @classmethod
     def create(cls, session: Session, **kwargs) -> 'Buyer':
         b = cls(**kwargs)
         session.add(b)
-        session.commit()
+        commit(session)
         return b
 
     @classmethod
     def get_all(cls, session: Session) -> List['Buyer']:
         return session.query(cls).order_by(cls.id).all()
 
+    @classmethod
+    def list_select(cls):
+        return select(cls.id, cls.name, cls.organization).order_by(cls.id)
+
+    @classmethod
+    def list_view(cls, session: Session) -> List[BuyerRow]:
+        return [BuyerRow._make(r) for r in session.execute(cls.list_select())]
+
+    @classmethod
+    def detail_view(cls, session: Session, id_: int) -> Optional[BuyerDetail]:
+        stmt = select(
+            cls.id, cls.name, cls.organization, cls.contact_phone,
+            cls.contact_email, cls.address, cls.preferred_payment_method,
+        ).where(cls.id == id_)
+        row = session.execute(stmt).first()
+        return BuyerDetail._make(row) if row else None
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int) -> Optional['Buyer']:
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
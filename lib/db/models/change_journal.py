@@ -0,0 +1,37 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from .base import Base
+
+class ChangeJournal(Base):
+    """One captured insert ('I'), update ('U') or delete ('D') of a model row.
+
+    ``seq`` is AUTOINCREMENT so it is never reused, even after compaction.
+    ``row_key`` is the JSON list of primary-key values; ``data`` holds the
+    full row for inserts and deletes (the before-image) and only the
+    changed columns for updates.
+    ``origin`` is NULL for local writes, or whatever the writing session put
+    in ``session.info["journal_origin"]`` (e.g. an importer or sync peer).
+    """
+    __tablename__ = "change_journal"
+    __table_args__ = (
+        Index("ix_change_journal_row", "table_name", "row_key"),
+        Index("ix_change_journal_table_seq", "table_name", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    op = Column(String(1), nullable=False)
+    row_key = Column(String(100), nullable=False)
+    data = Column(Text, nullable=True)
+    origin = Column(String(50), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class JournalConsumer(Base):
+    """Last journal sequence number a named downstream consumer has processed."""
+    __tablename__ = "journal_consumers"
+
+    name = Column(String(50), primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,7 +1,10 @@
 from typing import List, Optional
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Integer, String, Text, select
 from sqlalchemy.orm import relationship, Session
+from ..batch import commit
+from .. import statement_cache
 from .base import Base
+from .rows import CooperativeRow
 
 class Cooperative(Base):
     __tablename__ = "cooperatives"
@@ -16,17 +19,22 @@ class Cooperative(Base):
     def create(cls, session: Session, **kwargs) -> "Cooperative":
         c = cls(**kwargs)
         session.add(c)
-        session.commit()
+        commit(session)
         return c
 
     @classmethod
     def get_all(cls, session: Session) -> List["Cooperative"]:
         return session.query(cls).order_by(cls.id).all()
 
+    @classmethod
+    def list_view(cls, session: Session) -> List[CooperativeRow]:
+        stmt = select(cls.id, cls.name).order_by(cls.id)
+        return [CooperativeRow._make(r) for r in session.execute(stmt)]
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int) -> Optional["Cooperative"]:
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
@@ -1,11 +1,15 @@
 from datetime import date
-from typing import List, Optional, TYPE_CHECKING
-from sqlalchemy import Column, Integer, String, Text, Date, ForeignKey
-from sqlalchemy.orm import relationship, validates, Session
+from typing import List, Optional, Tuple, TYPE_CHECKING
+from sqlalchemy import Column, Integer, String, Text, Date, ForeignKey, select
+from sqlalchemy.orm import relationship, validates, Session, selectinload
+from ..batch import commit
+from .. import statement_cache
+from ..query_cache import query_cache
 from .base import Base
+from .activity import Activity
+from .rows import FarmerRow, FarmerDetail
 
 if TYPE_CHECKING:
-    from .activity import Activity
     from .sale import Sale
     from .farmer_activity import FarmerActivity
     from .cooperative import Cooperative
@@ -39,16 +43,59 @@ class Farmer(Base):
     def create(cls, session: Session, **kwargs) -> 'Farmer':
         f = cls(**kwargs)
         session.add(f)
-        session.commit()
+        commit(session)
         return f
 
     @classmethod
     def get_all(cls, session: Session) -> List['Farmer']:
         return session.query(cls).order_by(cls.id).all()
 
+    @classmethod
+    def list_select(cls):
+        return (
+            select(cls.id, cls.name, cls.national_id, Activity.name)
+            .outerjoin(Activity, cls.activity_id == Activity.id)
+            .order_by(cls.id)
+        )
+
+    @classmethod
+    def list_rows(cls, session: Session) -> Tuple[tuple, ...]:
+        """Cached (id, name, national_id, activity name) rows."""
+        return query_cache.fetch(session, cls.list_select())
+
+    @classmethod
+    def list_view(cls, session: Session) -> List[FarmerRow]:
+        return [FarmerRow._make(r) for r in session.execute(cls.list_select())]
+
+    @classmethod
+    def detail_view(cls, session: Session, id_: int) -> Optional[FarmerDetail]:
+        stmt = (
+            select(cls.id, cls.name, cls.farm_name, cls.national_id, cls.phone, cls.email, Activity.name)
+            .outerjoin(Activity, cls.activity_id == Activity.id)
+            .where(cls.id == id_)
+        )
+        row = session.execute(stmt).first()
+        return FarmerDetail._make(row) if row else None
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int) -> Optional['Farmer']:
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
+
+    @classmethod
+    def find_with_links(cls, session: Session, id_: int) -> Optional['Farmer']:
+        """Farmer with memberships/cooperatives and activities loaded up front."""
+        from .farmer_activity import FarmerActivity
+        from .membership import Membership
+
+        stmt = (
+            select(cls)
+            .where(cls.id == id_)
+            .options(
+                selectinload(cls.memberships).joinedload(Membership.cooperative),
+                selectinload(cls.farmer_activities).joinedload(FarmerActivity.activity),
+            )
+        )
+        return session.execute(stmt).scalars().first()
 
     @classmethod
     def find_by_name(cls, session: Session, name: str) -> List['Farmer']:
@@ -56,4 +103,4 @@ class Farmer(Base):
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
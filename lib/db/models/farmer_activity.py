@@ -1,22 +1,32 @@
 from datetime import date, datetime
-from typing import Optional
-from sqlalchemy import Column, Integer, ForeignKey, Date, DateTime, String, Text, Float
+from typing import List, Optional
+from sqlalchemy import Column, Integer, ForeignKey, Date, DateTime, Index, SmallInteger, Text, Float, bindparam, select
 from sqlalchemy.orm import relationship, Session
+from ..batch import commit
+from .. import statement_cache
 from .base import Base
+from .activity import Activity
+from .farmer import Farmer
+from .lookup import Lookup, ACTIVITY_ROLE, encoded
+from .activity_period import overlapping_ids
+from .rows import FarmerActivityRow, ParticipationRow
 
 class FarmerActivity(Base):
     __tablename__ = "farmer_activities"
+    __table_args__ = (Index("ix_farmer_activities_farmer_activity", "farmer_id", "activity_id"),)
 
     id = Column(Integer, primary_key=True)
     farmer_id = Column(Integer, ForeignKey("farmers.id"), nullable=False)
     activity_id = Column(Integer, ForeignKey("activities.id"), nullable=False)
     joined_on = Column(Date, default=date.today)
-    role = Column(String(50), default="participant")  
+    role_id = Column(SmallInteger, ForeignKey("lookups.id"))
     progress_percent = Column(Float, default=0.0)     
     notes = Column(Text, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     farmer = relationship("Farmer", back_populates="farmer_activities")
     activity = relationship("Activity", back_populates="farmer_activities")
+    role_ref = relationship(Lookup, foreign_keys=[role_id])
+    role = encoded("role_ref", "role_id", ACTIVITY_ROLE, default="participant")
 
     @classmethod
     def create(cls, session: Session, farmer, activity,
@@ -33,24 +43,47 @@ class FarmerActivity(Base):
             notes=notes,
         )
         session.add(fa)
-        session.commit()
+        commit(session)
         return fa
 
+    @classmethod
+    def list_view(cls, session: Session) -> List[FarmerActivityRow]:
+        stmt = (
+            select(cls.id, Farmer.name, Activity.name)
+            .outerjoin(Farmer, cls.farmer_id == Farmer.id)
+            .outerjoin(Activity, cls.activity_id == Activity.id)
+            .order_by(cls.id)
+        )
+        return [FarmerActivityRow._make(r) for r in session.execute(stmt)]
+
+    @classmethod
+    def running_between(cls, session: Session, start: date, end: date) -> List[ParticipationRow]:
+        """Farmers taking part in an activity whose period overlaps ``[start, end]``."""
+        stmt = (
+            select(Farmer.id, Farmer.name, Activity.name, Activity.start_date, Activity.end_date,
+                   cls.role, cls.progress_percent)
+            .join(Farmer, cls.farmer_id == Farmer.id)
+            .join(Activity, cls.activity_id == Activity.id)
+            .where(cls.activity_id.in_(overlapping_ids(start, end)))
+            .order_by(Activity.start_date, Activity.name, Farmer.name)
+        )
+        return [ParticipationRow._make(r) for r in session.execute(stmt)]
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int):
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
 
     @classmethod
     def list_for_farmer(cls, session: Session, farmer_id: int):
-        return session.query(cls).filter(cls.farmer_id == farmer_id).all()
+        return session.scalars(_BY_FARMER, {"farmer_id": farmer_id}).all()
 
     @classmethod
     def list_for_activity(cls, session: Session, activity_id: int):
-        return session.query(cls).filter(cls.activity_id == activity_id).all()
+        return session.scalars(_BY_ACTIVITY, {"activity_id": activity_id}).all()
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
 
     def update_progress(self, session: Session, new_percent: float, notes: Optional[str] = None):
         self.progress_percent = float(new_percent)
@@ -58,5 +91,10 @@ class FarmerActivity(Base):
             self.notes = notes
         self.last_updated = datetime.utcnow()
         session.add(self)
-        session.commit()
+        commit(session)
         return self
+
+
+# Built once; see lib/db/statement_cache.py.
+_BY_FARMER = select(FarmerActivity).where(FarmerActivity.farmer_id == bindparam("farmer_id"))
+_BY_ACTIVITY = select(FarmerActivity).where(FarmerActivity.activity_id == bindparam("activity_id"))
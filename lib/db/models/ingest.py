@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime
+from .base import Base
+
+class IngestCheckpoint(Base):
+    """Byte offset up to which a spool file has been ingested and committed.
+
+    ``inode`` identifies the file the offset belongs to, so a rotated or
+    replaced spool starts again from the beginning.
+    """
+    __tablename__ = "ingest_checkpoints"
+
+    source = Column(String(200), primary_key=True)
+    offset = Column(Integer, nullable=False, default=0)
+    inode = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class IngestedEvent(Base):
+    """Content hash of every ingested event, so a replayed event is skipped."""
+    __tablename__ = "ingested_events"
+
+    hash = Column(String(64), primary_key=True)
+    sale_id = Column(Integer, nullable=True)
+    source = Column(String(200), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
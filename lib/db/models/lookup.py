@@ -0,0 +1,124 @@
+"""Dictionary-encoded string columns.
+
+Low-cardinality strings (roles, categories, units, payment methods) are
+stored once in ``lookups`` and referenced by small integer ids.  Values are
+matched case- and whitespace-insensitively, so "Member", "member " and
+"MEMBER" share one row; the display value is the first spelling recorded.
+
+A model declares the id column, a many-to-one to ``Lookup`` and a string
+property of the old name:
+
+    role_id = Column(SmallInteger, ForeignKey("lookups.id"))
+    role_ref = relationship(Lookup, foreign_keys=[role_id])
+    role = encoded("role_ref", "role_id", MEMBERSHIP_ROLE, default="Member")
+
+``obj.role`` reads and writes plain strings, ``Model.role == "member"``
+filters by id, and ``select(Model.role)`` projects the string.  New values
+are registered by ``lib.db.lookups`` when the session flushes.
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Column, Integer, String, UniqueConstraint, inspect, select
+from sqlalchemy.ext.hybrid import Comparator, hybrid_property
+
+from .base import Base
+
+MEMBERSHIP_ROLE = "membership_role"
+ACTIVITY_ROLE = "activity_role"
+PRODUCT_CATEGORY = "product_category"
+UNIT = "unit"
+PAYMENT_METHOD = "payment_method"
+
+
+
+class EncodedColumn(NamedTuple):
+    ref: str
+    id_column: str
+    kind: str
+    default: Optional[str]
+
+
+def normalize(value: str) -> str:
+    return " ".join(str(value).split()).casefold()
+
+
+class Lookup(Base):
+    __tablename__ = "lookups"
+    __table_args__ = (UniqueConstraint("kind", "key"),)
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(30), nullable=False)
+    key = Column(String(100), nullable=False)
+    value = Column(String(100), nullable=False)
+
+    # Set on placeholders made by the property setters; swapped on flush.
+    pending = False
+
+    @classmethod
+    def placeholder(cls, kind: str, value: str) -> "Lookup":
+        value = " ".join(str(value).split())
+        obj = cls(kind=kind, key=normalize(value), value=value)
+        obj.pending = True
+        return obj
+
+
+class _LookupComparator(Comparator):
+    def __init__(self, id_column, kind: str):
+        self.id_column = id_column
+        self.kind = kind
+        super().__init__(
+            select(Lookup.value).where(Lookup.id == id_column).correlate_except(Lookup).scalar_subquery()
+        )
+
+    def _ids(self, values):
+        return select(Lookup.id).where(Lookup.kind == self.kind, Lookup.key.in_([normalize(v) for v in values]))
+
+    def __eq__(self, other):
+        if other is None:
+            return self.id_column.is_(None)
+        if isinstance(other, str):
+            return self.id_column.in_(self._ids([other]))
+        return self.expression == other
+
+    def __ne__(self, other):
+        if other is None:
+            return self.id_column.is_not(None)
+        if isinstance(other, str):
+            return self.id_column.not_in(self._ids([other]))
+        return self.expression != other
+
+    def in_(self, values: List[str]):
+        return self.id_column.in_(self._ids(values))
+
+
+def encoded(ref: str, id_column: str, kind: str, default: Optional[str] = None) -> hybrid_property:
+    def fget(self):
+        lookup = getattr(self, ref)
+        return lookup.value if lookup is not None else None
+
+    def fset(self, value):
+        setattr(self, ref, None if value is None or not str(value).strip() else Lookup.placeholder(kind, value))
+
+    def expr(cls):
+        return _LookupComparator(getattr(cls, id_column), kind)
+
+    prop = hybrid_property(fget, fset, custom_comparator=expr)
+    prop.lookup_spec = EncodedColumn(ref, id_column, kind, default)
+    return prop
+
+
+_encoded_cache: Dict[type, Dict[str, EncodedColumn]] = {}
+
+
+def encoded_properties(cls) -> Dict[str, EncodedColumn]:
+    """``{property name: EncodedColumn}`` for the ``encoded`` properties of a mapped class."""
+    found = _encoded_cache.get(cls)
+    if found is None:
+        found = {
+            name: desc.lookup_spec
+            for name, desc in inspect(cls).all_orm_descriptors.items()
+            if getattr(desc, "lookup_spec", None) is not None
+        }
+        _encoded_cache[cls] = found
+    return found
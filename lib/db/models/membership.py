@@ -1,8 +1,13 @@
 from datetime import date, datetime
-from typing import Optional
-from sqlalchemy import Column, Integer, ForeignKey, Date, DateTime, String, Text
-from sqlalchemy.orm import relationship
+from typing import List, Optional, Tuple
+from sqlalchemy import Column, Integer, ForeignKey, Date, DateTime, SmallInteger, String, Text, bindparam, select
+from sqlalchemy.orm import relationship, Session
+from ..query_cache import query_cache
 from .base import Base
+from .cooperative import Cooperative
+from .farmer import Farmer
+from .lookup import Lookup, MEMBERSHIP_ROLE, encoded
+from .rows import MembershipRow
 
 class Membership(Base):
     __tablename__ = "memberships"
@@ -10,9 +15,39 @@ class Membership(Base):
     cooperative_id = Column(Integer, ForeignKey("cooperatives.id"), primary_key=True)
     farmer_id = Column(Integer, ForeignKey("farmers.id"), primary_key=True)
     joined_on = Column(Date, default=date.today)
-    role = Column(String(50), default="member")
+    role_id = Column(SmallInteger, ForeignKey("lookups.id"))
     approved_by = Column(String(100), nullable=True)  
     notes = Column(Text, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     cooperative = relationship("Cooperative", back_populates="memberships")
     farmer = relationship("Farmer", back_populates="memberships")
+    role_ref = relationship(Lookup, foreign_keys=[role_id])
+    role = encoded("role_ref", "role_id", MEMBERSHIP_ROLE, default="Member")
+
+    @classmethod
+    def find(cls, session: Session, farmer_id: int, cooperative_id: int) -> Optional["Membership"]:
+        return session.scalars(_BY_KEY, {"farmer_id": farmer_id, "cooperative_id": cooperative_id}).first()
+
+    @classmethod
+    def list_select(cls):
+        return (
+            select(cls.cooperative_id, cls.farmer_id, Farmer.name, Cooperative.name, cls.role, cls.joined_on)
+            .outerjoin(Farmer, cls.farmer_id == Farmer.id)
+            .outerjoin(Cooperative, cls.cooperative_id == Cooperative.id)
+            .order_by(cls.cooperative_id, cls.farmer_id)
+        )
+
+    @classmethod
+    def list_rows(cls, session: Session) -> Tuple[tuple, ...]:
+        """Cached (cooperative_id, farmer_id, farmer name, cooperative name, role, joined_on) rows."""
+        return query_cache.fetch(session, cls.list_select())
+
+    @classmethod
+    def list_view(cls, session: Session) -> List[MembershipRow]:
+        return [MembershipRow._make(r) for r in session.execute(cls.list_select())]
+
+
+# Built once; see lib/db/statement_cache.py.
+_BY_KEY = select(Membership).where(
+    Membership.farmer_id == bindparam("farmer_id"), Membership.cooperative_id == bindparam("cooperative_id")
+).limit(1)
@@ -1,32 +1,62 @@
-from typing import List, Optional
-from sqlalchemy import Column, Integer, String, Text
+from typing import List, Optional, Tuple
+from sqlalchemy import Column, ForeignKey, Integer, SmallInteger, String, Text, select
 from sqlalchemy.orm import relationship, Session
+from ..batch import commit
+from .. import statement_cache
+from ..query_cache import query_cache
 from .base import Base
+from .lookup import Lookup, PRODUCT_CATEGORY, UNIT, encoded
+from .rows import ProductTypeRow, ProductTypeDetail
 
 class ProductType(Base):
     __tablename__ = 'product_types'
     id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False)
-    category = Column(String(50))
-    typical_unit = Column(String(50))
+    category_id = Column(SmallInteger, ForeignKey('lookups.id'))
+    unit_id = Column(SmallInteger, ForeignKey('lookups.id'))
     description = Column(Text)
     sales = relationship('Sale', back_populates='product_type')
+    category_ref = relationship(Lookup, foreign_keys=[category_id])
+    unit_ref = relationship(Lookup, foreign_keys=[unit_id])
+    category = encoded('category_ref', 'category_id', PRODUCT_CATEGORY)
+    typical_unit = encoded('unit_ref', 'unit_id', UNIT)
 
     @classmethod
     def create(cls, session: Session, **kwargs) -> 'ProductType':
         p = cls(**kwargs)
         session.add(p)
-        session.commit()
+        commit(session)
         return p
 
     @classmethod
     def get_all(cls, session: Session) -> List['ProductType']:
         return session.query(cls).order_by(cls.id).all()
 
+    @classmethod
+    def list_select(cls):
+        return select(cls.id, cls.name, cls.category, cls.typical_unit).order_by(cls.id)
+
+    @classmethod
+    def list_rows(cls, session: Session) -> Tuple[tuple, ...]:
+        """Cached (id, name, category, typical_unit) rows."""
+        return query_cache.fetch(session, cls.list_select())
+
+    @classmethod
+    def list_view(cls, session: Session) -> List[ProductTypeRow]:
+        return [ProductTypeRow._make(r) for r in session.execute(cls.list_select())]
+
+    @classmethod
+    def detail_view(cls, session: Session, id_: int) -> Optional[ProductTypeDetail]:
+        stmt = select(
+            cls.id, cls.name, cls.category, cls.typical_unit, cls.description
+        ).where(cls.id == id_)
+        row = session.execute(stmt).first()
+        return ProductTypeDetail._make(row) if row else None
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int) -> Optional['ProductType']:
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
@@ -0,0 +1,113 @@
+"""Read-only row types returned by the models' ``list_view``/``detail_view``.
+
+These are named tuples (slotted, no instance ``__dict__``) filled straight
+from ``select()`` projections, so list screens never hydrate ORM entities or
+touch the identity map.  They print directly with ``print_table``.
+"""
+
+from datetime import date
+from typing import NamedTuple, Optional
+
+
+class ActivityRow(NamedTuple):
+    id: int
+    name: str
+    start_date: Optional[date]
+    end_date: Optional[date]
+
+
+class ActivityDetail(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    start_date: Optional[date]
+    end_date: Optional[date]
+    farmer_count: int
+
+
+class FarmerRow(NamedTuple):
+    id: int
+    name: str
+    national_id: str
+    activity: Optional[str]
+
+
+class FarmerDetail(NamedTuple):
+    id: int
+    name: str
+    farm_name: Optional[str]
+    national_id: str
+    phone: Optional[str]
+    email: Optional[str]
+    activity: Optional[str]
+
+
+class BuyerRow(NamedTuple):
+    id: int
+    name: str
+    organization: Optional[str]
+
+
+class BuyerDetail(NamedTuple):
+    id: int
+    name: str
+    organization: Optional[str]
+    contact_phone: Optional[str]
+    contact_email: Optional[str]
+    address: Optional[str]
+    preferred_payment_method: Optional[str]
+
+
+class ProductTypeRow(NamedTuple):
+    id: int
+    name: str
+    category: Optional[str]
+    typical_unit: Optional[str]
+
+
+class ProductTypeDetail(NamedTuple):
+    id: int
+    name: str
+    category: Optional[str]
+    typical_unit: Optional[str]
+    description: Optional[str]
+
+
+class SaleRow(NamedTuple):
+    id: int
+    farmer: Optional[str]
+    buyer: Optional[str]
+    product: Optional[str]
+    quantity: float
+    price: float
+    created_at: Optional[date]
+
+
+class CooperativeRow(NamedTuple):
+    id: int
+    name: str
+
+
+class MembershipRow(NamedTuple):
+    cooperative_id: int
+    farmer_id: int
+    farmer: Optional[str]
+    cooperative: Optional[str]
+    role: Optional[str]
+    joined_on: Optional[date]
+
+
+class FarmerActivityRow(NamedTuple):
+    id: int
+    farmer: Optional[str]
+    activity: Optional[str]
+
+
+class ParticipationRow(NamedTuple):
+    farmer_id: int
+    farmer: str
+    activity: str
+    start_date: Optional[date]
+    end_date: Optional[date]
+    role: Optional[str]
+    progress_percent: Optional[float]
@@ -1,23 +1,37 @@
+import uuid
 from datetime import date
-from typing import List, Optional, TYPE_CHECKING
-from sqlalchemy import Column, Integer, ForeignKey, Float, Date
+from typing import List, Optional
+from sqlalchemy import Column, Integer, ForeignKey, Float, Date, Index, String, event, select
 from sqlalchemy.orm import relationship, Session
+from ..batch import commit
+from .. import statement_cache
 from .base import Base
-
-if TYPE_CHECKING:
-    from .farmer import Farmer
-    from .buyer import Buyer
-    from .product_type import ProductType
+from .buyer import Buyer
+from .farmer import Farmer
+from .product_type import ProductType
+from .rows import SaleRow
 
 class Sale(Base):
     __tablename__ = 'sales'
+    # Searches filter on one of farmer/buyer/product plus a date range and page
+    # newest first, so each is indexed together with created_at.
+    __table_args__ = (
+        Index('ix_sales_farmer_created', 'farmer_id', 'created_at'),
+        Index('ix_sales_buyer_created', 'buyer_id', 'created_at'),
+        Index('ix_sales_product_created', 'product_type_id', 'created_at'),
+        Index('ix_sales_created', 'created_at'),
+    )
     id = Column(Integer, primary_key=True)
     farmer_id = Column(Integer, ForeignKey('farmers.id'))
     buyer_id = Column(Integer, ForeignKey('buyers.id'))
     product_type_id = Column(Integer, ForeignKey('product_types.id'), nullable=True)
     quantity = Column(Float, default=0.0)
     price = Column(Float, default=0.0)
+    # quantity * price, kept by the flush hooks below (backfilled by lib.db.backfill).
+    total_amount = Column(Float, nullable=True)
     created_at = Column(Date, default=date.today)
+    # Identifies the sale across office databases (lib.db.sync); never changes.
+    sync_key = Column(String(255), index=True, default=lambda: uuid.uuid4().hex)
     farmer = relationship('Farmer', back_populates='sales')
     buyer = relationship('Buyer', back_populates='sales')
     product_type = relationship('ProductType', back_populates='sales')
@@ -25,20 +39,71 @@ class Sale(Base):
     @classmethod
     def create(cls, session: Session, farmer: 'Farmer', buyer: 'Buyer',
                product_type: Optional['ProductType'] = None,
-               quantity: float = 0.0, price: float = 0.0) -> 'Sale':
-        s = cls(farmer=farmer, buyer=buyer, product_type=product_type, quantity=quantity, price=price)
+               quantity: float = 0.0, price: float = 0.0,
+               created_at: Optional[date] = None) -> 'Sale':
+        s = cls(farmer=farmer, buyer=buyer, product_type=product_type, quantity=quantity, price=price,
+                created_at=created_at or date.today())
         session.add(s)
-        session.commit()
+        commit(session)
         return s
 
     @classmethod
     def get_all(cls, session: Session) -> List['Sale']:
         return session.query(cls).order_by(cls.id).all()
 
+    @classmethod
+    def list_select(cls):
+        return (
+            select(cls.id, Farmer.name, Buyer.name, ProductType.name, cls.quantity, cls.price, cls.created_at)
+            .outerjoin(Farmer, cls.farmer_id == Farmer.id)
+            .outerjoin(Buyer, cls.buyer_id == Buyer.id)
+            .outerjoin(ProductType, cls.product_type_id == ProductType.id)
+            .order_by(cls.id)
+        )
+
+    @classmethod
+    def list_view(cls, session: Session) -> List[SaleRow]:
+        return [SaleRow._make(r) for r in session.execute(cls.list_select())]
+
+    @classmethod
+    def page(cls, session: Session, before_id: Optional[int] = None, limit: int = 20, **filters) -> List[SaleRow]:
+        """Newest-first keyset page of sales, e.g. ``Sale.page(session, farmer_id=3)``.
+
+        Pass the last row's id as ``before_id`` to get the next page.
+        """
+        stmt = cls.list_select().order_by(None).order_by(cls.id.desc()).limit(limit)
+        for column, value in filters.items():
+            stmt = stmt.where(getattr(cls, column) == value)
+        if before_id is not None:
+            stmt = stmt.where(cls.id < before_id)
+        return [SaleRow._make(r) for r in session.execute(stmt)]
+
+    @classmethod
+    def detail_view(cls, session: Session, id_: int) -> Optional[SaleRow]:
+        row = session.execute(cls.list_select().where(cls.id == id_)).first()
+        return SaleRow._make(row) if row else None
+
     @classmethod
     def find_by_id(cls, session: Session, id_: int) -> Optional['Sale']:
-        return session.get(cls, id_)
+        return statement_cache.get(session, cls, id_)
 
     def delete(self, session: Session):
         session.delete(self)
-        session.commit()
+        commit(session)
+
+
+def _total(quantity, price):
+    # As in SQL (and the backfill), NULL if either side is NULL.
+    return None if quantity is None or price is None else quantity * price
+
+
+@event.listens_for(Sale, "before_insert")
+def _set_total_on_insert(mapper, connection, target):
+    # Unset quantity/price are inserted as their 0.0 column defaults.
+    target.total_amount = _total(0.0 if target.quantity is None else target.quantity,
+                                 0.0 if target.price is None else target.price)
+
+
+@event.listens_for(Sale, "before_update")
+def _set_total_on_update(mapper, connection, target):
+    target.total_amount = _total(target.quantity, target.price)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, UniqueConstraint
+from .base import Base
+
+class SalesSketch(Base):
+    """Serialised HyperLogLog/KLL sketch for one (dimension, key, period, metric).
+
+    ``period`` is ``YYYY-MM`` or ``*`` for all time.  Rows are maintained by
+    ``lib.db.analytics`` as sales are flushed; see ``lib.db.sketches`` for the
+    error bounds.
+    """
+    __tablename__ = "sales_sketches"
+    __table_args__ = (UniqueConstraint("dimension", "key", "period", "metric"),)
+
+    id = Column(Integer, primary_key=True)
+    dimension = Column(String(20), nullable=False)
+    key = Column(Integer, nullable=False, default=0)
+    period = Column(String(7), nullable=False)
+    metric = Column(String(20), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Float, Date, Index
+from .base import Base
+
+class SalesSummary(Base):
+    """Running sales totals for a farmer, buyer or product type.
+
+    ``counterpart`` 0 holds the totals for ``(dimension, key)``; other rows
+    hold the totals per counterparty (buyers of a farmer, farmers of a buyer
+    or product).  Maintained by ``lib.db.summaries``.
+    """
+    __tablename__ = "sales_summaries"
+    __table_args__ = (Index("ix_sales_summaries_revenue", "dimension", "key", "revenue"),)
+
+    dimension = Column(String(20), primary_key=True)
+    key = Column(Integer, primary_key=True)
+    counterpart = Column(Integer, primary_key=True, default=0)
+    sale_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    first_date = Column(Date)
+    last_date = Column(Date)
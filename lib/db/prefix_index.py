@@ -0,0 +1,213 @@
+"""In-memory prefix index behind the CLI's type-to-narrow pickers.
+
+Each picker source (farmers, activities, cooperatives, buyers, product
+types) gets one index per database, built on first use.  Every searchable
+value is split into tokens (each word of a name, the whole national id, the
+digits of a phone number) held in one sorted list, so a prefix lookup is a
+``bisect`` plus a short forward scan, whatever the table size.
+
+Committed inserts and updates are bisected into the list; deleted rows
+are dropped from the labels and their tokens skipped on read.  A change made
+by another process is noticed through ``PRAGMA data_version``, like the query
+cache, and the index is rebuilt on next use.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .models import Activity, Buyer, Cooperative, Farmer, ProductType
+
+_PENDING_KEY = "prefix_index_pending"
+_DATA_VERSION_KEY = "prefix_index_data_version"
+_PHONE = re.compile(r"\+?[\d\s()-]{4,}")
+COUNTRY_CODE = "254"
+
+
+class Source(NamedTuple):
+    model: type
+    label: Tuple[str, ...]    # columns shown next to the id
+    phone: Tuple[str, ...] = ()
+    exact: Tuple[str, ...] = ()
+
+
+SOURCES: Dict[str, Source] = {
+    "farmers": Source(Farmer, ("name", "national_id", "phone"), phone=("phone",), exact=("national_id",)),
+    "activities": Source(Activity, ("name",)),
+    "cooperatives": Source(Cooperative, ("name",)),
+    "buyers": Source(Buyer, ("name", "organization")),
+    "product_types": Source(ProductType, ("name",)),
+}
+_BY_MODEL = {s.model: name for name, s in SOURCES.items()}
+
+
+def _phone_tokens(value: str) -> List[str]:
+    digits = re.sub(r"\D", "", value)
+    # "0712 345678" and "+254 712 345678" should both be found by "0712" or "712".
+    return [digits, digits[-9:]] if len(digits) > 9 else [digits] if digits else []
+
+
+def tokens(source: Source, row: dict) -> FrozenSet[str]:
+    out = set()
+    for col in source.label:
+        value = row.get(col)
+        if not value:
+            continue
+        if col in source.phone:
+            out.update(_phone_tokens(value))
+        elif col in source.exact:
+            out.add(str(value).strip().casefold())
+        else:
+            words = str(value).casefold().split()
+            out.update(words)
+            out.add(" ".join(words))
+    return frozenset(out)
+
+
+def _query_words(query: str) -> List[str]:
+    query = query.strip()
+    if _PHONE.fullmatch(query):
+        digits = re.sub(r"\D", "", query)
+        # "+254 712..." finds the local "0712..." through its last-nine-digits token.
+        # Without the "+" the digits may be a national id that starts with 254.
+        if query.startswith("+") and digits.startswith(COUNTRY_CODE):
+            digits = digits[len(COUNTRY_CODE):]
+        return [digits]
+    return query.casefold().split()
+
+
+class PrefixIndex:
+    def __init__(self, source: Source):
+        self.source = source
+        self._keys: List[str] = []
+        self._ids: List[int] = []
+        self._rows: Dict[int, Tuple[tuple, FrozenSet[str]]] = {}
+        self._lock = threading.Lock()
+
+    def build(self, session: Session):
+        model = self.source.model
+        cols = [getattr(model, c) for c in self.source.label]
+        pairs = []
+        rows = {}
+        for id_, *values in session.execute(select(model.id, *cols)):
+            toks = tokens(self.source, dict(zip(self.source.label, values)))
+            rows[id_] = (tuple(values), toks)
+            pairs.extend((t, id_) for t in toks)
+        pairs.sort()
+        with self._lock:
+            self._keys = [t for t, _ in pairs]
+            self._ids = [i for _, i in pairs]
+            self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, id_: int) -> bool:
+        return id_ in self._rows
+
+    def label(self, id_: int) -> Optional[tuple]:
+        entry = self._rows.get(id_)
+        return entry[0] if entry else None
+
+    def put(self, id_: int, row: dict):
+        toks = tokens(self.source, row)
+        with self._lock:
+            old = self._rows.get(id_)
+            self._rows[id_] = (tuple(row.get(c) for c in self.source.label), toks)
+            for t in toks - (old[1] if old else frozenset()):
+                i = bisect_left(self._keys, t)
+                self._keys.insert(i, t)
+                self._ids.insert(i, id_)
+
+    def remove(self, id_: int):
+        with self._lock:
+            self._rows.pop(id_, None)
+
+    def search(self, query: str, limit: int = 10) -> Tuple[List[tuple], bool]:
+        """Up to ``limit`` ``(id, *label)`` rows where every word of ``query``
+        prefixes one of the row's tokens, and whether more rows matched."""
+        words = _query_words(query)
+        if not words:
+            return [], False
+        found, seen = [], set()
+        with self._lock:
+            # Scan the narrowest word's range, check the other words per row.
+            ranges = [(bisect_left(self._keys, w), bisect_left(self._keys, w + "\uffff")) for w in words]
+            start, end = min(ranges, key=lambda r: r[1] - r[0])
+            for i in range(start, end):
+                key, id_ = self._keys[i], self._ids[i]
+                entry = self._rows.get(id_)
+                # Tokens of deleted rows and old values stay in the list; skip them.
+                if id_ in seen or entry is None or key not in entry[1]:
+                    continue
+                if all(any(t.startswith(w) for t in entry[1]) for w in words):
+                    seen.add(id_)
+                    if len(found) == limit:
+                        return found, True
+                    found.append((id_, *entry[0]))
+        return found, False
+
+
+_indexes: Dict[Tuple[str, str], PrefixIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def index_for(session: Session, source: str) -> PrefixIndex:
+    """The (lazily built) index of ``source`` for the session's database."""
+    conn = session.connection()
+    url = str(conn.engine.url)
+    version = conn.exec_driver_sql("PRAGMA data_version").scalar()
+    seen = conn.info.get(_DATA_VERSION_KEY)
+    conn.info[_DATA_VERSION_KEY] = version
+    with _indexes_lock:
+        # Readings only compare on one connection; a first one may follow changes.
+        if seen != version:
+            for key in [k for k in _indexes if k[0] == url]:
+                del _indexes[key]
+        index = _indexes.get((url, source))
+        if index is None:
+            index = _indexes[(url, source)] = PrefixIndex(SOURCES[source])
+            index.build(session)
+    return index
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    changes = []
+    for objs, deleted in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+        for obj in objs:
+            name = _BY_MODEL.get(type(obj))
+            if name is None:
+                continue
+            if deleted:
+                changes.append((name, obj.id, None))
+            else:
+                changes.append((name, obj.id, {c: getattr(obj, c) for c in SOURCES[name].label}))
+    if changes:
+        session.info.setdefault(_PENDING_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+    url = str(session.get_bind().url)
+    for name, id_, row in changes:
+        index = _indexes.get((url, name))
+        if index is None:
+            continue
+        if row is None:
+            index.remove(id_)
+        else:
+            index.put(id_, row)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,172 @@
+"""Result cache for read-only list queries.
+
+Entries are keyed by the database URL, the compiled SQL and its parameters
+and remember which tables the statement reads.  Every table has a version
+counter that is bumped whenever a session flushes a change to it, so an
+entry is only served while all of its tables are still at the versions it
+was filled at.  Rows are stored as plain tuples, never ORM objects, so a hit
+never touches a session's identity map.
+
+The cache is per process.  Commits made by other processes (or other pooled
+connections) are picked up through SQLite's ``PRAGMA data_version``, which
+drops every entry when the file has been changed behind our back.  The
+pragma only compares readings on one connection, so a connection's first
+read also drops them: the file may have changed since any entry was filled.
+"""
+
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, FrozenSet, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+
+_DIRTY_KEY = "query_cache_dirty_tables"
+_DATA_VERSION_KEY = "query_cache_data_version"
+
+
+def _rows_size(rows: tuple) -> int:
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class QueryCache:
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Tuple[Dict[str, int], tuple, int]]" = OrderedDict()
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def fetch(self, session: Session, stmt) -> Tuple[tuple, ...]:
+        """Return the rows of ``stmt`` as a tuple of tuples, from cache if valid."""
+        self._check_data_version(session)
+        bind = session.get_bind()
+        compiled = stmt.compile(dialect=bind.dialect)
+        # Shards and in-memory copies run the same SQL against different files.
+        key = (str(bind.url), str(compiled), tuple(sorted(compiled.params.items())))
+        tables = frozenset(t.name for t in find_tables(stmt, check_columns=True))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                versions, rows, _ = entry
+                if all(self._versions[t] == v for t, v in versions.items()):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return rows
+                self._drop(key)
+                self.invalidations += 1
+            self.misses += 1
+            versions = {t: self._versions[t] for t in tables}
+
+        rows = tuple(tuple(r) for r in session.execute(stmt))
+        if not tables & session.info.get(_DIRTY_KEY, frozenset()):
+            self._store(key, versions, rows)
+        return rows
+
+    def bump(self, tables):
+        with self._lock:
+            for t in tables:
+                self._versions[t] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _store(self, key, versions, rows):
+        size = _rows_size(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # Another writer may have bumped a table while we were querying.
+            if any(self._versions[t] != v for t, v in versions.items()):
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (versions, rows, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _check_data_version(self, session: Session):
+        conn = session.connection()
+        if conn.dialect.name != "sqlite":
+            return
+        version = conn.exec_driver_sql("PRAGMA data_version").scalar()
+        seen = conn.info.get(_DATA_VERSION_KEY)
+        conn.info[_DATA_VERSION_KEY] = version
+        if seen != version:
+            self.clear()
+
+
+query_cache = QueryCache()
+
+
+def _mark_dirty(session: Session, tables: FrozenSet[str]):
+    if not tables:
+        return
+    query_cache.bump(tables)
+    session.info[_DIRTY_KEY] = session.info.get(_DIRTY_KEY, frozenset()) | tables
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tables.update(t.name for t in inspect(obj).mapper.tables)
+    _mark_dirty(session, frozenset(tables))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        _mark_dirty(orm_execute_state.session, frozenset([table.name]))
+
+
+def _end_transaction(session):
+    # Entries filled by other sessions while our writes were uncommitted
+    # predate the commit; bump once more so they are not served after it.
+    tables = session.info.pop(_DIRTY_KEY, None)
+    if tables:
+        query_cache.bump(tables)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    _end_transaction(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    if not previous_transaction.nested:
+        _end_transaction(session)
@@ -0,0 +1,120 @@
+"""Multi-criteria sales search, paged newest first.
+
+    f = SalesFilter(buyer_id=4, product_type_id=2, date_from=date(2025, 1, 1), min_price=200)
+    page = search(session, f)
+    page.rows, page.plan
+    page = search(session, f, after=page.after)      # next page
+
+Every criterion is optional.  Results are ordered by ``(created_at, id)``
+descending and paged by keyset: ``after`` is the key of the last row shown,
+so a page costs the same however deep it is.  Farmer, buyer and product
+filters are served by the ``(<column>, created_at)`` indexes on ``sales``,
+which cover both the date range and the order; a cooperative becomes a
+farmer list from ``memberships``.  Quantity and price bounds are checked on
+the rows the index yields.
+
+Sales without a date sort after all dated ones and are paged by id alone
+(a row-value comparison never matches NULL, and an ``OR`` would cost the
+index range).  ``plan`` is SQLite's ``EXPLAIN QUERY PLAN`` for the page.
+"""
+
+from datetime import date
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from .models import Membership, Sale
+from .models.rows import SaleRow
+
+PAGE_SIZE = 20
+
+Key = Tuple[Optional[date], int]
+
+
+class SalesFilter(NamedTuple):
+    farmer_id: Optional[int] = None
+    buyer_id: Optional[int] = None
+    product_type_id: Optional[int] = None
+    cooperative_id: Optional[int] = None
+    date_from: Optional[date] = None        # inclusive
+    date_to: Optional[date] = None          # inclusive
+    min_quantity: Optional[float] = None
+    max_quantity: Optional[float] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def conditions(self) -> list:
+        out = []
+        for column in ("farmer_id", "buyer_id", "product_type_id"):
+            value = getattr(self, column)
+            if value is not None:
+                out.append(getattr(Sale, column) == value)
+        if self.cooperative_id is not None:
+            out.append(Sale.farmer_id.in_(
+                select(Membership.farmer_id).where(Membership.cooperative_id == self.cooperative_id)
+            ))
+        for value, condition in (
+            (self.date_from, lambda v: Sale.created_at >= v),
+            (self.date_to, lambda v: Sale.created_at <= v),
+            (self.min_quantity, lambda v: Sale.quantity >= v),
+            (self.max_quantity, lambda v: Sale.quantity <= v),
+            (self.min_price, lambda v: Sale.price >= v),
+            (self.max_price, lambda v: Sale.price <= v),
+        ):
+            if value is not None:
+                out.append(condition(value))
+        return out
+
+    def dated_only(self) -> bool:
+        return self.date_from is not None or self.date_to is not None
+
+
+class SalesPage(NamedTuple):
+    rows: List[SaleRow]
+    after: Optional[Key]        # pass back for the next page; None on the last one
+    plan: List[str]
+
+
+def build(f: SalesFilter, after: Optional[Key] = None, undated: bool = False):
+    """The select for one page section: dated rows, or (``undated``) those without a date."""
+    stmt = Sale.list_select().order_by(None).where(*f.conditions())
+    if undated:
+        stmt = stmt.where(Sale.created_at.is_(None)).order_by(Sale.id.desc())
+        if after is not None:
+            stmt = stmt.where(Sale.id < after[1])
+        return stmt
+    stmt = stmt.where(Sale.created_at.is_not(None)).order_by(Sale.created_at.desc(), Sale.id.desc())
+    if after is not None:
+        stmt = stmt.where(tuple_(Sale.created_at, Sale.id) < tuple_(*after))
+    return stmt
+
+
+def explain(session: Session, stmt) -> List[str]:
+    """``EXPLAIN QUERY PLAN`` of ``stmt``, one indented line per step."""
+    sql = stmt.compile(dialect=session.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    depth = {0: -1}
+    lines = []
+    for id_, parent, _, detail in rows:
+        depth[id_] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[id_] + detail)
+    return lines
+
+
+def search(session: Session, f: SalesFilter, after: Optional[Key] = None, limit: int = PAGE_SIZE) -> SalesPage:
+    rows: List[SaleRow] = []
+    plan: List[str] = []
+    if after is None or after[0] is not None:
+        stmt = build(f, after)
+        plan = explain(session, stmt)
+        rows = [SaleRow._make(r) for r in session.execute(stmt.limit(limit + 1))]
+        after = None
+    if len(rows) <= limit and not f.dated_only():
+        stmt = build(f, after, undated=True)
+        if not plan:
+            plan = explain(session, stmt)
+        rows += [SaleRow._make(r) for r in session.execute(stmt.limit(limit + 1 - len(rows)))]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return SalesPage(rows, (rows[-1].created_at, rows[-1].id) if more else None, plan)
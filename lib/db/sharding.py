@@ -0,0 +1,415 @@
+"""Optional per-cooperative sharding across several SQLite files.
+
+A sharded deployment is a directory holding
+
+    catalog.db         lookups, activities, product types, buyers, cooperatives and
+                       the shard directory (which shard owns each farmer)
+    shard-<name>.db    farmers with their memberships, activities and sales,
+                       plus each shard's own journal, summaries and sketches
+
+Every shard connection ATTACHes ``catalog.db``, so the existing joins from
+sales to buyers or products work unchanged on a shard session, and all the
+session listeners (journal, summaries, sketches, query cache) keep working
+per shard.  A farmer lives on the shard of the cooperative they joined first.
+
+    router = ShardRouter("shards")
+    with router(farmer_id=42) as session:          # the farmer's shard
+        Sale.create(session, farmer=session.get(Farmer, 42), ...)
+    with router(cooperative_id=3) as session:      # new farmers of coop 3
+        Farmer.create(session, ...)
+    totals = router.fan_out(lambda s: s.execute(stmt).all(), merge=sum_by_key)
+
+Farmer, farmer-activity and sale ids are handed out by the catalog in blocks
+so they stay unique across shards.  ``split`` turns an existing single-file
+database into this layout.
+"""
+
+import heapq
+import json
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, event, func, insert, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from .database import COMPILED_CACHE_SIZE, sqlite_transactions
+from .models import Base, Farmer, FarmerActivity, Membership, Sale
+
+CATALOG_FILE = "catalog.db"
+CATALOG_SCHEMA = "catalog"
+CATALOG_TABLES = ("lookups", "activities", "product_types", "buyers", "cooperatives")
+# Rows whose ids must be unique across shards, so they come from the catalog.
+GLOBAL_IDS = {"farmers": Farmer, "farmer_activities": FarmerActivity, "sales": Sale}
+ID_BLOCK = 1000
+COPY_CHUNK = 5000
+# Farmers this session's transaction added to the directory, checked when it ends.
+_REGISTERED_KEY = "shard_registered_farmers"
+
+directory = MetaData()
+shards_table = Table(
+    "shards", directory,
+    Column("name", String(50), primary_key=True),
+    Column("path", String(200), nullable=False),
+)
+cooperative_shards = Table(
+    "cooperative_shards", directory,
+    Column("cooperative_id", Integer, primary_key=True),
+    Column("shard", String(50), nullable=False),
+)
+farmer_shards = Table(
+    "farmer_shards", directory,
+    Column("farmer_id", Integer, primary_key=True),
+    Column("shard", String(50), nullable=False, index=True),
+)
+shard_ids = Table(
+    "shard_ids", directory,
+    Column("table_name", String(50), primary_key=True),
+    Column("next_id", Integer, nullable=False),
+)
+
+
+def sharded_tables():
+    return [t for t in Base.metadata.sorted_tables if t.name not in CATALOG_TABLES]
+
+
+def catalog_tables():
+    return [t for t in Base.metadata.sorted_tables if t.name in CATALOG_TABLES]
+
+
+def _check_name(name: str) -> str:
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise ValueError(f"Invalid shard name {name!r}: use letters, digits, '-' and '_'")
+    return name
+
+
+def _catalog_engine(path: Path):
+    return sqlite_transactions(create_engine(f"sqlite:///{path}", future=True, query_cache_size=COMPILED_CACHE_SIZE))
+
+
+def _shard_engine(path: Path, catalog_path: Path):
+    engine = sqlite_transactions(create_engine(f"sqlite:///{path}", future=True, query_cache_size=COMPILED_CACHE_SIZE))
+
+    @event.listens_for(engine, "connect")
+    def _attach_catalog(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE ? AS {CATALOG_SCHEMA}", (str(catalog_path),))
+
+    return engine
+
+
+# -- merging fan-out results ----------------------------------------------------
+
+def concat(results: Iterable[list]) -> list:
+    return [row for rows in results for row in rows]
+
+
+def sum_by_key(results: Iterable[list]) -> list:
+    """Merge ``(key, n1, n2, ...)`` rows from every shard by adding the numbers."""
+    totals: Dict[object, list] = {}
+    for rows in results:
+        for key, *values in rows:
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [v or 0 for v in values]
+            else:
+                for i, v in enumerate(values):
+                    entry[i] += v or 0
+    return [(key, *values) for key, values in totals.items()]
+
+
+def merge_sorted(results: Iterable[list], key: Callable = None, reverse: bool = False,
+                 limit: Optional[int] = None) -> list:
+    """Merge per-shard results that are each already sorted by ``key``."""
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    return [row for _, row in zip(range(limit), merged)] if limit is not None else list(merged)
+
+
+class ShardRouter:
+    """Session factory that picks the shard owning a farmer or cooperative."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.catalog_path = self.root / CATALOG_FILE
+        if not self.catalog_path.exists():
+            raise FileNotFoundError(f"No sharded deployment at {self.root} ({CATALOG_FILE} missing)")
+        self.catalog_engine = _catalog_engine(self.catalog_path)
+        self._lock = threading.Lock()
+        self._blocks: Dict[str, List[int]] = {}
+        self._farmers: Dict[int, str] = {}
+        self._factories: Dict[str, sessionmaker] = {}
+        with self.catalog_engine.connect() as conn:
+            self.shards = {name: self.root / path for name, path in conn.execute(select(shards_table))}
+            self._cooperatives = dict(conn.execute(select(cooperative_shards)).all())
+        if not self.shards:
+            raise ValueError(f"{self.catalog_path} lists no shards")
+        self.default_shard = sorted(self.shards)[0]
+        self.catalog = sessionmaker(bind=self.catalog_engine, future=True)
+
+    def factory(self, shard: str) -> sessionmaker:
+        with self._lock:
+            factory = self._factories.get(shard)
+            if factory is None:
+                if shard not in self.shards:
+                    raise KeyError(f"Unknown shard {shard!r}")
+                engine = _shard_engine(self.shards[shard], self.catalog_path)
+                factory = sessionmaker(bind=engine, future=True, info={"shard": shard})
+                event.listen(factory, "before_flush", self._before_flush)
+                event.listen(factory, "after_transaction_end", self._after_transaction_end)
+                self._factories[shard] = factory
+            return factory
+
+    def __call__(self, farmer_id: Optional[int] = None, cooperative_id: Optional[int] = None,
+                 shard: Optional[str] = None) -> Session:
+        if shard is None:
+            if farmer_id is not None:
+                shard = self.shard_for_farmer(farmer_id)
+            elif cooperative_id is not None:
+                shard = self.shard_for_cooperative(cooperative_id)
+            else:
+                shard = self.default_shard
+        return self.factory(shard)()
+
+    # -- directory ---------------------------------------------------------
+
+    def shard_for_cooperative(self, cooperative_id: int) -> str:
+        return self._cooperatives.get(cooperative_id, self.default_shard)
+
+    def shard_for_farmer(self, farmer_id: int) -> str:
+        shard = self._farmers.get(farmer_id)
+        if shard is None:
+            with self.catalog_engine.connect() as conn:
+                shard = conn.execute(
+                    select(farmer_shards.c.shard).where(farmer_shards.c.farmer_id == farmer_id)
+                ).scalar()
+            if shard is None:
+                raise LookupError(f"Farmer {farmer_id} is not registered on any shard")
+            self._farmers[farmer_id] = shard
+        return shard
+
+    def assign_cooperative(self, cooperative_id: int, shard: str):
+        """Send farmers who first join ``cooperative_id`` to ``shard`` from now on."""
+        if shard not in self.shards:
+            raise KeyError(f"Unknown shard {shard!r}")
+        with self.catalog_engine.begin() as conn:
+            conn.execute(cooperative_shards.delete().where(cooperative_shards.c.cooperative_id == cooperative_id))
+            conn.execute(insert(cooperative_shards).values(cooperative_id=cooperative_id, shard=shard))
+        self._cooperatives[cooperative_id] = shard
+
+    def allocate_ids(self, table_name: str, count: int) -> Iterable[int]:
+        """Reserve ``count`` globally unique ids, taken from per-process blocks."""
+        with self._lock:
+            block = self._blocks.get(table_name)
+            ids = []
+            while len(ids) < count:
+                if block is None or block[0] >= block[1]:
+                    size = max(ID_BLOCK, count - len(ids))
+                    # A short transaction of its own, so a shard writer never
+                    # holds the catalog lock until its commit.
+                    with self.catalog_engine.begin() as conn:
+                        conn.execute(
+                            update(shard_ids).where(shard_ids.c.table_name == table_name)
+                            .values(next_id=shard_ids.c.next_id + size)
+                        )
+                        end = conn.execute(
+                            select(shard_ids.c.next_id).where(shard_ids.c.table_name == table_name)
+                        ).scalar()
+                    block = self._blocks[table_name] = [end - size, end]
+                take = min(count - len(ids), block[1] - block[0])
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+            return ids
+
+    def _before_flush(self, session: Session, flush_context, instances):
+        shard = session.info["shard"]
+        pending = defaultdict(list)
+        for obj in session.new:
+            table_name = obj.__table__.name
+            if table_name in GLOBAL_IDS and obj.id is None:
+                pending[table_name].append(obj)
+        for table_name, objs in pending.items():
+            for obj, id_ in zip(objs, self.allocate_ids(table_name, len(objs))):
+                obj.id = id_
+
+        new_farmers = [obj.id for obj in session.new if isinstance(obj, Farmer)]
+        for obj in session.new:
+            if isinstance(obj, (Membership, FarmerActivity, Sale)):
+                farmer_id = obj.farmer.id if obj.farmer is not None else obj.farmer_id
+                if farmer_id is not None and farmer_id not in new_farmers \
+                        and self.shard_for_farmer(farmer_id) != shard:
+                    raise ValueError(
+                        f"Farmer {farmer_id} lives on shard {self.shard_for_farmer(farmer_id)!r}, not {shard!r}"
+                    )
+        if new_farmers:
+            # Registered before the shard commits, so a committed farmer is
+            # never missing from the directory; entries whose farmer does not
+            # survive the transaction are removed when it ends.
+            with self.catalog_engine.begin() as conn:
+                conn.execute(insert(farmer_shards), [{"farmer_id": f, "shard": shard} for f in new_farmers])
+            self._farmers.update((f, shard) for f in new_farmers)
+            session.info.setdefault(_REGISTERED_KEY, set()).update(new_farmers)
+
+    def _after_transaction_end(self, session: Session, transaction):
+        if transaction.parent is not None:
+            return
+        registered = session.info.pop(_REGISTERED_KEY, None)
+        if not registered:
+            return
+        # Rolled back, or flushed inside a savepoint that was: not on the shard.
+        with self.factory(session.info["shard"]).kw["bind"].connect() as conn:
+            kept = set(conn.execute(select(Farmer.id).where(Farmer.id.in_(registered))).scalars())
+        gone = registered - kept
+        if gone:
+            with self.catalog_engine.begin() as conn:
+                conn.execute(farmer_shards.delete().where(farmer_shards.c.farmer_id.in_(gone)))
+            for farmer_id in gone:
+                self._farmers.pop(farmer_id, None)
+
+    # -- cross-shard queries -----------------------------------------------
+
+    def fan_out(self, query: Callable[[Session], list], merge: Callable[[Iterable[list]], list] = concat,
+                shards: Optional[Iterable[str]] = None) -> list:
+        """Run ``query`` on every shard (in parallel) and merge the results."""
+        names = sorted(shards or self.shards)
+
+        def run(name):
+            with self.factory(name)() as session:
+                return list(query(session))
+
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            return merge(pool.map(run, names))
+
+    def dispose(self):
+        for factory in self._factories.values():
+            factory.kw["bind"].dispose()
+        self.catalog_engine.dispose()
+
+
+# -- migration tool ---------------------------------------------------------------
+
+def _copy(source, target, table, where=None):
+    copied = 0
+    stmt = select(table)
+    if where is not None:
+        stmt = stmt.where(where)
+    result = source.execution_options(stream_results=True).execute(stmt)
+    for chunk in result.mappings().partitions(COPY_CHUNK):
+        target.execute(insert(table), [dict(r) for r in chunk])
+        copied += len(chunk)
+    return copied
+
+
+def split(source_path, out_dir, shard_map: Optional[Mapping] = None, default_shard: str = "unassigned") -> dict:
+    """Split a single-file database into ``out_dir`` as a catalog plus shards.
+
+    ``shard_map`` maps cooperative ids or names to shard names (e.g. grouping
+    cooperatives by region); without it every cooperative gets a shard of its
+    own.  Farmers go to the shard of their earliest membership, farmers with
+    none to ``default_shard``.  Journals are not copied (each shard starts a
+    fresh one); summaries and sketches are rebuilt per shard.  Returns the
+    number of farmers and sales per shard.
+    """
+    from . import analytics, summaries
+
+    out = Path(out_dir)
+    if (out / CATALOG_FILE).exists():
+        raise FileExistsError(f"{out / CATALOG_FILE} already exists")
+    out.mkdir(parents=True, exist_ok=True)
+    source_engine = create_engine(f"sqlite:///{source_path}", future=True)
+    catalog_engine = _catalog_engine(out / CATALOG_FILE)
+    coops = Base.metadata.tables["cooperatives"]
+    memberships = Base.metadata.tables["memberships"]
+    farmers = Base.metadata.tables["farmers"]
+    shard_map = {str(k): _check_name(v) for k, v in (shard_map or {}).items()}
+    _check_name(default_shard)
+
+    with source_engine.connect() as src:
+        coop_shard = {}
+        for coop_id, name in src.execute(select(coops.c.id, coops.c.name)):
+            coop_shard[coop_id] = shard_map.get(str(coop_id)) or shard_map.get(name) or f"coop-{coop_id}"
+        farmer_shard = {}
+        first = src.execute(
+            select(memberships.c.farmer_id, memberships.c.cooperative_id)
+            .order_by(memberships.c.farmer_id, memberships.c.joined_on.desc(), memberships.c.cooperative_id.desc())
+        )
+        for farmer_id, coop_id in first:
+            farmer_shard[farmer_id] = coop_shard[coop_id]  # last write wins: earliest joined
+        for (farmer_id,) in src.execute(select(farmers.c.id)):
+            farmer_shard.setdefault(farmer_id, default_shard)
+        names = sorted(set(farmer_shard.values()) | set(coop_shard.values()))
+
+        directory.create_all(catalog_engine)
+        Base.metadata.create_all(catalog_engine, tables=catalog_tables())
+        with catalog_engine.begin() as cat:
+            for table in catalog_tables():
+                _copy(src, cat, table)
+            cat.execute(insert(shards_table), [{"name": n, "path": f"shard-{n}.db"} for n in names])
+            if coop_shard:
+                cat.execute(insert(cooperative_shards),
+                            [{"cooperative_id": c, "shard": s} for c, s in coop_shard.items()])
+            if farmer_shard:
+                cat.execute(insert(farmer_shards), [{"farmer_id": f, "shard": s} for f, s in farmer_shard.items()])
+            for table_name, model in GLOBAL_IDS.items():
+                top = src.execute(select(func.max(model.__table__.c.id))).scalar() or 0
+                cat.execute(insert(shard_ids).values(table_name=table_name, next_id=top + 1))
+
+        counts = {}
+        for name in names:
+            owned = [f for f, s in farmer_shard.items() if s == name]
+            engine = _shard_engine(out / f"shard-{name}.db", out / CATALOG_FILE)
+            Base.metadata.create_all(engine, tables=sharded_tables())
+            with engine.begin() as dst:
+                n_farmers = n_sales = 0
+                for i in range(0, len(owned), 500):
+                    ids = owned[i:i + 500]
+                    n_farmers += _copy(src, dst, farmers, farmers.c.id.in_(ids))
+                    _copy(src, dst, memberships, memberships.c.farmer_id.in_(ids))
+                    _copy(src, dst, FarmerActivity.__table__, FarmerActivity.__table__.c.farmer_id.in_(ids))
+                    n_sales += _copy(src, dst, Sale.__table__, Sale.__table__.c.farmer_id.in_(ids))
+                if name == default_shard:
+                    n_sales += _copy(src, dst, Sale.__table__, Sale.__table__.c.farmer_id.is_(None))
+            with Session(engine) as session:
+                summaries.rebuild(session)
+                analytics.rebuild(session)
+            engine.dispose()
+            counts[name] = {"farmers": n_farmers, "sales": n_sales}
+    source_engine.dispose()
+    catalog_engine.dispose()
+    return counts
+
+
+def load_shard_map(path) -> Dict[str, str]:
+    """Read a JSON object mapping cooperative ids or names to shard names."""
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def sales_by_shard(router: ShardRouter) -> list:
+    """Per-shard farmer count, sale count and revenue, for ``shard report``."""
+    def count(session):
+        farmers_n = session.execute(select(func.count()).select_from(Farmer)).scalar()
+        sales_n, revenue = session.execute(
+            select(func.count(), func.coalesce(func.sum(Sale.quantity * Sale.price), 0.0))
+        ).one()
+        return [(session.info["shard"], farmers_n, sales_n, revenue)]
+    return router.fan_out(count)
+
+
+def revenue_by_product(router: ShardRouter, since: Optional[date] = None) -> list:
+    """Sale count and revenue per product name across all shards, highest first."""
+    from .models import ProductType
+
+    def query(session):
+        stmt = (
+            select(ProductType.name, func.count(Sale.id), func.sum(Sale.quantity * Sale.price))
+            .join(Sale, Sale.product_type_id == ProductType.id)
+            .group_by(ProductType.name)
+        )
+        if since is not None:
+            stmt = stmt.where(Sale.created_at >= since)
+        return session.execute(stmt).all()
+
+    return sorted(router.fan_out(query, merge=sum_by_key), key=lambda r: -r[2])
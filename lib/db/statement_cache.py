@@ -0,0 +1,82 @@
+"""Prebuilt statements for hot lookups, and compiled-cache monitoring.
+
+SQLAlchemy caches compiled SQL per engine, keyed by the statement's cache
+key.  A ``select()`` built inside a method has to be constructed and have
+that key generated on every call; a statement built once, with its values
+left as ``bindparam``s, skips both and goes straight to the cached compile.
+The models keep such statements at module level (or per class here, for
+``by_id``) and pass the values at execution time:
+
+    session.scalars(_BY_FARMER, {"farmer_id": 3}).all()
+
+Every engine's compiled cache holds ``COMPILED_CACHE_SIZE`` entries (see
+``database.py``).  ``stats(engine)`` reports how executions fared against it
+and how full it is; a steady stream of misses once the CLI has warmed up
+means the cache is too small or some statement is being rebuilt per call.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+_by_id: Dict[type, object] = {}
+
+
+def by_id(cls):
+    """``SELECT cls WHERE id = :id``, built once per model."""
+    stmt = _by_id.get(cls)
+    if stmt is None:
+        # No autoflush, like session.get().
+        stmt = _by_id[cls] = select(cls).where(cls.id == bindparam("id")).execution_options(autoflush=False)
+    return stmt
+
+
+def get(session: Session, cls, id_):
+    """``session.get(cls, id_)`` that loads misses through ``by_id``.
+
+    Objects already in the identity map are still returned by ``session.get``
+    (which also handles expired and deleted ones); only the database round
+    trip avoids building a new statement.
+    """
+    if id_ is None:
+        return None
+    if session.identity_map.get(session.identity_key(cls, id_)) is not None:
+        return session.get(cls, id_)
+    return session.scalars(by_id(cls), {"id": id_}).first()
+
+
+_OUTCOMES = {"CACHE_HIT": "hits", "CACHE_MISS": "misses", "CACHING_DISABLED": "disabled",
+             "NO_CACHE_KEY": "uncached", "NO_DIALECT_SUPPORT": "uncached"}
+_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(("hits", "misses", "disabled", "uncached"), 0))
+_lock = threading.Lock()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    if context is None:
+        return
+    outcome = _OUTCOMES.get(getattr(context.cache_hit, "name", ""), "uncached")
+    with _lock:
+        _counts[str(conn.engine.url)][outcome] += 1
+
+
+def stats(engine: Engine) -> Dict[str, int]:
+    """Compiled-cache outcomes of ``engine``'s executions, plus its size and capacity.
+
+    ``uncached`` counts driver-level SQL (PRAGMAs, ``text()`` with no cache key).
+    """
+    cache = engine._compiled_cache
+    with _lock:
+        out = dict(_counts[str(engine.url)])
+    out["entries"] = len(cache) if cache is not None else 0
+    out["capacity"] = cache.capacity if cache is not None else 0
+    return out
+
+
+def reset(engine: Engine):
+    with _lock:
+        _counts.pop(str(engine.url), None)
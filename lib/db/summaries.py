@@ -0,0 +1,189 @@
+"""Precomputed sales summaries for the farmer, buyer and product detail pages.
+
+For each farmer, buyer and product type ``sales_summaries`` keeps the sale
+count, revenue (``quantity * price``) and first/last sale date, plus the same
+figures per counterparty.  New sales are added incrementally on flush; a
+deleted or edited sale makes its keys recompute from ``sales`` in the same
+flush.  A key that has never been summarised (e.g. sales recorded before this
+table existed) is computed from SQL on first use, inside the caller's
+transaction (or only returned, on a read-only connection); ``rebuild``
+backfills every key at once.
+"""
+
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, event, func, insert, inspect, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import Buyer, Farmer, Sale, SalesSummary
+
+# dimension -> (sale column for the key, sale column for the counterparty)
+DIMENSIONS = {
+    "farmer": ("farmer_id", "buyer_id"),
+    "buyer": ("buyer_id", "farmer_id"),
+    "product_type": ("product_type_id", "farmer_id"),
+}
+COUNTERPARTS = {"farmer": Buyer, "buyer": Farmer, "product_type": Farmer}
+TOTAL = 0
+
+
+class Summary(NamedTuple):
+    sale_count: int
+    revenue: float
+    first_date: Optional[date]
+    last_date: Optional[date]
+    top: List[Tuple[int, str, int, float]]  # (counterpart id, name, sale count, revenue)
+
+
+def _aggregate(connection, dimension: str, key: int) -> List[dict]:
+    key_col, other_col = (getattr(Sale.__table__.c, c) for c in DIMENSIONS[dimension])
+    amount = Sale.__table__.c.quantity * Sale.__table__.c.price
+    aggregates = (func.count(), func.coalesce(func.sum(amount), 0.0),
+                  func.min(Sale.__table__.c.created_at), func.max(Sale.__table__.c.created_at))
+    total = connection.execute(select(*aggregates).where(key_col == key)).one()
+    rows = [{"dimension": dimension, "key": key, "counterpart": TOTAL, "sale_count": total[0],
+             "revenue": total[1], "first_date": total[2], "last_date": total[3]}]
+    for other, count, revenue, first, last in connection.execute(
+        select(other_col, *aggregates).where(key_col == key, other_col.is_not(None)).group_by(other_col)
+    ):
+        rows.append({"dimension": dimension, "key": key, "counterpart": other, "sale_count": count,
+                     "revenue": revenue, "first_date": first, "last_date": last})
+    return rows
+
+
+def _recompute(connection, dimension: str, key: int):
+    s = SalesSummary.__table__
+    connection.execute(delete(s).where(s.c.dimension == dimension, s.c.key == key))
+    connection.execute(insert(s), _aggregate(connection, dimension, key))
+
+
+def _upsert():
+    s = SalesSummary.__table__
+    stmt = sqlite_insert(s)
+    new = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[s.c.dimension, s.c.key, s.c.counterpart],
+        set_={
+            "sale_count": s.c.sale_count + new.sale_count,
+            "revenue": s.c.revenue + new.revenue,
+            "first_date": func.min(func.coalesce(s.c.first_date, new.first_date), new.first_date),
+            "last_date": func.max(func.coalesce(s.c.last_date, new.last_date), new.last_date),
+        },
+    )
+
+
+_UPSERT = _upsert()
+_KNOWN = (
+    select(SalesSummary.dimension, SalesSummary.key)
+    .where(tuple_(SalesSummary.dimension, SalesSummary.key).in_(bindparam("keys", expanding=True)),
+           SalesSummary.counterpart == TOTAL)
+)
+
+
+def _add(connection, increments: Dict[Tuple[str, int, int], list]):
+    keys = list({(d, k) for d, k, _ in increments})
+    known = set()
+    for i in range(0, len(keys), 500):
+        known.update(connection.execute(_KNOWN, {"keys": keys[i:i + 500]}).all())
+    for dimension, key in keys:
+        if (dimension, key) not in known:
+            _recompute(connection, dimension, key)  # already includes these sales
+
+    rows = [
+        {"dimension": dimension, "key": key, "counterpart": counterpart, "sale_count": count,
+         "revenue": revenue, "first_date": first, "last_date": last}
+        for (dimension, key, counterpart), (count, revenue, first, last) in increments.items()
+        if (dimension, key) in known
+    ]
+    if rows:
+        connection.execute(_UPSERT, rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain(session, flush_context):
+    increments: Dict[Tuple[str, int, int], list] = {}
+    stale: Set[Tuple[str, int]] = set()
+
+    for obj in session.new:
+        if not isinstance(obj, Sale):
+            continue
+        amount = (obj.quantity or 0.0) * (obj.price or 0.0)
+        day = obj.created_at or date.today()
+        for dimension, (key_col, other_col) in DIMENSIONS.items():
+            key = getattr(obj, key_col)
+            if key is None:
+                continue
+            for counterpart in (TOTAL, getattr(obj, other_col)):
+                if counterpart is None:
+                    continue
+                entry = increments.setdefault((dimension, key, counterpart), [0, 0.0, day, day])
+                entry[0] += 1
+                entry[1] += amount
+                entry[2] = min(entry[2], day)
+                entry[3] = max(entry[3], day)
+
+    for obj in list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Sale):
+            continue
+        state = inspect(obj)
+        for dimension, (key_col, _) in DIMENSIONS.items():
+            history = state.attrs[key_col].history
+            for key in list(history.deleted) + list(history.unchanged) + list(history.added):
+                if key is not None:
+                    stale.add((dimension, key))
+
+    if not increments and not stale:
+        return
+    connection = session.connection()
+    for dimension, key in stale:
+        _recompute(connection, dimension, key)
+    _add(connection, {k: v for k, v in increments.items() if (k[0], k[1]) not in stale})
+
+
+def summary(session: Session, dimension: str, key: int, top: int = 5) -> Summary:
+    """Totals and top counterparties by revenue for one farmer/buyer/product."""
+    s = SalesSummary.__table__
+    connection = session.connection()
+    row = connection.execute(
+        select(s.c.sale_count, s.c.revenue, s.c.first_date, s.c.last_date)
+        .where(s.c.dimension == dimension, s.c.key == key, s.c.counterpart == TOTAL)
+    ).first()
+    other = COUNTERPARTS[dimension]
+    if row is None:
+        if not connection.exec_driver_sql("PRAGMA query_only").scalar():
+            # Written into the caller's transaction; persisted when it commits.
+            _recompute(connection, dimension, key)
+            return summary(session, dimension, key, top)
+        rows = _aggregate(connection, dimension, key)
+        leaders = sorted(rows[1:], key=lambda r: -r["revenue"])[:top]
+        names = dict(connection.execute(
+            select(other.id, other.name).where(other.id.in_([r["counterpart"] for r in leaders]))
+        ).all())
+        total = rows[0]
+        return Summary(total["sale_count"], total["revenue"], total["first_date"], total["last_date"],
+                       [(r["counterpart"], names.get(r["counterpart"]), r["sale_count"], r["revenue"])
+                        for r in leaders])
+    leaders = connection.execute(
+        select(s.c.counterpart, other.name, s.c.sale_count, s.c.revenue)
+        .outerjoin(other.__table__, other.id == s.c.counterpart)
+        .where(s.c.dimension == dimension, s.c.key == key, s.c.counterpart != TOTAL)
+        .order_by(s.c.revenue.desc())
+        .limit(top)
+    ).all()
+    return Summary(row.sale_count, row.revenue, row.first_date, row.last_date, [tuple(r) for r in leaders])
+
+
+def rebuild(session: Session) -> int:
+    """Recompute every summary from ``sales``.  Returns the number of keys."""
+    connection = session.connection()
+    connection.execute(delete(SalesSummary.__table__))
+    count = 0
+    for dimension, (key_col, _) in DIMENSIONS.items():
+        column = getattr(Sale.__table__.c, key_col)
+        for (key,) in connection.execute(select(column).where(column.is_not(None)).distinct()).all():
+            _recompute(connection, dimension, key)
+            count += 1
+    session.commit()
+    return count
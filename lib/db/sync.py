@@ -0,0 +1,432 @@
+"""Delta sync between field-office copies of ``smart_farm.db``.
+
+Export writes every row changed since the last export to a given peer as a
+gzip'd JSON-lines delta.  Per-table high-water marks are journal sequence
+numbers (see ``lib.db.journal``), stored as ``journal_consumers`` rows named
+``sync:<peer>:<table>`` so journal compaction never trims unsynced history.
+The first export to a peer (or one whose history was compacted away) sends a
+full snapshot of the table instead.
+
+Rows travel by natural key, never by local id:
+
+    activities, cooperatives, product_types   name
+    buyers                                    (name, organization)
+    farmers                                   national_id
+    memberships                               (cooperative, farmer)
+    farmer_activities                         (farmer, activity)
+    sales                                     sync_key (a UUID given when the sale is created)
+
+Conflicts are resolved the same way in every office: the change with the
+later timestamp wins, ties go to the office name that sorts last.  Every
+record carries the time (``ts``) and office (``o``) its change was first made
+in; an applied change is journaled with both (``created_at=ts``,
+``origin="sync:<o>"``), so a relayed change keeps its version and offices
+converge whatever order deltas arrive in.  Changes are not sent back to the
+office they were made in.
+"""
+
+import gzip
+import json
+from datetime import date, datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from . import lookups
+from .batch import batch, commit
+from . import journal
+from .journal import ORIGIN_KEY, TIMESTAMP_KEY
+from .models import (
+    Activity, Buyer, ChangeJournal, Cooperative, Farmer, FarmerActivity,
+    JournalConsumer, Membership, ProductType, Sale,
+)
+from .models.lookup import encoded_properties
+
+FORMAT = "smart-farm-delta"
+VERSION = 1
+SYNC_ORIGIN = "sync:"
+
+
+class TableSpec(NamedTuple):
+    model: type
+    natural: Tuple[str, ...]
+    refs: Dict[str, str]
+
+    @property
+    def table(self) -> str:
+        return self.model.__tablename__
+
+
+# Parents before children, so references resolve on apply.
+SPECS: Tuple[TableSpec, ...] = (
+    TableSpec(Activity, ("name",), {}),
+    TableSpec(ProductType, ("name",), {}),
+    TableSpec(Buyer, ("name", "organization"), {}),
+    TableSpec(Cooperative, ("name",), {}),
+    TableSpec(Farmer, ("national_id",), {"activity_id": "activities"}),
+    TableSpec(Membership, ("cooperative_id", "farmer_id"), {"cooperative_id": "cooperatives", "farmer_id": "farmers"}),
+    TableSpec(FarmerActivity, ("farmer_id", "activity_id"), {"farmer_id": "farmers", "activity_id": "activities"}),
+    TableSpec(Sale, ("sync_key",), {"farmer_id": "farmers", "buyer_id": "buyers", "product_type_id": "product_types"}),
+)
+BY_TABLE = {s.table: s for s in SPECS}
+
+
+class SyncReport(NamedTuple):
+    applied: Dict[str, int]
+    skipped: Dict[str, int]
+    errors: List[Tuple[str, str]]
+
+
+def _watermark_name(peer: str, table: str) -> str:
+    name = f"sync:{peer}:{table}"
+    if len(name) > 50:
+        raise ValueError(f"Peer name {peer!r} is too long")
+    return name
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _pk_columns(model):
+    return [c.key for c in model.__mapper__.primary_key]
+
+
+def _columns(model):
+    return [p.key for p in model.__mapper__.column_attrs]
+
+
+class _KeyResolver:
+    """Translates local ids to natural keys and back, memoising lookups."""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self._to_key: Dict[Tuple[str, int], Optional[list]] = {}
+        self._to_id: Dict[Tuple[str, str], Optional[int]] = {}
+
+    def natural_key(self, table: str, row: dict) -> Optional[list]:
+        spec = BY_TABLE[table]
+        key = []
+        for col in spec.natural:
+            value = row.get(col)
+            if col in spec.refs and value is not None:
+                value = self.key_for_id(spec.refs[col], value)
+                if value is None:
+                    return None
+            key.append(value)
+        if all(v is None for v in key):
+            return None  # e.g. a sale written outside the ORM, before it got a sync_key
+        return key
+
+    def key_for_id(self, table: str, id_: int) -> Optional[list]:
+        cache_key = (table, id_)
+        if cache_key not in self._to_key:
+            model = BY_TABLE[table].model
+            row = self.session.execute(select(model.__table__).where(model.id == id_)).mappings().first()
+            if row is None:
+                # Deleted since: fall back to the before-image in the journal.
+                data = self.session.execute(
+                    select(ChangeJournal.data)
+                    .where(ChangeJournal.table_name == table, ChangeJournal.row_key == json.dumps([id_]))
+                    .where(ChangeJournal.op == "D")
+                    .order_by(ChangeJournal.seq.desc())
+                    .limit(1)
+                ).scalar()
+                row = json.loads(data) if data else None
+            self._to_key[cache_key] = self.natural_key(table, dict(row)) if row else None
+        return self._to_key[cache_key]
+
+    def id_for_key(self, table: str, key: list) -> Optional[int]:
+        cache_key = (table, json.dumps(key, default=_json_default))
+        if cache_key not in self._to_id:
+            obj = self.find(table, key)
+            self._to_id[cache_key] = obj.id if obj is not None else None
+        return self._to_id[cache_key]
+
+    def remember(self, table: str, key: list, id_: Optional[int]):
+        self._to_id[(table, json.dumps(key, default=_json_default))] = id_
+
+    def local_values(self, table: str, key: list) -> Optional[dict]:
+        """Natural-key columns converted to local column values (ids for refs)."""
+        spec = BY_TABLE[table]
+        values = {}
+        for col, value in zip(spec.natural, key):
+            if col in spec.refs and value is not None:
+                value = self.id_for_key(spec.refs[col], value)
+                if value is None:
+                    return None
+            else:
+                value = _decode_value(spec.model, col, value)
+            values[col] = value
+        return values
+
+    def find(self, table: str, key: list):
+        spec = BY_TABLE[table]
+        values = self.local_values(table, key)
+        if values is None:
+            return None
+        model = spec.model
+        clauses = [
+            getattr(model, col).is_(None) if v is None else getattr(model, col) == v
+            for col, v in values.items()
+        ]
+        return self.session.execute(select(model).where(and_(*clauses)).limit(1)).scalars().first()
+
+
+def _encode_row(resolver: _KeyResolver, spec: TableSpec, row: dict) -> dict:
+    skip = set(_pk_columns(spec.model)) | set(spec.natural)
+    # Dictionary-encoded columns travel as their strings, under the property name.
+    encoded = {e.id_column: name for name, e in encoded_properties(spec.model).items()}
+    out = {}
+    for col in _columns(spec.model):
+        if col in skip:
+            continue
+        value = row.get(col)
+        if col in encoded:
+            out[encoded[col]] = lookups.value_for(resolver.session.connection(), value)
+            continue
+        if col in spec.refs and value is not None:
+            value = resolver.key_for_id(spec.refs[col], value)
+        out[col] = value
+    return out
+
+
+def _made_in(origin: Optional[str], office: str) -> str:
+    """The office a journaled change was first made in."""
+    if origin is not None and origin.startswith(SYNC_ORIGIN):
+        return origin[len(SYNC_ORIGIN):]
+    return office
+
+
+def _changed_ids(session: Session, table: str, since: int, head: int, peer: str) -> Dict[str, tuple]:
+    """Latest (op, timestamp, origin, before-image) per row key changed in ``(since, head]``."""
+    j = ChangeJournal.__table__
+    latest: Dict[str, tuple] = {}
+    stmt = (
+        select(j.c.row_key, j.c.op, j.c.created_at, j.c.origin, j.c.data)
+        .where(j.c.table_name == table, j.c.seq > since, j.c.seq <= head)
+        .order_by(j.c.seq)
+    )
+    for row_key, op, created_at, origin, data in session.execute(stmt):
+        latest[row_key] = (op, created_at, origin, data)
+    # Only the latest change counts: a peer's change since overwritten here must go back.
+    return {k: v for k, v in latest.items() if v[2] != SYNC_ORIGIN + peer}
+
+
+def _export_table(session: Session, resolver: _KeyResolver, spec: TableSpec, peer: str, office: str,
+                  head: int) -> Tuple[Iterator[dict], int]:
+    model = spec.model
+    table = model.__table__
+    mark = session.get(JournalConsumer, _watermark_name(peer, spec.table))
+    oldest = session.execute(select(func.min(ChangeJournal.seq))).scalar()
+    full = mark is None or (oldest is not None and oldest > mark.last_seq + 1)
+
+    def snapshot():
+        # A row's version is its last journaled change, as in a delta; rows
+        # untouched since the journal began fall back to last_updated.
+        pks = _pk_columns(model)
+        versions = {row_key: (ts, origin) for row_key, ts, origin in session.execute(
+            select(ChangeJournal.row_key, ChangeJournal.created_at, ChangeJournal.origin)
+            .where(ChangeJournal.table_name == spec.table, ChangeJournal.op != "D")
+            .order_by(ChangeJournal.seq)
+        )}
+        rows = session.execute(select(table).execution_options(yield_per=1000)).mappings()
+        for row in rows:
+            row = dict(row)
+            key = resolver.natural_key(spec.table, row)
+            if key is not None:
+                row_key = json.dumps([row[c] for c in pks], separators=(",", ":"))
+                ts, origin = versions.get(row_key, (row.get("last_updated"), None))
+                yield {"t": spec.table, "op": "U", "k": key, "ts": ts, "o": _made_in(origin, office),
+                       "row": _encode_row(resolver, spec, row)}
+
+    if full:
+        return snapshot(), head
+
+    changed = _changed_ids(session, spec.table, mark.last_seq, head, peer)
+
+    def delta():
+        pks = _pk_columns(model)
+        for row_key, (op, ts, origin, data) in changed.items():
+            ids = json.loads(row_key)
+            made_in = _made_in(origin, office)
+            if op == "D":
+                before = json.loads(data) if data else None
+                key = resolver.natural_key(spec.table, before) if before else None
+                if key is not None:
+                    yield {"t": spec.table, "op": "D", "k": key, "ts": ts, "o": made_in}
+                continue
+            where = and_(*(table.c[c] == v for c, v in zip(pks, ids)))
+            row = session.execute(select(table).where(where)).mappings().first()
+            if row is None:
+                continue
+            key = resolver.natural_key(spec.table, dict(row))
+            if key is not None:
+                yield {"t": spec.table, "op": "U", "k": key, "ts": ts, "o": made_in,
+                       "row": _encode_row(resolver, spec, dict(row))}
+
+    return delta(), head
+
+
+def export_delta(session: Session, path: str, peer: str, office: str) -> Dict[str, int]:
+    """Write changes not yet sent to ``peer`` and advance its watermarks."""
+    resolver = _KeyResolver(session)
+    head = session.execute(select(func.max(ChangeJournal.seq))).scalar() or 0
+    counts: Dict[str, int] = {}
+    marks: Dict[str, int] = {}
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        header = {"format": FORMAT, "version": VERSION, "office": office, "peer": peer,
+                  "created_at": datetime.utcnow()}
+        fh.write(json.dumps(header, default=_json_default) + "\n")
+        for spec in SPECS:
+            records, mark = _export_table(session, resolver, spec, peer, office, head)
+            n = 0
+            for record in records:
+                fh.write(json.dumps(record, default=_json_default, separators=(",", ":")) + "\n")
+                n += 1
+            counts[spec.table] = n
+            marks[spec.table] = mark
+
+    for table, mark in marks.items():
+        name = _watermark_name(peer, table)
+        row = session.get(JournalConsumer, name) or JournalConsumer(name=name)
+        row.last_seq = mark
+        session.add(row)
+    session.commit()
+    return counts
+
+
+def _local_change(session: Session, table: str, obj, office: str) -> Tuple[Optional[datetime], str]:
+    """The row's version: (time, office) of its last journaled change."""
+    pks = [getattr(obj, c) for c in _pk_columns(type(obj))]
+    row = session.execute(
+        select(ChangeJournal.created_at, ChangeJournal.origin)
+        .where(ChangeJournal.table_name == table, ChangeJournal.row_key == json.dumps(pks, separators=(",", ":")))
+        .order_by(ChangeJournal.seq.desc())
+        .limit(1)
+    ).first()
+    if row is not None:
+        return row.created_at, _made_in(row.origin, office)
+    return getattr(obj, "last_updated", None), office
+
+
+def _incoming_wins(incoming_ts, incoming_office: str, local_ts, local_office: str) -> bool:
+    if incoming_ts is not None and local_ts is not None and incoming_ts != local_ts:
+        return incoming_ts > local_ts
+    if incoming_ts is None and local_ts is not None:
+        return False
+    if local_ts is None and incoming_ts is not None:
+        return True
+    return incoming_office > local_office
+
+
+def _decode_value(model, col: str, value):
+    if value is None or col not in model.__table__.c:
+        return value
+    py_type = model.__table__.c[col].type.python_type
+    if py_type is date:
+        return date.fromisoformat(value)
+    if py_type is datetime:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def read_delta(path: str) -> Tuple[dict, Iterator[dict]]:
+    fh = gzip.open(path, "rt", encoding="utf-8")
+    header = json.loads(fh.readline())
+    if header.get("format") != FORMAT or header.get("version") != VERSION:
+        fh.close()
+        raise ValueError(f"{path} is not a {FORMAT} v{VERSION} file")
+
+    def records():
+        with fh:
+            for line in fh:
+                yield json.loads(line)
+
+    return header, records()
+
+
+def apply_delta(session: Session, path: str, office: str, chunk: int = 1000) -> SyncReport:
+    """Apply a delta from another office in chunked transactions."""
+    header, records = read_delta(path)
+    source = header["office"]
+    if source == office:
+        raise ValueError("Refusing to apply a delta exported by this office")
+
+    resolver = _KeyResolver(session)
+    applied: Dict[str, int] = {}
+    skipped: Dict[str, int] = {}
+    try:
+        with batch(session, max_rows=chunk, max_latency_ms=60_000) as b:
+            for record in records:
+                table = record["t"]
+                spec = BY_TABLE.get(table)
+                if spec is None:
+                    continue
+                ts = datetime.fromisoformat(record["ts"]) if record.get("ts") else None
+                made_in = record.get("o") or source
+                if made_in == office:
+                    # Our own change relayed back; the row here is as new or newer.
+                    skipped[table] = skipped.get(table, 0) + 1
+                    continue
+                session.info[ORIGIN_KEY] = SYNC_ORIGIN + made_in
+                session.info[TIMESTAMP_KEY] = ts
+                with b.row(f"{table} {record['k']}"):
+                    if _apply_record(session, resolver, spec, record, ts, made_in, office):
+                        applied[table] = applied.get(table, 0) + 1
+                    else:
+                        skipped[table] = skipped.get(table, 0) + 1
+    finally:
+        session.info.pop(ORIGIN_KEY, None)
+        session.info.pop(TIMESTAMP_KEY, None)
+    errors = [(str(key), str(exc)) for key, exc in b.errors]
+    return SyncReport(applied, skipped, errors)
+
+
+def _apply_record(session: Session, resolver: _KeyResolver, spec: TableSpec, record: dict,
+                  ts: Optional[datetime], source: str, office: str) -> bool:
+    table, key = spec.table, record["k"]
+    obj = resolver.find(table, key)
+    if obj is not None:
+        local_ts, local_office = _local_change(session, table, obj, office)
+        if not _incoming_wins(ts, source, local_ts, local_office):
+            return False
+
+    if record["op"] == "D":
+        if obj is None:
+            return False
+        session.delete(obj)
+        commit(session)
+        resolver.remember(table, key, None)
+        return True
+
+    values = resolver.local_values(table, key)
+    if values is None:
+        raise LookupError(f"unresolved reference in {table} key {key}")
+    for col, value in record["row"].items():
+        if col in spec.refs and value is not None:
+            value = resolver.id_for_key(spec.refs[col], value)
+            if value is None:
+                raise LookupError(f"unresolved {col} for {table} key {key}")
+        else:
+            value = _decode_value(spec.model, col, value)
+        values[col] = value
+
+    if obj is None:
+        obj = spec.model(**values)
+        session.add(obj)
+    else:
+        for col, value in values.items():
+            setattr(obj, col, value)
+        if not session.is_modified(obj):
+            # Same values, newer version: journal it so it is what later changes lose to.
+            pks = [getattr(obj, c) for c in _pk_columns(spec.model)]
+            journal.record(session.connection(), table, "U", [pks], [{}],
+                           origin=session.info[ORIGIN_KEY], created_at=ts)
+    commit(session)
+    if "id" in spec.model.__table__.c:
+        resolver.remember(table, key, obj.id)
+    return True
@@ -3,6 +3,8 @@ from typing import Callable, Optional, Tuple
 from datetime import date, datetime
 from sqlalchemy.exc import IntegrityError
 from lib.db.database import SessionLocal
+from lib.db.batch import commit, active_batch
+from lib.db import prefix_index
 from lib.db.models import Membership  
 
 def with_session(auto_commit: bool = False):
@@ -73,6 +75,21 @@ def input_confirm(prompt: str, default: bool = False) -> bool:
             return False
         print("Please enter Y or N.")
 
+_action_hook: Optional[Callable[[str, str], None]] = None
+
+
+def set_action_hook(hook: Optional[Callable[[str, str], None]]):
+    """Install ``hook(menu, choice)``, called whenever a menu option is picked."""
+    global _action_hook
+    _action_hook = hook
+
+
+def input_choice(menu: str) -> str:
+    choice = input("> ").strip()
+    if _action_hook is not None:
+        _action_hook(menu, choice)
+    return choice
+
 def input_int(prompt: str) -> int:
     while True:
         v = input(prompt).strip()
@@ -90,6 +107,16 @@ def input_float(prompt: str) -> float:
             print("Please enter a valid number")
 
 
+def input_optional_float(prompt: str) -> Optional[float]:
+    while True:
+        v = input(prompt).strip()
+        if v == "":
+            return None
+        try:
+            return float(v)
+        except ValueError:
+            print("Please enter a valid number or leave blank")
+
 def input_date(prompt: str) -> Optional[date]:
     while True:
         v = input(prompt).strip()
@@ -100,17 +127,55 @@ def input_date(prompt: str) -> Optional[date]:
         except Exception:
             print("Please enter a valid date in YYYY-MM-DD format or leave blank.")
 
+PICK_HEADERS = {
+    "farmers": ["id", "name", "nat_id", "phone"],
+    "activities": ["id", "name"],
+    "cooperatives": ["id", "name"],
+    "buyers": ["id", "name", "org"],
+    "product_types": ["id", "name"],
+}
+
+
+def input_pick(session, source: str, prompt: str, limit: int = 10) -> Optional[int]:
+    """Type-to-narrow picker over a ``prefix_index`` source; returns an id or None.
+
+    Each line typed is searched as word prefixes (name, national id, phone)
+    and the top ``limit`` matches are shown.  ``#<id>`` picks an id directly,
+    a blank line takes the only remaining match, or cancels if there is none.
+    """
+    index = prefix_index.index_for(session, source)
+    matches = []
+    while True:
+        v = input(f"{prompt} (type to search, #id to choose, blank to {'accept' if len(matches) == 1 else 'cancel'}): ").strip()
+        if v == "":
+            return matches[0][0] if len(matches) == 1 else None
+        if v.startswith("#"):
+            if v[1:].isdigit() and int(v[1:]) in index:
+                return int(v[1:])
+            print(f"No {source.replace('_', ' ')} with id {v[1:]}")
+            continue
+        matches, more = index.search(v, limit)
+        if not matches:
+            print("No matches")
+            continue
+        print_table(matches, PICK_HEADERS[source])
+        if more:
+            print(f"(showing the first {limit}; type more to narrow)")
+
+
 def safe_add_membership(session, farmer, coop, role: str = "Member") -> Tuple[Optional[Membership], bool]:
-    existing = session.query(Membership).filter_by(farmer_id=farmer.id, cooperative_id=coop.id).first()
+    existing = Membership.find(session, farmer.id, coop.id)
     if existing:
         return existing, False
 
     m = Membership(farmer=farmer, cooperative=coop, role=role, joined_on=date.today())
     session.add(m)
     try:
-        session.commit()
+        commit(session)
         return m, True
     except IntegrityError:
+        if active_batch(session) is not None:
+            raise
         session.rollback()
-        existing = session.query(Membership).filter_by(farmer_id=farmer.id, cooperative_id=coop.id).first()
+        existing = Membership.find(session, farmer.id, coop.id)
         return existing, False
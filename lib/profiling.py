@@ -0,0 +1,183 @@
+"""Per-menu-action CPU and memory profiling for ``python -m lib.cli --profile``.
+
+Each menu choice starts a new action (e.g. ``cooperatives:4``) that runs
+until the next menu choice; time spent inside ``input()`` is left out of its
+wall time, as in ``metrics.ActionTimer``.  For every action the profiler writes
+
+    <dir>/<session>/<seq>-<action>.prof        cProfile stats (pstats format)
+    <dir>/<session>/<seq>-<action>.alloc.json  top tracemalloc growth, timings and
+                                               compiled-statement cache hits/misses
+
+``python -m lib.cli profile-report`` summarises the latest session.  When
+``--profile`` is not given nothing here is imported or installed; the only
+cost is a ``None`` check in ``helpers.input_choice``.
+"""
+
+import builtins
+import cProfile
+import json
+import pstats
+import re
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_DIR = Path("profiles")
+TOP_ALLOCATIONS = 25
+# Time spent waiting at prompts is not work; keep it out of the hot list.
+_IGNORED_FUNCTIONS = {"<built-in method builtins.input>"}
+
+
+def _compiled_cache() -> dict:
+    from lib.db import statement_cache
+    from lib.db.database import SessionLocal
+
+    return statement_cache.stats(SessionLocal.kw["bind"])
+
+
+class ActionProfiler:
+    def __init__(self, out_dir: Path = DEFAULT_DIR):
+        self.dir = Path(out_dir) / time.strftime("%Y%m%d-%H%M%S")
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._seq = 0
+        self._label: Optional[str] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot = None
+        self._started = 0.0
+        self._prompt = 0.0
+        self._cache_before: dict = {}
+        self._input = None
+
+    def start(self):
+        # Chain onto the input() in place now: ActionTimer may have wrapped it first.
+        original = self._input = builtins.input
+
+        def timed_input(*args):
+            start = time.perf_counter()
+            try:
+                return original(*args)
+            finally:
+                self._prompt += time.perf_counter() - start
+
+        builtins.input = timed_input
+        tracemalloc.start(10)
+
+    def on_choice(self, menu: str, choice: str):
+        self._finish()
+        self._begin(f"{menu}:{choice or 'blank'}")
+
+    def close(self):
+        self._finish()
+        tracemalloc.stop()
+        if self._input is not None:
+            builtins.input = self._input
+        print(f"Profiles written to {self.dir}")
+
+    def _begin(self, label: str):
+        self._seq += 1
+        self._label = label
+        self._snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        self._cache_before = _compiled_cache()
+        self._profile = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._prompt = 0.0
+        self._profile.enable()
+
+    def _finish(self):
+        if self._profile is None:
+            return
+        self._profile.disable()
+        wall = max(0.0, time.perf_counter() - self._started - self._prompt)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        cache = _compiled_cache()
+
+        stem = f"{self._seq:04d}-{re.sub(r'[^A-Za-z0-9_.-]', '_', self._label)}"
+        self._profile.dump_stats(self.dir / f"{stem}.prof")
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(ignore).compare_to(self._snapshot.filter_traces(ignore), "lineno")[:TOP_ALLOCATIONS]
+        record = {
+            "action": self._label,
+            "wall_seconds": wall,
+            "peak_bytes": peak,
+            "compiled_cache": {
+                "hits": cache["hits"] - self._cache_before.get("hits", 0),
+                "misses": cache["misses"] - self._cache_before.get("misses", 0),
+                "entries": cache["entries"],
+            },
+            "allocations": [
+                {
+                    "location": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                    "size_diff": s.size_diff,
+                    "count_diff": s.count_diff,
+                }
+                for s in diff
+            ],
+        }
+        (self.dir / f"{stem}.alloc.json").write_text(json.dumps(record, indent=1))
+        self._profile = None
+        self._snapshot = None
+
+
+def latest_session(base: Path = DEFAULT_DIR) -> Optional[Path]:
+    sessions = sorted(p for p in Path(base).iterdir() if p.is_dir()) if Path(base).is_dir() else []
+    return sessions[-1] if sessions else None
+
+
+def report(path: Optional[Path] = None, top: int = 15):
+    """Print the slowest actions, hottest functions and biggest allocators."""
+    from lib.helpers import print_table
+
+    session_dir = Path(path) if path else latest_session()
+    if session_dir is None or not session_dir.is_dir():
+        print("No profile sessions found")
+        return
+
+    records = [json.loads(p.read_text()) for p in sorted(session_dir.glob("*.alloc.json"))]
+    print(f"Session {session_dir} ({len(records)} actions)")
+
+    by_action = defaultdict(lambda: [0, 0.0, 0, 0])
+    for r in records:
+        entry = by_action[r["action"]]
+        entry[0] += 1
+        entry[1] += r["wall_seconds"]
+        entry[2] = max(entry[2], r["peak_bytes"])
+        entry[3] += r.get("compiled_cache", {}).get("misses", 0)
+    rows = sorted(by_action.items(), key=lambda kv: -kv[1][1])[:top]
+    print_table(
+        [(a, n, f"{t:.3f}", f"{peak / 1024:.0f}", misses) for a, (n, t, peak, misses) in rows],
+        ["action", "runs", "wall s", "peak KiB", "compiles"],
+    )
+
+    prof_files = sorted(session_dir.glob("*.prof"))
+    if prof_files:
+        stats = pstats.Stats(str(prof_files[0]))
+        for p in prof_files[1:]:
+            stats.add(str(p))
+        hot = []
+        for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+            label = pstats.func_std_string((filename, line, name))
+            if label in _IGNORED_FUNCTIONS:
+                continue
+            hot.append((label, nc, tt, ct))
+        hot.sort(key=lambda r: -r[2])
+        print("Hottest functions (own time):")
+        print_table(
+            [(label[-70:], calls, f"{tt:.4f}", f"{ct:.4f}") for label, calls, tt, ct in hot[:top]],
+            ["function", "calls", "tottime", "cumtime"],
+        )
+
+    allocators = defaultdict(lambda: [0, 0])
+    for r in records:
+        for a in r["allocations"]:
+            allocators[a["location"]][0] += a["size_diff"]
+            allocators[a["location"]][1] += a["count_diff"]
+    biggest = sorted(allocators.items(), key=lambda kv: -kv[1][0])[:top]
+    print("Biggest allocators (net growth across actions):")
+    print_table(
+        [(loc[-70:], f"{size / 1024:.1f}", count) for loc, (size, count) in biggest],
+        ["location", "KiB", "blocks"],
+    )
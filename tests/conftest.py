@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from lib.db.database import sqlite_transactions
+from lib.db.models import init_db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "smart_farm.db"
+
+
+def open_db(path):
+    engine = sqlite_transactions(create_engine(f"sqlite:///{path}", future=True))
+    init_db(engine)
+    return engine
+
+
+@pytest.fixture
+def engine(db_path):
+    engine = open_db(db_path)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def Session(engine):
+    return sessionmaker(bind=engine, future=True)
+
+
+@pytest.fixture
+def peek(db_path):
+    """Count rows from a second connection, as another clerk would see them."""
+    conn = sqlite3.connect(str(db_path))
+
+    def count(table, where="1"):
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}").fetchone()[0]
+
+    yield count
+    conn.close()
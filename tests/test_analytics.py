@@ -0,0 +1,16 @@
+from sqlalchemy import text
+
+from lib.db import analytics
+from lib.db.models import Buyer, Farmer, ProductType, Sale
+
+
+def test_buyers_without_a_sketch_are_counted_exactly(engine, Session):
+    with Session() as session:
+        farmer = Farmer.create(session, name="F", national_id="ID1")
+        Sale.create(session, farmer, Buyer.create(session, name="B"), ProductType.create(session, name="Milk"),
+                    quantity=2, price=50)
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM sales_sketches"))  # as for sales older than the sketches
+
+        result = analytics.distinct_buyers(session, farmer.id)
+        assert str(result) == "1 (exact)"
@@ -0,0 +1,39 @@
+from sqlalchemy import text
+
+from lib.db import backfill
+from lib.db.models import Sale
+
+
+def _legacy_sales(engine, count):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO sales (quantity, price, created_at) VALUES (2, 3.5, '2024-05-01')"),
+                     [{}] * count)
+        conn.execute(text("UPDATE sales SET total_amount = NULL"))
+
+
+def test_only_an_interrupted_run_reports_resuming(engine):
+    _legacy_sales(engine, 10)
+
+    def stop(key, high, rows):
+        raise KeyboardInterrupt
+
+    try:
+        backfill.run(engine, backfill.SALE_TOTAL_AMOUNT, batch_size=4, duty_cycle=1, on_batch=stop)
+    except KeyboardInterrupt:
+        pass
+    assert backfill.run(engine, backfill.SALE_TOTAL_AMOUNT, batch_size=4, duty_cycle=1).resumed_from == 4
+    assert backfill.run(engine, backfill.SALE_TOTAL_AMOUNT, duty_cycle=1).resumed_from is None
+    assert backfill.run(engine, backfill.SALE_TOTAL_AMOUNT, duty_cycle=1, restart=True).resumed_from is None
+
+
+def test_updating_a_sale_leaves_missing_quantity_alone(engine, Session, peek):
+    _legacy_sales(engine, 1)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE sales SET quantity = NULL"))
+
+    with Session() as session:
+        sale = session.get(Sale, 1)
+        sale.price = 4.0
+        session.commit()
+    assert peek("sales", "quantity IS NULL AND total_amount IS NULL") == 1
+    assert backfill.verify(engine, backfill.SALE_TOTAL_AMOUNT, duty_cycle=1, repair=False) == 0
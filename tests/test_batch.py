@@ -0,0 +1,28 @@
+import pytest
+
+from lib.db.batch import batch
+from lib.db.models import Farmer
+
+
+def test_rows_are_invisible_until_the_batch_commits(Session, peek):
+    with Session() as session:
+        with batch(session, max_rows=100, max_latency_ms=60_000) as b:
+            for i in range(3):
+                with b.row(i):
+                    Farmer.create(session, name=f"Farmer {i}", national_id=f"ID{i}")
+            assert peek("farmers") == 0
+        assert b.commits == 1
+    assert peek("farmers") == 3
+
+
+def test_a_failing_row_is_skipped_and_an_aborted_batch_keeps_nothing(Session, peek):
+    with Session() as session:
+        with pytest.raises(KeyboardInterrupt):
+            with batch(session, max_rows=100, max_latency_ms=60_000) as b:
+                with b.row("ok"):
+                    Farmer.create(session, name="A", national_id="ID1")
+                with b.row("duplicate"):
+                    Farmer.create(session, name="B", national_id="ID1")
+                assert [key for key, _ in b.errors] == ["duplicate"]
+                raise KeyboardInterrupt
+    assert peek("farmers") == 0
@@ -0,0 +1,23 @@
+from lib.db import lookups
+from lib.db.models import Buyer
+from lib.db.models.lookup import PAYMENT_METHOD
+
+
+def test_an_uncommitted_lookup_id_is_not_shared(engine, Session, peek):
+    with Session() as a, Session() as b:
+        buyer = Buyer.create(a, name="A")
+        buyer.preferred_payment_method = "Cash"
+        a.flush()
+        twin = Buyer(name="A2", preferred_payment_method=" cash ")
+        a.add(twin)
+        a.flush()
+        assert twin.payment_method_id == buyer.payment_method_id
+
+        with engine.connect() as other:
+            assert ("payment_method", "cash") not in lookups.lookup_map(other)._ids
+            assert lookups.id_for(other, PAYMENT_METHOD, "Cash", create=False) is None
+        a.rollback()
+
+        Buyer.create(b, name="B", preferred_payment_method="Cash")
+    assert peek("buyers", "payment_method_id NOT IN (SELECT id FROM lookups)") == 0
+    assert peek("lookups", "key = 'cash'") == 1
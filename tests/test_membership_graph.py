@@ -0,0 +1,49 @@
+import sqlite3
+
+from sqlalchemy.orm import sessionmaker
+
+from lib.db.membership_graph import graph_for
+from lib.db.models import Cooperative, Farmer, Membership
+
+from .conftest import open_db
+
+
+def _seed(session):
+    farmers = [Farmer.create(session, name=f"F{i}", national_id=f"ID{i}") for i in range(3)]
+    coop = Cooperative.create(session, name="North")
+    for f in farmers[:2]:
+        session.add(Membership(farmer=f, cooperative=coop))
+    session.commit()
+    return [f.id for f in farmers], coop.id
+
+
+def test_each_database_has_its_own_graph(Session, tmp_path):
+    other = open_db(tmp_path / "other.db")
+    try:
+        with Session() as a, sessionmaker(bind=other, future=True)() as b:
+            (f1, f2, f3), coop = _seed(a)
+            _seed(b)
+            graph = graph_for(a)
+            assert graph is not graph_for(b)
+            b.add(Membership(farmer_id=f3, cooperative_id=coop))
+            b.commit()
+            assert graph_for(a).members_of(coop) == {f1, f2}
+            assert graph_for(b).members_of(coop) == {f1, f2, f3}
+    finally:
+        other.dispose()
+
+
+def test_commits_apply_incrementally_and_other_processes_force_a_rebuild(Session, db_path):
+    with Session() as session:
+        (f1, f2, f3), coop = _seed(session)
+        graph = graph_for(session)
+        session.add(Membership(farmer_id=f3, cooperative_id=coop))
+        session.commit()
+        assert graph.stats()["overlay"] == 1
+        assert graph_for(session).members_of(coop) == {f1, f2, f3}
+
+        outside = sqlite3.connect(str(db_path))
+        outside.execute("DELETE FROM memberships WHERE farmer_id = ?", (f1,))
+        outside.commit()
+        outside.close()
+        assert graph_for(session).members_of(coop) == {f2, f3}
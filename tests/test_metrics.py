@@ -0,0 +1,14 @@
+from lib.db import metrics
+from lib.db.models import Farmer
+
+
+def test_rows_read_counts_read_model_rows(Session):
+    metrics.install()
+    counter = metrics.rows_read.labels("Farmer")
+    with Session() as session:
+        farmers = [Farmer.create(session, name=f"F{i}", national_id=f"ID{i}") for i in range(5)]
+        before = counter.value
+        assert len(Farmer.list_rows(session)) == 5
+        assert len(Farmer.list_view(session)) == 5
+        assert Farmer.detail_view(session, farmers[0].id) is not None
+        assert counter.value - before == 11
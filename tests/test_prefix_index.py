@@ -0,0 +1,32 @@
+import sqlite3
+
+from lib.db.models import Farmer
+from lib.db.prefix_index import index_for
+
+
+def _ids(index, query):
+    return [row[0] for row in index.search(query)[0]]
+
+
+def test_country_code_is_only_stripped_from_international_numbers(Session):
+    with Session() as session:
+        by_id = Farmer.create(session, name="Achieng", national_id="25412345", phone="0799 000111")
+        by_phone = Farmer.create(session, name="Kamau", national_id="30000001", phone="0712 345678")
+        index = index_for(session, "farmers")
+        assert _ids(index, "25412") == [by_id.id]
+        assert _ids(index, "+254 712") == [by_phone.id]
+
+
+def test_new_connection_rebuilds_after_an_outside_commit(Session, engine, db_path):
+    with Session() as session:
+        Farmer.create(session, name="Achieng", national_id="25412345")
+        assert len(index_for(session, "farmers")) == 1
+
+    outside = sqlite3.connect(str(db_path))
+    outside.execute("INSERT INTO farmers (name, national_id) VALUES ('Kamau', '30000001')")
+    outside.commit()
+    outside.close()
+    engine.dispose()
+
+    with Session() as session:
+        assert _ids(index_for(session, "farmers"), "kamau")
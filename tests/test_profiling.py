@@ -0,0 +1,46 @@
+import builtins
+import json
+import time
+
+from lib import profiling
+
+
+def test_wall_time_excludes_prompts(tmp_path, monkeypatch):
+    def slow_input(*args):
+        time.sleep(0.3)
+        return "1"
+
+    monkeypatch.setattr(builtins, "input", slow_input)
+    monkeypatch.setattr(profiling, "_compiled_cache", lambda: {"hits": 0, "misses": 0, "entries": 0})
+    profiler = profiling.ActionProfiler(tmp_path)
+    profiler.start()
+    profiler.on_choice("main", "1")
+    input("> ")
+    profiler.close()
+
+    assert builtins.input is slow_input
+    (record,) = [json.loads(p.read_text()) for p in profiler.dir.glob("*.alloc.json")]
+    assert record["wall_seconds"] < 0.2
+
+
+def test_prompt_time_is_left_out_alongside_the_metrics_timer(tmp_path, monkeypatch):
+    from lib.db.metrics import ActionTimer
+
+    def slow_input(*args):
+        time.sleep(0.3)
+        return "1"
+
+    monkeypatch.setattr(builtins, "input", slow_input)
+    monkeypatch.setattr(profiling, "_compiled_cache", lambda: {"hits": 0, "misses": 0, "entries": 0})
+    watchers = [profiling.ActionProfiler(tmp_path), ActionTimer()]  # built, then started, as in run_interactive
+    for w in watchers:
+        w.start()
+    for w in watchers:
+        w.on_choice("main", "1")
+    input("> ")
+    for w in reversed(watchers):
+        w.close()
+
+    assert builtins.input is slow_input
+    (record,) = [json.loads(p.read_text()) for p in watchers[0].dir.glob("*.alloc.json")]
+    assert record["wall_seconds"] < 0.2
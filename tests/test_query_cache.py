@@ -0,0 +1,21 @@
+import sqlite3
+
+from lib.db.models import Activity
+from lib.db.query_cache import query_cache
+
+
+def test_new_connection_does_not_serve_rows_cached_before_an_outside_commit(Session, engine, db_path):
+    with Session() as session:
+        Activity.create(session, name="Milking")
+        session.commit()
+        assert len(Activity.list_rows(session)) == 1
+
+    outside = sqlite3.connect(str(db_path))
+    outside.execute("INSERT INTO activities (name) VALUES ('Spraying')")
+    outside.commit()
+    outside.close()
+    engine.dispose()  # the next session reads on a fresh connection
+
+    with Session() as session:
+        assert len(Activity.list_rows(session)) == 2
+    query_cache.clear()
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import select
+
+from lib.db import sharding
+from lib.db.models import Cooperative, Farmer
+
+
+@pytest.fixture
+def router(Session, db_path, tmp_path):
+    with Session() as session:
+        Cooperative.create(session, name="North")
+    sharding.split(db_path, tmp_path / "shards")
+    router = sharding.ShardRouter(tmp_path / "shards")
+    yield router
+    router.dispose()
+
+
+def _directory(router):
+    with router.catalog_engine.connect() as conn:
+        return set(conn.execute(select(sharding.farmer_shards.c.farmer_id)).scalars())
+
+
+def test_a_rolled_back_farmer_leaves_the_directory(router):
+    with router(cooperative_id=1) as session:
+        farmer = Farmer(name="F", national_id="ID1")
+        session.add(farmer)
+        session.flush()
+        lost = farmer.id
+        assert lost in _directory(router)
+        session.rollback()
+    assert lost not in _directory(router)
+    with pytest.raises(LookupError):
+        router.shard_for_farmer(lost)
+
+
+def test_only_farmers_that_survive_a_savepoint_stay_registered(router):
+    with router(cooperative_id=1) as session:
+        with pytest.raises(RuntimeError):
+            with session.begin_nested():
+                dropped = Farmer(name="F", national_id="ID1")
+                session.add(dropped)
+                session.flush()
+                raise RuntimeError
+        kept = Farmer.create(session, name="G", national_id="ID2").id
+    assert _directory(router) == {kept}
+    assert router.shard_for_farmer(kept) == router.shard_for_cooperative(1)
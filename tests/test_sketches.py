@@ -0,0 +1,13 @@
+import struct
+
+from lib.db.sketches import KLL
+
+
+def test_kll_bytes_are_big_endian():
+    sketch = KLL(k=8)
+    sketch.update([45.5, 20.0, 3.25])
+
+    data = sketch.to_bytes()
+
+    assert data.endswith(struct.pack(">3d", 45.5, 20.0, 3.25))
+    assert KLL.from_bytes(data).levels == sketch.levels
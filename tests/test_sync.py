@@ -0,0 +1,114 @@
+import gzip
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from lib.db import sync
+from lib.db.models import Buyer, Farmer, ProductType, Sale
+
+from .conftest import open_db
+
+
+@pytest.fixture
+def office_b(tmp_path):
+    engine = open_db(tmp_path / "office_b.db")
+    yield sessionmaker(bind=engine, future=True)
+    engine.dispose()
+
+
+def test_a_failing_apply_keeps_only_the_chunks_already_committed(Session, office_b, peek, tmp_path):
+    with Session() as a:
+        for i in range(5):
+            Farmer.create(a, name=f"Farmer {i}", national_id=f"ID{i}")
+        path = tmp_path / "a-to-b.gz"
+        sync.export_delta(a, str(path), peer="B", office="A")
+
+    with gzip.open(path, "rt") as fh:
+        lines = fh.readlines()
+    lines.insert(5, "{not json\n")  # header, then a broken record after the fourth farmer
+    with gzip.open(path, "wt") as fh:
+        fh.writelines(lines)
+
+    with office_b() as b:
+        with pytest.raises(ValueError):
+            sync.apply_delta(b, str(path), office="B", chunk=3)
+    with office_b() as b:
+        assert sorted(f.national_id for f in Farmer.get_all(b)) == ["ID0", "ID1", "ID2"]
+
+
+def test_a_snapshot_carries_the_time_of_each_row_s_last_change(Session, office_b, tmp_path):
+    with office_b() as b:
+        Farmer.create(b, name="Old name", national_id="ID1")
+    with Session() as a:
+        Farmer.create(a, name="New name", national_id="ID1")
+        sync.export_delta(a, str(tmp_path / "snapshot.gz"), peer="B", office="A")
+    with office_b() as b:
+        report = sync.apply_delta(b, str(tmp_path / "snapshot.gz"), office="B")
+        assert report.applied == {"farmers": 1}
+        assert [f.name for f in Farmer.get_all(b)] == ["New name"]
+
+
+def test_an_edited_sale_replicates_as_the_same_sale(Session, office_b, tmp_path):
+    with Session() as a, office_b() as b:
+        sale = Sale.create(a, Farmer.create(a, name="F", national_id="ID1"), Buyer.create(a, name="B"),
+                           ProductType.create(a, name="Milk"), quantity=2, price=50)
+        sync.export_delta(a, str(tmp_path / "1.gz"), peer="B", office="A")
+        sync.apply_delta(b, str(tmp_path / "1.gz"), office="B")
+        sale.quantity = 3
+        a.commit()
+        sync.export_delta(a, str(tmp_path / "2.gz"), peer="B", office="A")
+        assert sync.apply_delta(b, str(tmp_path / "2.gz"), office="B").applied == {"sales": 1}
+        assert [(s.sync_key, s.quantity, s.total_amount) for s in Sale.get_all(b)] == [(sale.sync_key, 3, 150)]
+
+
+def test_offices_converge_whatever_order_deltas_arrive_in(tmp_path):
+    engines = {name: open_db(tmp_path / f"{name}.db") for name in "ABC"}
+    offices = {name: sessionmaker(bind=e, future=True) for name, e in engines.items()}
+
+    def send(source, peer):
+        path = tmp_path / f"{source}-to-{peer}-{len(list(tmp_path.glob('*.gz')))}.gz"
+        with offices[source]() as s:
+            sync.export_delta(s, str(path), peer=peer, office=source)
+        return path
+
+    def receive(office, path):
+        with offices[office]() as s:
+            return sync.apply_delta(s, str(path), office=office)
+
+    def rename(office, name):
+        with offices[office]() as s:
+            farmer = Farmer.get_all(s)[0]
+            farmer.name = name
+            s.commit()
+
+    def names():
+        out = {}
+        for office, Session in offices.items():
+            with Session() as s:
+                out[office] = [f.name for f in Farmer.get_all(s)]
+        return out
+
+    try:
+        with offices["A"]() as a:
+            Farmer.create(a, name="Original", national_id="ID1")
+        for peer in "BC":
+            receive(peer, send("A", peer))
+        for peer in "AB":
+            send("C", peer)  # first exports are snapshots; start both peers from here
+
+        rename("A", "edited-by-A")
+        rename("C", "edited-by-C")
+        a_to_b, a_to_c = send("A", "B"), send("A", "C")
+        c_to_b, c_to_a = send("C", "B"), send("C", "A")
+
+        receive("B", a_to_b)
+        assert receive("B", c_to_b).applied == {"farmers": 1}
+        receive("A", c_to_a)
+        assert receive("C", a_to_c).skipped == {"farmers": 1}
+        # B relays what it holds; neither peer changes.
+        receive("A", send("B", "A"))
+        receive("C", send("B", "C"))
+        assert names() == {office: ["edited-by-C"] for office in "ABC"}
+    finally:
+        for engine in engines.values():
+            engine.dispose()